@@ -0,0 +1,120 @@
+"""
+Compare looking up words by alphagram and anahash in the lexicon's key
+indexes with the SQL join on the wordplay table, which is what the anagram
+search does for every sub-alphagram it tries.
+
+Each workload is run once on a Wordlist that uses the compiled lexicon and
+once on one that doesn't, and both must find the same words.
+"""
+from itertools import islice
+import time
+
+from solvertools.anagram import _anagram_best_first, _anagram_recursive, subsequences
+from solvertools.letters import alphagram, anahash
+from solvertools.normalize import slugify
+from solvertools.wordlist import Wordlist
+
+
+TEXTS = [
+    "dormitory",
+    "astronomers",
+    "clint eastwood",
+    "the morse code",
+    "national puzzlers league",
+    "a decimal point",
+]
+
+# How many anagrams to take from each search
+SEARCH_RESULTS = 1000
+SEARCH_NODES = 2000
+
+
+def lookup_alphagrams(wordlist, texts):
+    """
+    Look up every sub-alphagram of each text.
+    """
+    index = wordlist.get_alphagram_index()
+    found = []
+    for text in texts:
+        alpha = alphagram(slugify(text))
+        for sub in index.iter_sub_alphagrams(alpha, len(alpha)):
+            found.append(list(wordlist.find_by_alphagram_raw(sub)))
+    return found
+
+
+def lookup_anahashes(wordlist, texts):
+    """
+    Look up the anahashes that the 'interleave' engine tries for each text.
+    """
+    found = []
+    for text in texts:
+        for ahash in subsequences(anahash(alphagram(slugify(text))), 4):
+            found.append(list(wordlist.find_by_anahash_raw(ahash)))
+    return found
+
+
+def search_interleave(wordlist, texts):
+    return [
+        list(
+            islice(
+                _anagram_recursive(alphagram(slugify(text)), 0, wordlist),
+                SEARCH_RESULTS,
+            )
+        )
+        for text in texts
+    ]
+
+
+def search_best_first(wordlist, texts):
+    return [
+        list(
+            _anagram_best_first(
+                alphagram(slugify(text)), 0, wordlist, max_nodes=SEARCH_NODES
+            )
+        )
+        for text in texts
+    ]
+
+
+def same_words(found1, found2):
+    """
+    The two ways of looking up words can list words with the same frequency
+    in different orders, so compare them as sets.
+    """
+    return [sorted(words) for words in found1] == [sorted(words) for words in found2]
+
+
+WORKLOADS = [
+    ("alphagram lookups", lookup_alphagrams),
+    ("anahash lookups", lookup_anahashes),
+    ("interleave search", search_interleave),
+    ("best-first search", search_best_first),
+]
+
+
+def run(name="combined", texts=TEXTS):
+    indexed = Wordlist(name)
+    sql = Wordlist(name, use_lexicon=False)
+    for wordlist in (indexed, sql):
+        # Load the lazily-loaded files before anything is timed
+        wordlist.get_alphagram_index()
+        wordlist.get_key_index("alphagram")
+        wordlist.get_key_index("anahash")
+    assert indexed.get_key_index("alphagram") is not None, "Run build_extras first"
+
+    for label, workload in WORKLOADS:
+        start = time.perf_counter()
+        sql_found = workload(sql, texts)
+        sql_time = time.perf_counter() - start
+        start = time.perf_counter()
+        index_found = workload(indexed, texts)
+        index_time = time.perf_counter() - start
+        assert same_words(sql_found, index_found), "The lookups disagree"
+        print(
+            "%-20s SQLite %8.3f s  index %8.3f s  (%.1fx)"
+            % (label, sql_time, index_time, sql_time / index_time)
+        )
+
+
+if __name__ == "__main__":
+    run()
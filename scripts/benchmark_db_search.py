@@ -0,0 +1,50 @@
+"""
+Run some clues through `search.db_rank` twice, and report how often the
+full-text searches it does were answered by each cache and how long they
+took.
+
+The first pass starts with an empty in-memory cache, but the shared disk
+cache in data/db/search-cache.db is left as it was, so running this twice
+shows what a newly started web server process gets from it.
+"""
+import time
+
+from solvertools import search
+
+
+CLUES = [
+    "US President",
+    "lincoln assassin",
+    "NASA vehicle",
+    "the capital of France",
+    "one of the Great Lakes",
+    "a kind of tree",
+    "US state capital",
+    "the first man on the moon",
+    "a type of cheese",
+    "one of the seven dwarfs",
+    "the largest planet",
+    "a breed of dog",
+]
+
+
+def report():
+    info = search.db_search_cache_info()
+    print("  in memory: %s" % (info['memory'],))
+    print("  on disk:   %s" % (info['disk'],))
+    for source, (count, mean_ms) in info['latency'].items():
+        print("  %-8s %6d searches  %8.3f ms each" % (source, count, mean_ms))
+
+
+def run(clues=CLUES):
+    for label in ("first pass", "second pass"):
+        start = time.perf_counter()
+        for clue in clues:
+            search.db_rank(clue)
+        elapsed = time.perf_counter() - start
+        print("%s: %.3f s" % (label, elapsed))
+        report()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,91 @@
+"""
+Compare two ways of doing each step of the dynamic program in
+Wordlist.search: listing every combination of a partial result with a word,
+sorting them, and keeping the best `count`, or merging them lazily from a
+heap with `_top_k_merge`.
+
+The grep results are cached before anything is timed, so this measures just
+the combining step, at the result counts that the web search page and the
+puzzle tools ask for.
+"""
+from math import log
+import time
+
+from solvertools.regextools import regex_len, regex_slice
+from solvertools.wordlist import WORDS, _top_k_merge
+
+
+PATTERNS = [
+    "..........",
+    "...............",
+    "th...........",
+    "[jkl][def][def][tuv][mno][tuv][tuv]....",
+    "c.......t.....",
+    "e..........y",
+]
+
+
+def sort_step(whole, pairs, count):
+    """
+    The list-and-sort version of the step, as `search` used to do it.
+    """
+    results = list(whole)
+    for partials, words in pairs:
+        for lprob, ltext in partials:
+            for rprob, rtext in words:
+                results.append((lprob + rprob - log(10), ltext + " " + rtext))
+    results.sort(reverse=True)
+    return results[:count]
+
+
+def run_dp(wordlist, pattern, count, step):
+    """
+    Run the dynamic program from `search` on a fixed-length pattern, with
+    the given implementation of each step. Returns the results and the time
+    spent in the steps.
+    """
+    _minlen, maxlen = regex_len(pattern)
+    elapsed = 0.0
+    best_partial_results = [[]]
+    for right_edge in range(1, maxlen + 1):
+        whole = wordlist.grep_top(regex_slice(pattern, 0, right_edge), count)
+        pairs = []
+        for left_edge in range(1, right_edge):
+            if best_partial_results[left_edge]:
+                segment = regex_slice(pattern, left_edge, right_edge)
+                found = wordlist.grep_top(segment, count)
+                if found:
+                    pairs.append((best_partial_results[left_edge], found))
+        start = time.perf_counter()
+        best_partial_results.append(step(whole, pairs, count))
+        elapsed += time.perf_counter() - start
+    return best_partial_results[-1], elapsed
+
+
+def run(wordlist=WORDS, counts=(10, 100, 1000)):
+    for count in counts:
+        print("count=%d" % count)
+        sort_total = merge_total = 0.0
+        for pattern in PATTERNS:
+            # The first run fills the grep cache
+            run_dp(wordlist, pattern, count, _top_k_merge)
+            sorted_results, sort_time = run_dp(wordlist, pattern, count, sort_step)
+            merged_results, merge_time = run_dp(
+                wordlist, pattern, count, _top_k_merge
+            )
+            assert sorted_results == merged_results, "The two steps disagree"
+            sort_total += sort_time
+            merge_total += merge_time
+            print(
+                "  %-45s sort %8.3f s  merge %8.3f s"
+                % (pattern, sort_time, merge_time)
+            )
+        print(
+            "  %-45s sort %8.3f s  merge %8.3f s  (%.1fx)"
+            % ("total", sort_total, merge_total, sort_total / merge_total)
+        )
+        print()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,71 @@
+"""
+Compare the two ways that Wordlist.text_logprob can segment a slug: probing
+every substring, or walking the Lexicon's trie. The test inputs are the past
+Mystery Hunt answers in data/corpora/answers, plus random letters of the
+same lengths, which is the kind of thing that `anagrams` and
+`brute_force_diagonalize` throw at it.
+"""
+import os
+import time
+
+from solvertools.letters import random_letters
+from solvertools.normalize import slugify
+from solvertools.util import corpus_path
+from solvertools.wordlist import WORDS
+
+
+def read_answers():
+    answers = []
+    answer_dir = corpus_path("answers")
+    for filename in sorted(os.listdir(answer_dir)):
+        if not filename.endswith(".txt"):
+            continue
+        with open(os.path.join(answer_dir, filename), encoding="utf-8") as file:
+            for line in file:
+                line = line.strip()
+                if "," in line:
+                    answer, _typ = line.rsplit(",", 1)
+                    slug = slugify(answer)
+                    if slug:
+                        answers.append(slug)
+    return answers
+
+
+def time_segmentation(name, func, slugs):
+    start = time.perf_counter()
+    results = [func(slug) for slug in slugs]
+    elapsed = time.perf_counter() - start
+    print(
+        "%-8s %6d inputs  %8.3f s  %8.1f us/input"
+        % (name, len(slugs), elapsed, elapsed / len(slugs) * 1e6)
+    )
+    return results
+
+
+def run(wordlist=WORDS):
+    lexicon = wordlist.get_lexicon()
+    if lexicon is None:
+        print("%r has no lexicon; run build_extras first." % wordlist)
+        return
+    answers = read_answers()
+    long_answers = [slug for slug in answers if len(slug) >= 20]
+    fakes = [random_letters(len(slug)) for slug in answers]
+    for caption, slugs in [
+        ("Mystery Hunt answers", answers),
+        ("Answers of 20+ letters", long_answers),
+        ("Random letters", fakes),
+    ]:
+        print(caption)
+        # Start the probing path with an empty cache, so it has to do the
+        # lookups it would do on a new input
+        wordlist._word_cache.clear()
+        probed = time_segmentation("probe", wordlist._text_logprob_probe, slugs)
+        walked = time_segmentation(
+            "trie", lambda slug: wordlist._text_logprob_trie(slug, lexicon), slugs
+        )
+        assert probed == walked, "The two segmentations disagree"
+        print()
+
+
+if __name__ == "__main__":
+    run()
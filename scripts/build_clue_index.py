@@ -0,0 +1,5 @@
+from solvertools.search import build_clue_index
+
+
+if __name__ == '__main__':
+    build_clue_index()
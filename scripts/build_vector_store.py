@@ -0,0 +1,5 @@
+from solvertools.conceptnet_numberbatch import write_vector_store
+
+
+if __name__ == '__main__':
+    write_vector_store('english')
@@ -1,22 +1,25 @@
 #!/usr/bin/env python3
 import sys
 import re
-from solvertools.normalize import normalize_wp_link
+from itertools import tee
+from solvertools.normalize import normalize_wp_links
 
 DATE_RE = re.compile(r'(January|February|March|April|May|June|July|August|September|October|November|December) [0-9]+')
 
 
-def output_article(title, targets):
-    if not DATE_RE.match(title):
-        normed = normalize_wp_link(title)
-        desc = ', '.join([title] + targets)
-        normed_pieces = normed.split(' ')
-        if len(normed_pieces) < 4:
-            if '###' not in normed:
-                print(f'{normed}\t{desc}')
+def output_article(title, normed, targets):
+    desc = ', '.join([title] + targets)
+    normed_pieces = normed.split(' ')
+    if len(normed_pieces) < 4:
+        if '###' not in normed:
+            print(f'{normed}\t{desc}')
 
 
-def run():
+def read_articles():
+    """
+    Yield each article title, other than dates, with the list of texts it
+    links to.
+    """
     targets = []
     current = None
     skipping = False
@@ -27,11 +30,11 @@ def run():
             title, text = line.split('\t', 1)
             if current != title:
                 if current is not None and current not in seen_titles:
-                    output_article(current, targets)
-                    output_article(current, targets[:10])
+                    if not DATE_RE.match(current):
+                        yield current, targets
                     seen_titles.add(current)
                 current = title
-                targets.clear()
+                targets = []
                 skipping = False
             
             if 'United States Census' in text:
@@ -42,8 +45,16 @@ def run():
                 skipping = False
 
     if current is not None and current not in seen_titles:
-        output_article(current, targets)
-        output_article(current, targets[:10])
+        if not DATE_RE.match(current):
+            yield current, targets
+
+
+def run():
+    articles, articles_again = tee(read_articles())
+    normed_titles = normalize_wp_links(title for title, _ in articles)
+    for normed, (title, targets) in zip(normed_titles, articles_again):
+        output_article(title, normed, targets)
+        output_article(title, normed, targets[:10])
 
 
 if __name__ == '__main__':
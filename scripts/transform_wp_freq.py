@@ -1,13 +1,14 @@
 import sys
 import re
-from solvertools.normalize import normalize_wp_link
+from itertools import tee
+from solvertools.normalize import normalize_wp_links
 assert sys.getdefaultencoding() == 'utf-8'
 
 
 LINE_RE = re.compile("^ *([0-9]+) (.*)$")
 
 
-def transform():
+def read_links():
     for line in sys.stdin:
         line = line.rstrip()
         match = LINE_RE.match(line)
@@ -15,10 +16,17 @@ def transform():
             freq = int(match.group(1))
             if freq == 1:
                 break
-            name = normalize_wp_link(match.group(2)).strip()
+            yield match.group(2), freq
+
 
-            if name and '###' not in name:
-                print('%s,%d' % (name, freq))
+def transform():
+    links, links_again = tee(read_links())
+    names = normalize_wp_links(link for link, _ in links)
+    for name, (_, freq) in zip(names, links_again):
+        name = name.strip()
+        if name and '###' not in name:
+            print('%s,%d' % (name, freq))
 
 
-transform()
+if __name__ == '__main__':
+    transform()
@@ -8,6 +8,6 @@ setup(
     version=VERSION,
     packages=find_packages(),
     install_requires=[
-        'pandas', 'unidecode', 'natsort', 'flask', 'tqdm'
+        'numpy', 'pandas', 'unidecode', 'natsort', 'flask', 'tqdm'
     ],
 )
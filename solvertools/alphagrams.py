@@ -0,0 +1,239 @@
+"""
+An index of the distinct alphagrams in a wordlist, for finding the ones
+that can be made out of a given multiset of letters. This is the first step
+of every anagram search.
+
+The index is stored as NumPy arrays in `data/wordlists/alphagrams/`, with
+one row per alphagram, in descending order of the frequency of the most
+common word that has it:
+
+- `<name>.counts.npy`: an (N, 26) array of how many times each letter
+  appears
+- `<name>.masks.npy`: a bitmask of which letters appear at all, with bit 0
+  for 'a'
+- `<name>.freqs.npy`: the frequency of the most common word that has it
+- `<name>.lengths.npy`: the number of letters
+
+To find the sub-alphagrams of some letters, we first throw out the rows
+whose masks contain letters we don't have, which is a quick operation on
+one integer per row. The rows that remain are compared letter by letter:
+
+    >>> counts = letter_counts('banana')
+    >>> counts[:3].tolist()
+    [3, 1, 0]
+    >>> bin(letter_mask(counts))
+    '0b10000000000011'
+    >>> counts_to_alphagrams(np.array([counts, letter_counts('nab')]))
+    ['aaabnn', 'abn']
+"""
+import os
+
+import numpy as np
+
+from solvertools.letters import (
+    ASCII_a, counts_to_alphagrams, is_sub_anagram_many, letter_counts
+)
+from solvertools.util import wordlist_path
+
+
+LETTER_BITS = np.left_shift(np.uint32(1), np.arange(26, dtype=np.uint32))
+
+# How many rows to turn back into alphagrams at a time
+CHUNK_SIZE = 1024
+
+
+def alphagram_path(name, part):
+    return wordlist_path("alphagrams/%s.%s.npy" % (name, part))
+
+
+def letter_mask(counts):
+    """
+    Get the bitmask of which letters appear, given letter counts. If
+    `counts` has more than one row, this returns a bitmask for each row.
+    """
+    return np.bitwise_or.reduce(
+        np.where(np.asarray(counts) > 0, LETTER_BITS, np.uint32(0)), axis=-1
+    )
+
+
+def counts_to_alphabytes(counts):
+    """
+    Turn an (N, 26) array of letter counts into a list of the 'alphabytes'
+    form of each row, which is what `letters.alphabytes` would return for
+    its alphagram.
+
+        >>> from solvertools.letters import alphabytes
+        >>> counts = [letter_counts('mississippi'), letter_counts('aaaaaaab')]
+        >>> counts_to_alphabytes(np.array(counts)) == [
+        ...     alphabytes('mississippi'), alphabytes('aaaaaaab')
+        ... ]
+        True
+    """
+    counts = np.asarray(counts)
+    if len(counts) == 0:
+        return []
+    run_lengths = counts.ravel().astype(np.int64)
+    letters = np.repeat(np.tile(np.arange(1, 27), len(counts)), run_lengths)
+    # The rank of each letter among the copies of that letter in its row
+    run_starts = np.cumsum(run_lengths) - run_lengths
+    ranks = np.arange(len(letters)) - np.repeat(run_starts, run_lengths)
+    data = np.where(ranks < 6, letters + (ranks + 2) * 32, letters)
+    data = data.astype(np.uint8).tobytes()
+    ends = np.cumsum(counts.sum(axis=1, dtype=np.int64)).tolist()
+    starts = [0] + ends[:-1]
+    return [data[start:end] for start, end in zip(starts, ends)]
+
+
+class AlphagramIndex:
+    """
+    The memory-mapped alphagram index of a wordlist.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = np.asarray(
+            np.load(alphagram_path(name, "counts"), mmap_mode="r")
+        )
+        self.masks = np.asarray(np.load(alphagram_path(name, "masks"), mmap_mode="r"))
+        self.freqs = np.asarray(np.load(alphagram_path(name, "freqs"), mmap_mode="r"))
+        self.lengths = np.asarray(
+            np.load(alphagram_path(name, "lengths"), mmap_mode="r")
+        )
+        self._max_freqs = None
+
+    @classmethod
+    def from_alphagrams(cls, alphagrams, freqs):
+        """
+        Build the index of a list of alphagrams in memory, instead of
+        loading it from files.
+
+            >>> index = AlphagramIndex.from_alphagrams(
+            ...     ['abt', 'aaabnn', 'abn', 'aenr', 'ab', 'ant'],
+            ...     [50, 40, 30, 20, 10, 5],
+            ... )
+            >>> list(index.iter_sub_alphagrams('aaabnnt', 7))
+            ['abt', 'aaabnn', 'abn', 'ab', 'ant']
+            >>> list(index.iter_sub_alphagrams('aaabnnt', 3, min_length=3))
+            ['abt', 'abn', 'ant']
+            >>> list(index.iter_sub_alphagrams('abn', 4, slack=1))
+            ['abt', 'abn', 'ab', 'ant']
+            >>> index.max_freq_by_length().tolist()
+            [0, 0, 10, 50, 20, 0, 40]
+        """
+        self = cls.__new__(cls)
+        self.name = None
+        self.counts, self.masks, self.freqs, self.lengths = build_alphagram_arrays(
+            alphagrams, freqs
+        )
+        self._max_freqs = None
+        return self
+
+    @staticmethod
+    def exists(name):
+        # This is the last file that write_alphagram_index writes
+        return os.access(alphagram_path(name, "lengths"), os.F_OK)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def sub_alphagram_rows(self, alpha, max_length, slack=0, min_length=1):
+        """
+        Get the rows, in order, of the alphagrams of `min_length` to
+        `max_length` letters that can be made from the letters of `alpha`
+        plus `slack` wildcards.
+        """
+        target = letter_counts(alpha)
+        return self.sub_count_rows(target, max_length, slack, min_length)
+
+    def sub_count_rows(self, target, max_length, slack=0, min_length=1, rows=None):
+        """
+        Like `sub_alphagram_rows`, but the letters are given as an array of
+        counts. If `rows` is given, only those rows are considered.
+        """
+        if rows is None:
+            masks, lengths = self.masks, self.lengths
+        else:
+            masks, lengths = self.masks[rows], self.lengths[rows]
+        outside = masks & ~letter_mask(target)
+        if slack == 0:
+            ok = outside == 0
+        elif slack == 1:
+            # At most one letter we don't have, so at most one bit is set
+            ok = (outside & (outside - np.uint32(1))) == 0
+        else:
+            ok = np.ones(len(lengths), dtype=bool)
+        ok &= (lengths <= max_length) & (lengths >= min_length)
+        if rows is None:
+            rows = np.flatnonzero(ok)
+        else:
+            rows = rows[ok]
+        return rows[is_sub_anagram_many(target, self.counts[rows], slack)]
+
+    def max_freq_by_length(self):
+        """
+        Get an array of the highest frequency of any alphagram of each
+        length, which is 0 for lengths that have none.
+        """
+        if self._max_freqs is None:
+            longest = int(self.lengths.max(initial=0))
+            max_freqs = np.zeros(longest + 1, dtype=np.int64)
+            np.maximum.at(max_freqs, self.lengths, self.freqs)
+            self._max_freqs = max_freqs
+        return self._max_freqs
+
+    def alphagrams(self, rows):
+        """
+        Get the alphagrams in the given rows, as a list of strings.
+        """
+        return counts_to_alphagrams(self.counts[rows])
+
+    def alphabytes(self, rows):
+        """
+        Get the alphagrams in the given rows in their 'alphabytes' form.
+        """
+        return counts_to_alphabytes(self.counts[rows])
+
+    def iter_sub_alphagrams(
+        self, alpha, max_length, slack=0, min_length=1, as_bytes=False
+    ):
+        """
+        Yield the alphagrams that `sub_alphagram_rows` finds, in order, as
+        strings or (if `as_bytes` is true) as alphabytes.
+        """
+        convert = self.alphabytes if as_bytes else self.alphagrams
+        rows = self.sub_alphagram_rows(alpha, max_length, slack, min_length)
+        for start in range(0, len(rows), CHUNK_SIZE):
+            yield from convert(rows[start : start + CHUNK_SIZE])
+
+
+def build_alphagram_arrays(alphagrams, freqs):
+    """
+    Get the counts, masks, freqs, and lengths arrays of the alphagram index
+    for a list of distinct alphagrams, in order, given the frequency of the
+    most common word with each one.
+    """
+    data = "".join(alphagrams).encode("ascii")
+    lengths = np.array([len(alpha) for alpha in alphagrams], dtype=np.int64)
+    letters = np.frombuffer(data, dtype=np.uint8).astype(np.int64) - ASCII_a
+    rows = np.repeat(np.arange(len(alphagrams)), lengths)
+    counts = np.bincount(rows * 26 + letters, minlength=len(alphagrams) * 26)
+    counts = counts.reshape(len(alphagrams), 26).astype(np.uint8)
+    return (
+        counts,
+        letter_mask(counts).astype(np.uint32),
+        np.array(freqs, dtype=np.int64),
+        lengths.astype(np.uint8),
+    )
+
+
+def write_alphagram_index(name, alphagrams, freqs):
+    """
+    Write the alphagram index for a list of distinct alphagrams, in order,
+    given the frequency of the most common word with each one.
+    """
+    os.makedirs(wordlist_path("alphagrams"), exist_ok=True)
+    counts, masks, freqs, lengths = build_alphagram_arrays(alphagrams, freqs)
+    np.save(alphagram_path(name, "counts"), counts)
+    np.save(alphagram_path(name, "masks"), masks)
+    np.save(alphagram_path(name, "freqs"), freqs)
+    np.save(alphagram_path(name, "lengths"), lengths)
@@ -1,18 +1,28 @@
 """
 This anagrammer is pretty cool.
 
-It can probably still be improved, possibly by actually using priority
-queues with a search strategy instead of all these iterator shenanigans.
+There are two search strategies for anagrams of more than one word. The
+'interleave' engine, which is the default, walks a grid of iterators of
+sub-anagrams, which gets to everything eventually without getting stuck
+depth-first. The 'best_first' engine keeps a priority queue of partial
+anagrams, ordered by how good they could possibly turn out to be, so it
+finds anagrams in roughly descending order of cromulence. It needs the
+wordlist's alphagram index, and falls back on 'interleave' without it.
 """
-from solvertools.wordlist import WORDS
+from solvertools.wordlist import WORDS, Wordlist
 from solvertools.letters import (
-    alphagram, alphabytes, alphabytes_to_alphagram, anagram_diff, anahash,
-    anagram_cost
+    alphagram, anahash, anagram_cost_many, anagram_diff_many,
+    counts_to_alphagrams, letter_counts, letter_counts_many
 )
 from solvertools.normalize import slugify
+from math import log
+import heapq
 import itertools
+import multiprocessing
 import time
 
+import numpy as np
+
 
 letters_to_try = 'etaoinshrdlucympbgfvxwkjzq'
 
@@ -58,29 +68,64 @@ def eval_anagrams(gen, wordlist, count, quiet=False, time_limit=None):
     The results are printed as they are encountered, and at the end, the top
     `count` are returned from best to worst.
     """
-    start_time = time.monotonic()
     results = []
-    used = set()
     best_logprob = -1000
-    for slug in gen:
-        logprob, text = wordlist.text_logprob(slug)
-        textblob = ''.join(sorted(text.split(' ')))
-        if textblob not in used:
+    for found in _scored_batches(gen, wordlist, count, time_limit):
+        for cromulence, logprob, text in found:
             if not quiet:
                 if logprob > best_logprob:
                     best_logprob = logprob
                     print("%4.4f\t%s" % (logprob, text))
-            cromulence = wordlist.logprob_to_cromulence(logprob, len(slug))
             results.append((cromulence, logprob, text))
-            if len(results) >= count * 5:
-                break
-            if time_limit and (time.monotonic() - start_time > time_limit):
-                break
-            used.add(textblob)
     results.sort(reverse=True)
     return [(cromulence, text) for (cromulence, logprob, text) in results[:count]]
 
 
+def _scored_batches(gen, wordlist, count, time_limit=None):
+    """
+    Score the anagrams from `gen` a batch at a time, yielding a list of the
+    (cromulence, logprob, text) of the new results in each batch, which may
+    be empty. This is the part of `eval_anagrams` that's shared with
+    `stream_anagrams`.
+    """
+    start_time = time.monotonic()
+    used = set()
+    n_results = 0
+    for batch in _batches(gen, start_time, time_limit):
+        found = []
+        for slug, (logprob, text) in zip(batch, wordlist.text_logprob_many(batch)):
+            textblob = ''.join(sorted(text.split(' ')))
+            if textblob not in used:
+                cromulence = wordlist.logprob_to_cromulence(logprob, len(slug))
+                found.append((cromulence, logprob, text))
+                n_results += 1
+                if n_results >= count * 5:
+                    break
+                used.add(textblob)
+        yield found
+        if n_results >= count * 5:
+            return
+        if time_limit and (time.monotonic() - start_time > time_limit):
+            return
+
+
+def _batches(gen, start_time, time_limit=None, size=32):
+    """
+    Group the anagrams from `gen` into lists, so they can be scored together.
+    A batch ends early when the time limit is reached.
+    """
+    batch = []
+    for item in gen:
+        batch.append(item)
+        if len(batch) >= size or (
+            time_limit and (time.monotonic() - start_time > time_limit)
+        ):
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 def anagram_single(text, wildcards=0, wordlist=WORDS, count=10, quiet=True):
     """
     Search for anagrams that appear directly in the wordlist.
@@ -115,13 +160,27 @@ def _anagram_single(alpha, wildcards, wordlist):
                 yield from _anagram_single(newalpha, 0, wordlist)
 
 
-def adjusted_anagram_cost(item):
+def _wildcards_fit(wildcards_used, wildcards):
+    """
+    Given an array of how many wildcards each sub-anagram uses, find which
+    ones are allowed. When wildcards are letters to leave out, a sub-anagram
+    can't use any.
+    """
+    if wildcards < 0:
+        return wildcards_used == 0
+    return wildcards_used <= wildcards
+
+
+def adjusted_anagram_costs(remaining, wildcards_remaining, indices):
     """
     Sorts the sub-anagrams we should try by their likeliness to yield good
-    anagrams.
+    anagrams, given the counts of the letters each one leaves, the
+    wildcards it leaves, and its index in the list of sub-anagrams.
     """
-    used, letters, wildcards, index = item
-    return anagram_cost(letters) / (max(0, wildcards) + 1) * (index + 2)
+    return (
+        anagram_cost_many(remaining) / (np.maximum(0, wildcards_remaining) + 1)
+        * (indices + 2)
+    )
 
 
 def anagram_double(text, wildcards=0, wordlist=WORDS, count=100, quiet=False):
@@ -143,18 +202,19 @@ def _anagram_double(alpha, wildcards, wordlist):
 def _anagram_double_2(alpha, wildcards, wordlist):
     if len(alpha) >= 25:
         return
-    sub_anas = [
-        (sub, adiff, wildcards - wildcards_used, index)
-        for index, sub in enumerate(wordlist.find_sub_alphagrams(alpha, wildcard=(wildcards > 0)))
-        for adiff, wildcards_used in [anagram_diff(alpha, alphabytes_to_alphagram(sub))]
-        if wildcards >= wildcards_used or (wildcards < 0 and wildcards_used == 0)
-    ]
-
-    # sub_anas.sort(key=adjusted_anagram_cost)
-    for abytes, alpha2, wildcards_remaining, index in sub_anas:
-        alpha1 = alphabytes_to_alphagram(abytes)
+    subs = list(wordlist.find_sub_alphagrams(alpha, wildcard=(wildcards > 0)))
+    if not subs:
+        return
+    counts = letter_counts_many(subs)
+    remaining, wildcards_used = anagram_diff_many(letter_counts(alpha), counts)
+    fits = _wildcards_fit(wildcards_used, wildcards)
+    alpha1s = counts_to_alphagrams(counts[fits])
+    alpha2s = counts_to_alphagrams(remaining[fits])
+    wildcards_remaining = (wildcards - wildcards_used[fits]).tolist()
+
+    for alpha1, alpha2, wildcards_left in zip(alpha1s, alpha2s, wildcards_remaining):
         for slug1 in _anagram_single(alpha1, 0, wordlist):
-            yield _anagram_double_piece(slug1, alpha2, wildcards_remaining, wordlist)
+            yield _anagram_double_piece(slug1, alpha2, wildcards_left, wordlist)
 
 
 def _anagram_double_piece(slug1, alpha2, wildcards_remaining, wordlist):
@@ -162,15 +222,90 @@ def _anagram_double_piece(slug1, alpha2, wildcards_remaining, wordlist):
         yield slug1 + slug2
 
 
-def anagrams(text, wildcards=0, wordlist=WORDS, count=100, quiet=False, time_limit=None):
+ENGINES = ('best_first', 'interleave')
+
+
+def anagrams(text, wildcards=0, wordlist=WORDS, count=100, quiet=False,
+             time_limit=None, max_nodes=None, engine='interleave',
+             processes=None):
     """
     Search for anagrams that are made of an arbitrary number of pieces from the
     wordlist.
+
+    The search stops after `time_limit` seconds, if given. The 'best_first'
+    engine can also be limited to expanding `max_nodes` partial anagrams,
+    which unlike a time limit gives the same results on every run.
+
+    If `processes` is more than 1, the choices of the first word are split
+    among that many worker processes (see `_anagram_parallel`). By default,
+    the search runs in this process.
     """
+    gen = _search_anagrams(
+        text, wildcards, wordlist, count, time_limit, max_nodes, engine, processes
+    )
     return eval_anagrams(
-        _anagram_recursive(alphagram(slugify(text)), wildcards, wordlist),
-        wordlist, count, quiet=quiet, time_limit=time_limit
+        gen, wordlist, count, quiet=quiet, time_limit=time_limit
+    )
+
+
+def stream_anagrams(text, wildcards=0, wordlist=WORDS, count=100,
+                    time_limit=None, max_nodes=None, engine='interleave',
+                    processes=None):
+    """
+    Search for anagrams like `anagrams` does, but yield results while the
+    search is going, instead of returning them at the end.
+
+    Each time a batch of anagrams has been scored, this yields a list of the
+    (cromulence, text) results from that batch that are among the top
+    `count` so far. The list is often empty, which gives the caller a chance
+    to give up. Closing the generator stops the search.
+    """
+    gen = _search_anagrams(
+        text, wildcards, wordlist, count, time_limit, max_nodes, engine, processes
     )
+    top = []
+    try:
+        for found in _scored_batches(gen, wordlist, count, time_limit):
+            improved = []
+            for cromulence, logprob, text in found:
+                result = (cromulence, text)
+                if len(top) < count:
+                    heapq.heappush(top, result)
+                elif result > top[0]:
+                    heapq.heapreplace(top, result)
+                else:
+                    continue
+                improved.append(result)
+            yield improved
+    finally:
+        gen.close()
+
+
+def _search_anagrams(text, wildcards, wordlist, count, time_limit, max_nodes,
+                     engine, processes):
+    """
+    Start the search for `anagrams` or `stream_anagrams`, returning a
+    generator of the slugs it finds.
+    """
+    if engine not in ENGINES:
+        raise ValueError(
+            "Unknown anagram engine %r; choose from %s"
+            % (engine, ', '.join(ENGINES))
+        )
+    alpha = alphagram(slugify(text))
+    if engine == 'best_first' and wordlist.get_alphagram_index() is None:
+        engine = 'interleave'
+    if processes is not None and processes > 1:
+        return _anagram_parallel(
+            alpha, wildcards, wordlist, processes, engine, time_limit=time_limit,
+            max_nodes=max_nodes, limit=count * 5
+        )
+    elif engine == 'best_first':
+        return _anagram_best_first(
+            alpha, wildcards, wordlist, time_limit=time_limit, max_nodes=max_nodes
+        )
+    else:
+        return _anagram_recursive(alpha, wildcards, wordlist)
 
 
 def _anagram_recursive(alpha, wildcards, wordlist):
@@ -193,17 +328,25 @@ def _anagram_recursive_pieces(alpha, wildcards, wordlist):
 
 
 def _anagram_recursive_piece_1(alpha, wildcards, wordlist, ahash):
-    sub_anas = [
-        (sub, adiff, wildcards - wildcards_used, index)
-        for index, sub in enumerate(wordlist.find_by_anahash_raw(ahash))
-        for adiff, wildcards_used in [anagram_diff(alpha, alphagram(sub))]
-        if wildcards >= wildcards_used or (wildcards < 0 and wildcards_used == 0)
-    ]
-    sub_anas.sort(key=adjusted_anagram_cost)
+    subs = list(wordlist.find_by_anahash_raw(ahash))
+    if not subs:
+        return
+    remaining, wildcards_used = anagram_diff_many(
+        letter_counts(alpha), letter_counts_many(subs)
+    )
+    indices = np.flatnonzero(_wildcards_fit(wildcards_used, wildcards))
+    remaining = remaining[indices]
+    wildcards_remaining = wildcards - wildcards_used[indices]
+    order = np.argsort(
+        adjusted_anagram_costs(remaining, wildcards_remaining, indices), kind='stable'
+    )
+    alpha2s = counts_to_alphagrams(remaining[order])
 
-    for slug1, alpha2, wildcards_remaining, index in sub_anas:
-        alpha1 = alphagram(slug1)
-        yield _anagram_recursive_piece_2(slug1, alpha2, wildcards_remaining, wordlist)
+    for pos, alpha2 in zip(order.tolist(), alpha2s):
+        slug1 = subs[indices[pos]]
+        yield _anagram_recursive_piece_2(
+            slug1, alpha2, int(wildcards_remaining[pos]), wordlist
+        )
 
 
 def _anagram_recursive_piece_2(slug1, alpha, wildcards, wordlist):
@@ -219,3 +362,399 @@ def subsequences(seq, depth=None):
         for combo in itertools.combinations(seq, seq_len):
             yield ''.join(combo)
 
+
+# Kinds of entries in the best-first search's priority queue
+EXPAND, CHILDREN, GOAL = 0, 1, 2
+
+# How much the upper bound on the rest of an anagram counts in the
+# priority of a partial anagram. The bound is negative, so weighting it more
+# makes partial anagrams with many letters left look worse, and the search
+# goes deeper sooner. With a weight of 1 this is plain A*, which finds
+# anagrams in exact order of the log probability of their words, but on
+# long inputs it runs out of time before finishing any.
+BOUND_WEIGHT = 2.0
+
+# Try every order of the words of an anagram, up to this many words
+MAX_PERMUTED_WORDS = 5
+
+
+def _completion_bounds(index, max_letters, logtotal):
+    """
+    Get an array of upper bounds on the log probability of any sequence of
+    words with a total of `n` letters, for `n` up to `max_letters`. This is
+    the 'admissible heuristic' of the best-first search: the words can't do
+    better than the most common word of each length.
+    """
+    max_freqs = index.max_freq_by_length()
+    top = np.full(len(max_freqs), -np.inf)
+    top[max_freqs > 0] = np.log(max_freqs[max_freqs > 0]) - logtotal
+    log10 = log(10)
+    bounds = np.full(max_letters + 1, -np.inf)
+    bounds[0] = 0.0
+    for n in range(1, max_letters + 1):
+        for length in range(1, min(n, len(top) - 1) + 1):
+            if n == length:
+                bound = top[length]
+            else:
+                bound = top[length] + bounds[n - length] - log10
+            if bound > bounds[n]:
+                bounds[n] = bound
+    return bounds
+
+
+def _anagram_best_first(alpha, wildcards, wordlist, time_limit=None,
+                        max_nodes=None, first_words=None):
+    """
+    Search for anagrams of an alphagram best-first, yielding their slugs.
+
+    A partial anagram is a multiset of words, represented by their rows in
+    the alphagram index. To count each multiset once, the rows of a partial
+    anagram never decrease. Its priority is its log probability so far,
+    plus an upper bound on what the rest of the letters can add (see
+    `_completion_bounds`) times BOUND_WEIGHT, so complete anagrams come out
+    in roughly descending order of the log probability of their words.
+
+    The index only knows the frequency of the most common word with each
+    alphagram. When a complete anagram comes out, it's put back in the
+    queue with the next choices of words for its alphagrams, at a priority
+    that's lower by how much less common those words are. So every word
+    with an alphagram eventually comes out, in order.
+
+    A positive number of wildcards is the number of letters that must be
+    added, and a negative number is the number of letters to leave out.
+
+    Expanding a partial anagram finds all the alphagrams that fit in its
+    remaining letters, at once, with NumPy. Rather than pushing all of them
+    onto the queue, we sort them and push one entry that stands for the
+    best one not yet taken.
+
+    `first_words` can be a (start, stop) range of the possible first words,
+    in order of priority, to search only the anagrams that start with those.
+    """
+    index = wordlist.get_alphagram_index()
+    start_time = time.monotonic()
+    logtotal = wordlist.get_logtotal()
+    log10 = log(10)
+    wilds = max(wildcards, 0)
+    drops = max(-wildcards, 0)
+    if len(alpha) - drops <= 0:
+        return
+    bounds = _completion_bounds(index, len(alpha) + wilds, logtotal)
+    best_words = {}
+
+    # A state is (remaining letter counts, number of remaining letters,
+    # wildcards left, rows so far, log probability so far, rows that might
+    # come next)
+    root = (letter_counts(alpha), len(alpha), wilds, (), 0.0, None)
+    tiebreak = itertools.count()
+    if first_words is None:
+        heap = [(0.0, next(tiebreak), EXPAND, root)]
+    else:
+        # Start from the root's children in the given range
+        children = _expand(root, index, bounds, drops, logtotal, log10)
+        span = slice(*first_words)
+        children = (
+            children[0][span], children[1][span], children[2][span], children[3]
+        )
+        heap = []
+        if len(children[0]):
+            heap.append(
+                (-children[1][0], next(tiebreak), CHILDREN, (root, children, 0))
+            )
+    nodes = 0
+    while heap:
+        if time_limit and (time.monotonic() - start_time > time_limit):
+            return
+        neg_priority, _, kind, payload = heapq.heappop(heap)
+        if kind == GOAL:
+            rows, choice, last = payload
+            words = [_alphagram_words(row, index, wordlist, best_words) for row in rows]
+            yield _best_arrangement(
+                [words[i][pick][0] for i, pick in enumerate(choice)], wordlist
+            )
+            # Try the next word for each alphagram from `last` on, so that
+            # each combination of words is reached exactly once
+            for i in range(last, len(rows)):
+                pick = choice[i] + 1
+                if pick < len(words[i]):
+                    cost = words[i][choice[i]][1] - words[i][pick][1]
+                    heapq.heappush(heap, (
+                        neg_priority + cost, next(tiebreak), GOAL,
+                        (rows, choice[:i] + (pick,) + choice[i + 1:], i)
+                    ))
+        elif kind == CHILDREN:
+            parent, children, pos = payload
+            if pos + 1 < len(children[0]):
+                heapq.heappush(heap, (
+                    -children[1][pos + 1], next(tiebreak), CHILDREN,
+                    (parent, children, pos + 1)
+                ))
+            child, is_goal = _make_child(parent, children, pos, index, drops)
+            if is_goal:
+                rows = child[3]
+                heapq.heappush(heap, (
+                    neg_priority, next(tiebreak), GOAL, (rows, (0,) * len(rows), 0)
+                ))
+            else:
+                heapq.heappush(heap, (neg_priority, next(tiebreak), EXPAND, child))
+        else:
+            if max_nodes is not None and nodes >= max_nodes:
+                return
+            nodes += 1
+            children = _expand(payload, index, bounds, drops, logtotal, log10)
+            if len(children[0]):
+                heapq.heappush(heap, (
+                    -children[1][0], next(tiebreak), CHILDREN, (payload, children, 0)
+                ))
+
+
+def _expand(state, index, bounds, drops, logtotal, log10):
+    """
+    Find the words that can be added to a partial anagram. Returns arrays
+    of their rows, priorities, and log probabilities, sorted by descending
+    priority, and an array of all the rows that fit in the letters.
+    """
+    remaining, n_remaining, wilds, rows, logprob, pool = state
+    candidates = index.sub_count_rows(
+        remaining, n_remaining - drops + wilds, slack=wilds, rows=pool
+    )
+    counts = index.counts[candidates].astype(np.int16)
+    lengths = index.lengths[candidates].astype(np.int64)
+    wilds_used = np.maximum(counts - remaining, 0).sum(axis=1)
+    new_remaining = n_remaining - (lengths - wilds_used)
+    new_wilds = wilds - wilds_used
+    logprobs = logprob + np.log(index.freqs[candidates]) - logtotal
+    if rows:
+        logprobs -= log10
+
+    # Letters still to be covered by words, counting the wildcards
+    to_cover = new_remaining + new_wilds - drops
+    priorities = logprobs + BOUND_WEIGHT * (
+        bounds[to_cover] - np.where(to_cover > 0, log10, 0.0)
+    )
+    # Wildcards can't make up a word on their own
+    viable = ~((new_remaining == 0) & (new_wilds > 0))
+    order = np.argsort(-priorities[viable], kind='stable')
+    return (
+        candidates[viable][order], priorities[viable][order],
+        logprobs[viable][order], candidates
+    )
+
+
+def _make_child(parent, children, pos, index, drops):
+    """
+    Build the state for one of the children that `_expand` found, and say
+    whether it's a complete anagram.
+    """
+    remaining, n_remaining, wilds, rows, logprob, pool = parent
+    row = int(children[0][pos])
+    counts = index.counts[row].astype(np.int16)
+    wilds_used = int(np.maximum(counts - remaining, 0).sum())
+    new_remaining = np.maximum(remaining.astype(np.int16) - counts, 0)
+    n_new = n_remaining - (int(index.lengths[row]) - wilds_used)
+    # The words that can come next are a subset of the words that could
+    # come here, and don't come before this one
+    child = (
+        new_remaining.astype(np.uint8), n_new, wilds - wilds_used,
+        rows + (row,), float(children[2][pos]), children[3][children[3] >= row]
+    )
+    is_goal = wilds == wilds_used and n_new == drops
+    return child, is_goal
+
+
+def _alphagram_words(row, index, wordlist, found_words):
+    """
+    Get the words with the alphagram in a row of the index, most common
+    first, as a list of (slug, log frequency). `found_words` remembers them
+    for the rest of the search.
+    """
+    if row not in found_words:
+        alpha = index.alphagrams([row])[0]
+        words = []
+        for slug in wordlist.find_by_alphagram_raw(alpha):
+            found = wordlist.lookup_slug(slug)
+            if found is not None:
+                words.append((slug, log(found[0])))
+        words.sort(key=lambda word: -word[1])
+        found_words[row] = words or [(alpha, 0.0)]
+    return found_words[row]
+
+
+def _best_arrangement(words, wordlist):
+    """
+    Turn a multiset of words into the slug of an anagram, putting them in
+    the order that the wordlist likes best.
+    """
+    if len(words) <= MAX_PERMUTED_WORDS:
+        orders = list(dict.fromkeys(itertools.permutations(words)))
+    else:
+        orders = [tuple(words)]
+    slugs = [''.join(order) for order in orders]
+    scores = wordlist.text_logprob_many(slugs)
+    best = max(range(len(slugs)), key=lambda i: scores[i][0])
+    return slugs[best]
+
+
+# The parallel search gives each worker process about this many tasks, so
+# that the workers that finish early can pick up more
+TASKS_PER_PROCESS = 4
+
+# The number of partial anagrams that each task of a parallel best-first
+# search can expand, if `max_nodes` isn't given
+TASK_MAX_NODES = 1000
+
+# How long past its time limit a parallel search waits for the tasks that
+# are still running to report back
+GRACE_TIME = 0.25
+
+_pools = {}
+_worker_wordlist = None
+
+
+def _init_worker(name):
+    """
+    Set up a worker process for parallel anagramming, with its own Wordlist.
+    Its memory-mapped files are shared with the other processes through the
+    OS's page cache.
+    """
+    global _worker_wordlist
+    _worker_wordlist = Wordlist(name)
+
+
+def get_anagram_pool(name, processes):
+    """
+    Get a pool of worker processes that can anagram using the wordlist
+    with the given name. Pools are started on first use and kept around, so
+    later searches don't pay for starting them, until a search has to
+    abandon some of its tasks (see `close_anagram_pool`).
+
+    The workers are spawned rather than forked, so they don't share the
+    SQLite connections of this process.
+    """
+    key = (name, processes)
+    if key not in _pools:
+        context = multiprocessing.get_context('spawn')
+        _pools[key] = context.Pool(
+            processes, initializer=_init_worker, initargs=(name,)
+        )
+    return _pools[key]
+
+
+def close_anagram_pool(name, processes):
+    """
+    Stop the workers of a pool, if it's running. The tasks of a pool can't
+    be cancelled one at a time, so this is how a search that ends early
+    keeps its unfinished tasks from using the CPU in the background.
+    """
+    pool = _pools.pop((name, processes), None)
+    if pool is not None:
+        pool.terminate()
+
+
+def _first_word_count(alpha, wildcards, wordlist):
+    """
+    Count the possible first words of a best-first search.
+    """
+    index = wordlist.get_alphagram_index()
+    logtotal = wordlist.get_logtotal()
+    wilds = max(wildcards, 0)
+    drops = max(-wildcards, 0)
+    if len(alpha) - drops <= 0:
+        return 0
+    bounds = _completion_bounds(index, len(alpha) + wilds, logtotal)
+    root = (letter_counts(alpha), len(alpha), wilds, (), 0.0, None)
+    return len(_expand(root, index, bounds, drops, logtotal, log(10))[0])
+
+
+def _take(gen, limit, deadline):
+    """
+    Get up to `limit` items from `gen`, stopping at the `deadline` (in
+    seconds since the epoch) if there is one.
+    """
+    found = []
+    for item in gen:
+        found.append(item)
+        if len(found) >= limit or (deadline and time.time() > deadline):
+            break
+    return found
+
+
+def _anagram_task(task):
+    """
+    Run one part of a parallel anagram search in a worker process. Returns a
+    list of slugs.
+    """
+    engine, alpha, wildcards, part, deadline, task_time, max_nodes, limit = task
+    wordlist = _worker_wordlist
+    time_limit = None
+    if deadline:
+        time_limit = min(deadline - time.time(), task_time)
+        if time_limit <= 0:
+            return []
+        deadline = time.time() + time_limit
+    if engine == 'best_first':
+        gen = _anagram_best_first(
+            alpha, wildcards, wordlist, time_limit=time_limit,
+            max_nodes=max_nodes or TASK_MAX_NODES, first_words=part
+        )
+    elif part is None:
+        gen = _anagram_double(alpha, wildcards, wordlist)
+    else:
+        gen = interleave(_anagram_recursive_piece_1(alpha, wildcards, wordlist, part))
+    return _take(gen, limit, deadline)
+
+
+def _anagram_parallel(alpha, wildcards, wordlist, processes, engine,
+                      time_limit=None, max_nodes=None, limit=500):
+    """
+    Search for anagrams in a pool of worker processes, yielding their slugs
+    as each part of the search finishes.
+
+    The search is split on the choice of the first word. For the
+    'best_first' engine, each task searches a range of the possible first
+    words, in order of priority, expanding up to `max_nodes` partial
+    anagrams. For the 'interleave' engine, there's a task for the two-word
+    anagrams and one for each anahash that `_anagram_recursive_pieces`
+    would try. Each task returns at most `limit` anagrams.
+
+    With a `time_limit`, each task gets its share of the time that the
+    workers have, so that the tasks report back before the time is up. If
+    the time runs out, or the caller closes this generator, while tasks are
+    still running, the pool is shut down.
+    """
+    deadline = time.time() + time_limit if time_limit else None
+    if engine == 'best_first':
+        n_first = _first_word_count(alpha, wildcards, wordlist)
+        step = max(1, -(-n_first // (processes * TASKS_PER_PROCESS)))
+        parts = [
+            (start, min(start + step, n_first)) for start in range(0, n_first, step)
+        ]
+    elif len(alpha) <= 10:
+        parts = [None]
+    else:
+        parts = [None] + list(subsequences(anahash(alpha), 4))
+    task_time = None
+    if time_limit:
+        task_time = time_limit * min(processes, len(parts)) / len(parts)
+    tasks = [
+        (engine, alpha, wildcards, part, deadline, task_time, max_nodes, limit)
+        for part in parts
+    ]
+    results = get_anagram_pool(wordlist.name, processes).imap_unordered(
+        _anagram_task, tasks
+    )
+    finished = 0
+    try:
+        for _ in tasks:
+            timeout = None
+            if deadline:
+                timeout = max(deadline + GRACE_TIME - time.time(), 0)
+            try:
+                found = results.next(timeout)
+            except multiprocessing.TimeoutError:
+                return
+            finished += 1
+            yield from found
+    finally:
+        if finished < len(tasks):
+            close_anagram_pool(wordlist.name, processes)
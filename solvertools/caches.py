@@ -0,0 +1,426 @@
+"""
+Bounded caches for the things we look up over and over, such as the
+frequencies of words. Solvertools runs in long-lived web server processes,
+so a cache that grows forever will eventually eat all the memory it can.
+
+There are two eviction policies to choose from:
+
+- 'lru' evicts the least recently used entry.
+- 'arc' is the Adaptive Replacement Cache of Megiddo and Modha (2003). It
+  balances entries that have been used once recently against entries that
+  have been used more than once, which keeps a burst of one-off lookups
+  from flushing out the words that keep coming up.
+
+`SQLiteCache` keeps bytes in a small SQLite database instead, so that all
+the processes of a web server can share what any of them has looked up.
+
+Every cache counts its hits, misses, and evictions:
+
+    >>> cache = make_cache('lru', 2)
+    >>> cache.put('a', 1)
+    >>> cache.put('b', 2)
+    >>> cache.get('a')
+    1
+    >>> cache.put('c', 3)
+    >>> cache.get('b') is None
+    True
+    >>> cache.info()
+    CacheInfo(hits=1, misses=1, evictions=1, maxsize=2, currsize=2)
+"""
+from collections import OrderedDict, namedtuple
+import sqlite3
+import threading
+import time
+
+
+CacheInfo = namedtuple(
+    "CacheInfo", ["hits", "misses", "evictions", "maxsize", "currsize"]
+)
+
+
+class LRUCache:
+    """
+    A cache that holds up to `maxsize` entries, evicting the least recently
+    used one when it's full.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self):
+        self.data.clear()
+
+    def info(self):
+        return CacheInfo(
+            self.hits, self.misses, self.evictions, self.maxsize, len(self.data)
+        )
+
+
+class ARCCache:
+    """
+    An Adaptive Replacement Cache that holds up to `maxsize` entries.
+
+    Entries that have been seen once live in `recent`, and entries that have
+    been seen again live in `frequent`. The keys of entries that were
+    recently evicted from each are remembered in the 'ghost' lists
+    `recent_ghosts` and `frequent_ghosts`. A miss that hits a ghost list
+    tells us which side should have been bigger, and `target` -- the size
+    we're aiming for `recent` to have -- moves accordingly.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.target = 0
+        self.recent = OrderedDict()
+        self.frequent = OrderedDict()
+        self.recent_ghosts = OrderedDict()
+        self.frequent_ghosts = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        if key in self.recent:
+            value = self.recent.pop(key)
+            self.frequent[key] = value
+        elif key in self.frequent:
+            value = self.frequent[key]
+            self.frequent.move_to_end(key)
+        else:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def _replace(self, key):
+        """
+        Evict an entry from `recent` or `frequent`, depending on how big
+        `recent` is compared to its target size.
+        """
+        if not self.recent and not self.frequent:
+            return
+        if self.recent and (
+            len(self.recent) > self.target
+            or (key in self.frequent_ghosts and len(self.recent) == self.target)
+            or not self.frequent
+        ):
+            old_key, _ = self.recent.popitem(last=False)
+            self.recent_ghosts[old_key] = None
+        else:
+            old_key, _ = self.frequent.popitem(last=False)
+            self.frequent_ghosts[old_key] = None
+        self.evictions += 1
+
+    def put(self, key, value):
+        size = self.maxsize
+        if size <= 0:
+            return
+        if key in self.recent:
+            del self.recent[key]
+            self.frequent[key] = value
+        elif key in self.frequent:
+            self.frequent[key] = value
+            self.frequent.move_to_end(key)
+        elif key in self.recent_ghosts:
+            step = max(len(self.frequent_ghosts) // len(self.recent_ghosts), 1)
+            self.target = min(size, self.target + step)
+            self._replace(key)
+            del self.recent_ghosts[key]
+            self.frequent[key] = value
+        elif key in self.frequent_ghosts:
+            step = max(len(self.recent_ghosts) // len(self.frequent_ghosts), 1)
+            self.target = max(0, self.target - step)
+            self._replace(key)
+            del self.frequent_ghosts[key]
+            self.frequent[key] = value
+        else:
+            recent_side = len(self.recent) + len(self.recent_ghosts)
+            total = recent_side + len(self.frequent) + len(self.frequent_ghosts)
+            if recent_side >= size:
+                if len(self.recent) < size:
+                    self.recent_ghosts.popitem(last=False)
+                    self._replace(key)
+                else:
+                    self.recent.popitem(last=False)
+                    self.evictions += 1
+            elif total >= size:
+                if total >= 2 * size:
+                    self.frequent_ghosts.popitem(last=False)
+                self._replace(key)
+            self.recent[key] = value
+
+    def __contains__(self, key):
+        return key in self.recent or key in self.frequent
+
+    def __len__(self):
+        return len(self.recent) + len(self.frequent)
+
+    def clear(self):
+        self.target = 0
+        for part in (
+            self.recent,
+            self.frequent,
+            self.recent_ghosts,
+            self.frequent_ghosts,
+        ):
+            part.clear()
+
+    def info(self):
+        return CacheInfo(
+            self.hits, self.misses, self.evictions, self.maxsize, len(self)
+        )
+
+
+CACHE_POLICIES = {"lru": LRUCache, "arc": ARCCache}
+
+
+def make_cache(policy, maxsize):
+    """
+    Make a cache with the given eviction policy, 'lru' or 'arc'.
+    """
+    try:
+        cache_class = CACHE_POLICIES[policy]
+    except KeyError:
+        raise ValueError(
+            "Unknown cache policy %r; choose from %s"
+            % (policy, ", ".join(sorted(CACHE_POLICIES)))
+        )
+    return cache_class(maxsize)
+
+
+class LookupCache:
+    """
+    A cache for lookups that can come up empty, with separate budgets for
+    positive entries (things that were found) and negative entries (things
+    that were looked up and found to be None). Negative entries are cheap to
+    collect in large numbers, and we don't want them to push out the
+    positive ones.
+    """
+
+    def __init__(self, policy="lru", positive_size=100000, negative_size=100000):
+        self.positive = make_cache(policy, positive_size)
+        self.negative = make_cache(policy, negative_size)
+
+    def get(self, key, default=None):
+        """
+        Get a cached value, which may be None for a negative entry, or
+        `default` if the key isn't cached.
+        """
+        # Checking membership first keeps the miss counts honest: a key is
+        # only a miss if it's in neither part.
+        if key in self.negative:
+            return self.negative.get(key)
+        elif key in self.positive:
+            return self.positive.get(key)
+        self.positive.misses += 1
+        return default
+
+    def put(self, key, value):
+        if value is None:
+            self.negative.put(key, None)
+        else:
+            self.positive.put(key, value)
+
+    def __contains__(self, key):
+        return key in self.positive or key in self.negative
+
+    def __len__(self):
+        return len(self.positive) + len(self.negative)
+
+    def clear(self):
+        self.positive.clear()
+        self.negative.clear()
+
+    def info(self):
+        """
+        Get a dictionary of CacheInfo for the 'positive' and 'negative'
+        parts of the cache. Misses are counted on the positive part.
+        """
+        return {"positive": self.positive.info(), "negative": self.negative.info()}
+
+
+# How many cache hits a SQLiteCache remembers before writing down when
+# they happened
+SQLITE_TOUCH_BATCH_SIZE = 100
+
+
+class SQLiteCache:
+    """
+    A cache of bytes, keyed by strings, in a SQLite database at `path` that
+    can be shared by many processes. It holds up to about `maxsize` entries:
+    when it's full, the least recently used tenth of them are evicted.
+
+    Hits are only written back to the database in batches of
+    `touch_batch_size`, and the number of entries is only counted again when
+    this process's running estimate of it goes over `maxsize`, so that a
+    cache hit or a new entry usually doesn't have to wait for the write lock
+    or scan the table.
+
+    The counts in `info()` are for this process only. The cache is only an
+    optimization, so if the database is busy or can't be written, a `get`
+    is a miss and the other methods do nothing.
+
+    The threads of a process can share a SQLiteCache: they take turns with
+    its connection and its batch of hits.
+
+    >>> cache = SQLiteCache(':memory:', 10)
+    >>> for i in range(10):
+    ...     cache.put('key%d' % i, b'value')
+    >>> cache.get('key0')
+    b'value'
+    >>> cache.put('key10', b'value')
+    >>> len(cache), 'key0' in cache, 'key1' in cache, 'key2' in cache
+    (9, True, False, False)
+    """
+
+    def __init__(self, path, maxsize, touch_batch_size=SQLITE_TOUCH_BATCH_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self.touch_batch_size = touch_batch_size
+        self.hits = self.misses = self.evictions = 0
+        # When each key that's been hit since the last batch was last used,
+        # and about how many entries there are
+        self.touched = {}
+        self.size = None
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            path, timeout=0.5, check_same_thread=False, isolation_level=None
+        )
+        try:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.OperationalError:
+            pass
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS cache "
+            "(key TEXT PRIMARY KEY, value BLOB, last_used REAL)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used)"
+        )
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                row = self.db.execute(
+                    "SELECT value FROM cache WHERE key=?", (key,)
+                ).fetchone()
+            except sqlite3.OperationalError:
+                row = None
+            if row is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.touched[key] = time.time()
+            if len(self.touched) >= self.touch_batch_size:
+                self._write_touched()
+            return row[0]
+
+    def _write_touched(self):
+        """
+        Record when the keys that have been hit were last used, in one
+        transaction. If that can't be done, they're just forgotten. The
+        caller holds `self.lock`.
+        """
+        touched = [(last_used, key) for key, last_used in self.touched.items()]
+        self.touched.clear()
+        try:
+            with self.db:
+                self.db.execute("BEGIN")
+                self.db.executemany(
+                    "UPDATE cache SET last_used=? WHERE key=?", touched
+                )
+        except sqlite3.OperationalError:
+            pass
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            try:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, last_used) VALUES (?, ?, ?)",
+                    (key, value, time.time()),
+                )
+                self.touched.pop(key, None)
+                if self.size is None:
+                    self.size = self._count()
+                else:
+                    self.size += 1
+                if self.size > self.maxsize:
+                    # Other processes add and evict entries too, so count them
+                    # for real before evicting any
+                    self._write_touched()
+                    self.size = self._count()
+                    if self.size > self.maxsize:
+                        excess = self.size - self.maxsize + self.maxsize // 10
+                        self.db.execute(
+                            "DELETE FROM cache WHERE key IN "
+                            "(SELECT key FROM cache ORDER BY last_used LIMIT ?)",
+                            (excess,),
+                        )
+                        self.evictions += excess
+                        self.size -= excess
+            except sqlite3.OperationalError:
+                pass
+
+    def _count(self):
+        # The caller holds self.lock
+        return self.db.execute("SELECT count(*) FROM cache").fetchone()[0]
+
+    def __contains__(self, key):
+        with self.lock:
+            try:
+                return (
+                    self.db.execute("SELECT 1 FROM cache WHERE key=?", (key,)).fetchone()
+                    is not None
+                )
+            except sqlite3.OperationalError:
+                return False
+
+    def __len__(self):
+        with self.lock:
+            try:
+                self.size = self._count()
+            except sqlite3.OperationalError:
+                pass
+            return self.size or 0
+
+    def clear(self):
+        with self.lock:
+            self.touched.clear()
+            try:
+                self.db.execute("DELETE FROM cache")
+                self.size = 0
+            except sqlite3.OperationalError:
+                pass
+
+    def info(self):
+        return CacheInfo(
+            self.hits, self.misses, self.evictions, self.maxsize, len(self)
+        )
@@ -59,8 +59,8 @@ def best_caesar_shift(text, wordlist=WORDS, count=5):
     """
     possibilities = [caesar_shift(text, n) for n in range(26)]
     results = []
-    for n, poss in enumerate(possibilities):
-        results.extend([found + (n,) for found in wordlist.search(poss)])
+    for n, found_list in enumerate(wordlist.search_many(possibilities)):
+        results.extend([found + (n,) for found in found_list])
     return wordlist.show_best_results(results, count=count)
 
 
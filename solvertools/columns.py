@@ -0,0 +1,446 @@
+"""
+A columnar form of the greppable wordlists, for answering fixed-length
+pattern queries with NumPy instead of scanning text with a regex.
+
+For each length, `data/wordlists/columns/<name>.<length>.npy` is an array of
+shape (length, N) holding the letters of the N words of that length, as
+numbers from 0 to 25. Row `i` of the array is the letter in position `i` of
+every word, so each position is contiguous in memory. The words are in the
+same order as in the greppable list, which is descending order of
+cromulence.
+
+A pattern is compiled, for a particular length, into a table of which
+letters are allowed at each position. Filtering the words is then a matter
+of looking up each column in its row of the table and combining the results
+with `&`:
+
+    >>> plan = compile_pattern('.a.b.c..', 8)
+    >>> plan.exact
+    True
+    >>> [''.join(LETTERS[plan.allowed[i]]) for i in (1, 2)]
+    ['a', 'abcdefghijklmnopqrstuvwxyz']
+
+When every piece of the pattern matches exactly one character, the table
+describes the pattern exactly. Otherwise it describes a superset of it, and
+the words that get through the filter are checked against the regex.
+
+For patterns that fix a few letters, such as crossword patterns, it's
+faster still to start from the words that have those letters in those
+positions. `data/wordlists/postings/<name>.<length>.npy` is an inverted
+index with the same shape as the columns: row `i` lists the word numbers
+sorted by their letter in position `i` (and then by word number), and
+`<name>.<length>.offsets.npy` says where each letter's posting list starts
+and ends. Intersecting the posting lists of the most selective positions
+leaves a small set of candidates, and only those are checked against the
+rest of the pattern.
+
+The commonest patterns of all are a length with no letters filled in, or
+with just one, and those have their first results precomputed in a
+TopTable. For each length, `data/wordlists/top/<name>.<length>.ids.npy`
+lists the lexicon ids of the first TOP_TABLE_SIZE words of each of these
+patterns, in order: first the pattern of all wildcards, then the pattern
+with letter `l` in position `i`, for each `i` and `l`.
+`<name>.<length>.offsets.npy` says where each pattern's list starts and
+ends, and `<name>.<length>.totals.npy` how many words match it in all.
+"""
+from functools import lru_cache
+import os
+import re
+
+import numpy as np
+
+from solvertools.regextools import regex_index, regex_len, regex_pieces
+from solvertools.util import wordlist_path
+
+
+LETTERS = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+ASCII_a = 97
+
+# How many matching rows to turn back into text at a time
+CHUNK_SIZE = 256
+
+# Use a position's posting lists if they cover at most this fraction of the
+# words, and intersect the lists for at most this many positions
+SELECTIVE_FRACTION = 0.25
+MAX_INTERSECTIONS = 3
+
+# How many results of each pattern to store in a TopTable
+TOP_TABLE_SIZE = 1000
+
+
+class GrepPlan:
+    """
+    A pattern compiled for a particular length. `allowed` is a boolean array
+    of shape (length, 26), `exact` says whether it describes the pattern
+    exactly, and `regex` is the compiled pattern for checking the words when
+    it doesn't. `constrained` lists the positions that don't allow every
+    letter.
+    """
+
+    __slots__ = ("length", "allowed", "exact", "regex", "constrained")
+
+    def __init__(self, length, allowed, exact, regex):
+        self.length = length
+        self.allowed = allowed
+        self.exact = exact
+        self.regex = regex
+        self.constrained = [
+            pos for pos in range(length) if not allowed[pos].all()
+        ]
+
+    def matches_nothing(self):
+        return not self.allowed.any(axis=1).all()
+
+
+def _allowed_letters(regex):
+    """
+    Which of the 26 letters does a single-character regex match?
+    """
+    compiled = re.compile(regex)
+    return np.array([bool(compiled.fullmatch(letter)) for letter in LETTERS])
+
+
+@lru_cache(maxsize=10000)
+def compile_pattern(pattern, length):
+    """
+    Compile a lowercase, unspaced regex into a GrepPlan for words of the
+    given length. Returns None if it's a regex we can't index into, in which
+    case the caller should fall back on scanning.
+    """
+    try:
+        pieces = regex_pieces(pattern)
+        if all(regex_len(piece) == (1, 1) for piece in pieces):
+            exact = True
+            if len(pieces) != length:
+                allowed = np.zeros((length, 26), dtype=bool)
+            else:
+                allowed = np.array([_allowed_letters(piece) for piece in pieces])
+        else:
+            exact = False
+            rows = []
+            for pos in range(length):
+                try:
+                    rows.append(_allowed_letters(regex_index(pattern, pos)))
+                except IndexError:
+                    rows.append(np.zeros(26, dtype=bool))
+            allowed = np.array(rows).reshape(length, 26)
+    except (NotImplementedError, ValueError, re.error):
+        return None
+    return GrepPlan(length, allowed, exact, re.compile(pattern))
+
+
+def columns_path(name, length):
+    return wordlist_path("columns/%s.%d.npy" % (name, length))
+
+
+def postings_path(name, length, part=""):
+    return wordlist_path("postings/%s.%d%s.npy" % (name, length, part))
+
+
+def top_path(name, length, part):
+    return wordlist_path("top/%s.%d.%s.npy" % (name, length, part))
+
+
+class LetterColumns:
+    """
+    The columnar letters of all the words of one length in a wordlist.
+    """
+
+    def __init__(self, name, length):
+        self.name = name
+        self.length = length
+        self.letters = np.asarray(np.load(columns_path(name, length), mmap_mode="r"))
+        if os.access(postings_path(name, length, ".offsets"), os.F_OK):
+            self.postings = np.asarray(
+                np.load(postings_path(name, length), mmap_mode="r")
+            )
+            self.offsets = np.load(postings_path(name, length, ".offsets"))
+        else:
+            self.postings = self.offsets = None
+
+    @classmethod
+    def from_slugs(cls, length, slugs):
+        """
+        Build the columns and postings for a list of slugs in memory,
+        instead of loading them from files.
+        """
+        self = cls.__new__(cls)
+        self.name = None
+        self.length = length
+        self.letters = slug_columns(length, slugs)
+        self.postings, self.offsets = build_postings(self.letters)
+        return self
+
+    @staticmethod
+    def exists(name, length):
+        return os.access(columns_path(name, length), os.F_OK)
+
+    def __len__(self):
+        return self.letters.shape[1]
+
+    def slugs(self, rows):
+        """
+        Get the slugs in the given rows, as a list of strings.
+        """
+        if len(rows) == 0:
+            return []
+        block = np.ascontiguousarray(self.letters[:, rows].T) + ASCII_a
+        data = block.astype(np.uint8).tobytes().decode("ascii")
+        length = self.length
+        return [data[i : i + length] for i in range(0, len(data), length)]
+
+    def filter_mask(self, plan, positions=None):
+        """
+        Get a boolean mask of the words whose letters are allowed by the plan
+        in each of the given positions (by default, all the constrained
+        ones). Returns None if nothing is constrained.
+        """
+        if positions is None:
+            positions = plan.constrained
+        mask = None
+        for pos in positions:
+            ok = plan.allowed[pos][self.letters[pos]]
+            if mask is None:
+                mask = ok
+            else:
+                mask &= ok
+        return mask
+
+    def posting_rows(self, pos, allowed):
+        """
+        Get the sorted row numbers of the words that have one of the allowed
+        letters in position `pos`.
+        """
+        starts = self.offsets[pos]
+        lists = [
+            self.postings[pos, starts[letter] : starts[letter + 1]]
+            for letter in np.flatnonzero(allowed)
+        ]
+        if len(lists) == 1:
+            return lists[0]
+        return np.sort(np.concatenate(lists))
+
+    def matching_rows(self, plan):
+        """
+        Get the row numbers of the words that pass the plan's filter, in
+        order.
+
+        Posting lists are used for the positions where few words have an
+        allowed letter. Here, 'p' and 't' are each in two of the eight words
+        in those positions, so their lists are intersected:
+
+            >>> cols = LetterColumns.from_slugs(
+            ...     4, ['pots', 'stop', 'tops', 'spot', 'post', 'opts', 'soap', 'taps']
+            ... )
+            >>> cols.matching_rows(compile_pattern('.p.t', 4)).tolist()
+            [3]
+            >>> cols.posting_rows(0, compile_pattern('[pt]...', 4).allowed[0]).tolist()
+            [0, 2, 4, 7]
+
+        The positions with common letters are filtered afterward, or, if no
+        position is selective, with a mask over all the words:
+
+            >>> cols.matching_rows(compile_pattern('po..', 4)).tolist()
+            [0, 4]
+            >>> list(cols.iter_matches(compile_pattern('.o.s', 4)))
+            ['pots', 'tops']
+        """
+        if plan.matches_nothing():
+            return np.zeros(0, dtype=np.int64)
+        if self.postings is not None and plan.constrained:
+            # How many words are in the posting lists for each position?
+            sizes = []
+            for pos in plan.constrained:
+                starts = self.offsets[pos]
+                counts = starts[1:] - starts[:-1]
+                sizes.append((int(counts[plan.allowed[pos]].sum()), pos))
+            sizes.sort()
+            selective = [
+                pos
+                for size, pos in sizes[:MAX_INTERSECTIONS]
+                if size <= len(self) * SELECTIVE_FRACTION
+            ]
+            if selective:
+                rows = self.posting_rows(selective[0], plan.allowed[selective[0]])
+                for pos in selective[1:]:
+                    rows = np.intersect1d(
+                        rows,
+                        self.posting_rows(pos, plan.allowed[pos]),
+                        assume_unique=True,
+                    )
+                for pos in plan.constrained:
+                    if pos not in selective and len(rows):
+                        rows = rows[plan.allowed[pos][self.letters[pos, rows]]]
+                return rows
+        mask = self.filter_mask(plan)
+        if mask is None:
+            return np.arange(len(self))
+        return np.flatnonzero(mask)
+
+    def iter_matches(self, plan, rows=None):
+        """
+        Yield the slugs that match a plan, in order. If `rows` is given, only
+        those rows are considered.
+        """
+        if rows is None:
+            rows = self.matching_rows(plan)
+        for start in range(0, len(rows), CHUNK_SIZE):
+            for slug in self.slugs(rows[start : start + CHUNK_SIZE]):
+                if plan.exact or plan.regex.fullmatch(slug):
+                    yield slug
+
+
+class TopTable:
+    """
+    The precomputed first results of the patterns of one length that fill
+    in at most one letter.
+    """
+
+    def __init__(self, name, length):
+        self.name = name
+        self.length = length
+        self.ids = np.asarray(np.load(top_path(name, length, "ids"), mmap_mode="r"))
+        self.offsets = np.load(top_path(name, length, "offsets"))
+        self.totals = np.load(top_path(name, length, "totals"))
+
+    @classmethod
+    def from_columns(cls, columns, word_ids, size=TOP_TABLE_SIZE):
+        """
+        Build the TopTable for a LetterColumns in memory, instead of loading
+        it from files, given the lexicon id of each of its words.
+
+            >>> cols = LetterColumns.from_slugs(4, ['pots', 'stop', 'tops', 'spot', 'post'])
+            >>> table = TopTable.from_columns(cols, [10, 11, 12, 13, 14], size=2)
+            >>> ids, complete = table.lookup(compile_pattern('....', 4))
+            >>> ids.tolist(), complete
+            ([10, 11], False)
+            >>> ids, complete = table.lookup(compile_pattern('s...', 4))
+            >>> ids.tolist(), complete
+            ([11, 13], True)
+            >>> ids, complete = table.lookup(compile_pattern('..o.', 4))
+            >>> ids.tolist(), complete
+            ([11, 13], True)
+            >>> table.lookup(compile_pattern('s..t', 4)) is None
+            True
+        """
+        self = cls.__new__(cls)
+        self.name = None
+        self.length = columns.length
+        self.ids, self.offsets, self.totals = build_top_table(
+            columns.postings, columns.offsets, word_ids, size
+        )
+        return self
+
+    @staticmethod
+    def exists(name, length):
+        # This is the last file that write_top_table writes
+        return os.access(top_path(name, length, "totals"), os.F_OK)
+
+    def key(self, plan):
+        """
+        Get the number of the table that has the results of a plan, or None
+        if it isn't one of the patterns we store.
+        """
+        if not plan.exact:
+            return None
+        if not plan.constrained:
+            return 0
+        if len(plan.constrained) == 1:
+            pos = plan.constrained[0]
+            letters = np.flatnonzero(plan.allowed[pos])
+            if len(letters) == 1:
+                return 1 + pos * 26 + int(letters[0])
+        return None
+
+    def lookup(self, plan):
+        """
+        Get the lexicon ids of the first words that match a plan, in order,
+        and whether that's all of them. Returns None if the plan isn't in
+        the table.
+        """
+        key = self.key(plan)
+        if key is None:
+            return None
+        ids = self.ids[self.offsets[key] : self.offsets[key + 1]]
+        return ids, bool(len(ids) == self.totals[key])
+
+
+def slug_columns(length, slugs):
+    """
+    Get the columnar form of a list of slugs that all have the given length.
+    """
+    data = "".join(slugs).encode("ascii")
+    letters = np.frombuffer(data, dtype=np.uint8).reshape(len(slugs), length)
+    return np.ascontiguousarray((letters - ASCII_a).T)
+
+
+def build_postings(columns):
+    """
+    Build the positional inverted index for words of one length, from their
+    columnar form. Returns the postings and their offsets.
+    """
+    length = columns.shape[0]
+    postings = np.zeros(columns.shape, dtype=np.uint32)
+    offsets = np.zeros((length, 27), dtype=np.int64)
+    for pos in range(length):
+        # A stable sort keeps each letter's rows in increasing order
+        order = np.argsort(columns[pos], kind="stable")
+        postings[pos] = order
+        offsets[pos] = np.searchsorted(columns[pos][order], np.arange(27))
+    return postings, offsets
+
+
+def write_letter_columns(name, length, slugs):
+    """
+    Write the columnar form of a list of slugs that all have the given
+    length.
+    """
+    os.makedirs(wordlist_path("columns"), exist_ok=True)
+    np.save(columns_path(name, length), slug_columns(length, slugs))
+
+
+def write_postings(name, length):
+    """
+    Write the positional inverted index for words of one length, from their
+    columnar form.
+    """
+    os.makedirs(wordlist_path("postings"), exist_ok=True)
+    postings, offsets = build_postings(np.load(columns_path(name, length)))
+    np.save(postings_path(name, length), postings)
+    np.save(postings_path(name, length, ".offsets"), offsets)
+
+
+def build_top_table(postings, offsets, word_ids, size=TOP_TABLE_SIZE):
+    """
+    Get the ids, offsets, and totals arrays of the TopTable for words of one
+    length, from their postings and the lexicon id of each word.
+    """
+    length = postings.shape[0]
+    word_ids = np.asarray(word_ids, dtype=np.int32)
+    lists = [word_ids[:size]]
+    totals = [len(word_ids)]
+    for pos in range(length):
+        for letter in range(26):
+            start, end = offsets[pos, letter], offsets[pos, letter + 1]
+            lists.append(word_ids[postings[pos, start : min(end, start + size)]])
+            totals.append(end - start)
+    list_offsets = np.cumsum([0] + [len(ids) for ids in lists])
+    return (
+        np.concatenate(lists),
+        list_offsets.astype(np.int64),
+        np.array(totals, dtype=np.int64),
+    )
+
+
+def write_top_table(name, length, word_ids, size=TOP_TABLE_SIZE):
+    """
+    Write the TopTable for words of one length, given the lexicon id of each
+    word in the columns. The postings have to be written first.
+    """
+    os.makedirs(wordlist_path("top"), exist_ok=True)
+    postings = np.load(postings_path(name, length), mmap_mode="r")
+    offsets = np.load(postings_path(name, length, ".offsets"))
+    ids, list_offsets, totals = build_top_table(postings, offsets, word_ids, size)
+    np.save(top_path(name, length, "ids"), ids)
+    np.save(top_path(name, length, "offsets"), list_offsets)
+    np.save(top_path(name, length, "totals"), totals)
@@ -1,13 +1,45 @@
+"""
+Term vectors from ConceptNet Numberbatch, for finding words related to the
+words of a clue.
+
+`load_numberbatch` loads the vectors into a pandas DataFrame, which is a
+copy of the whole matrix in every process that uses it. `write_vector_store`
+preprocesses them into a `VectorStore` instead: an L2-normalized float32
+matrix that each process memory-maps, so they all share one copy, plus an
+inverted-file index for finding approximate nearest neighbors. The files
+are in `data/vectors/`:
+
+- `<name>.store.labels.txt`: the labels, in the order of the rows below
+- `<name>.store.vectors.npy`: the normalized vectors, grouped by cluster
+- `<name>.store.centroids.npy`: the normalized centroid of each cluster
+- `<name>.store.offsets.npy`: where each cluster's rows start and end
+
+To find the neighbors of a vector, we compare it to the centroids, and then
+to just the rows of the IVF_PROBES clusters whose centroids are closest.
+The neighbors of all the words of a clue are found at once, with one
+matrix product per cluster that any of them probes.
+"""
+import os
 import re
 import pandas as pd
 import numpy as np
 from .normalize import alphanumeric
+from solvertools.caches import make_cache
 from solvertools.util import data_path
 
 
 DOUBLE_DIGIT_RE = re.compile(r'[0-9][0-9]')
 DIGIT_RE = re.compile(r'[0-9]')
 
+# How many clusters to divide the vectors into, how many rounds of k-means
+# to run to find them, and how many of them to search for each query
+IVF_CLUSTERS = 512
+IVF_ITERATIONS = 10
+IVF_PROBES = 16
+
+# How many terms' lists of neighbors a VectorStore remembers
+NEIGHBOR_CACHE_SIZE = 5000
+
 
 def replace_numbers(s):
     """
@@ -32,6 +64,295 @@ def load_numberbatch():
     return load_labels_and_npy(data_path('vectors/english.labels.txt'), data_path('vectors/english.npy'))
 
 
+def store_path(name, part):
+    return data_path('vectors/%s.store.%s' % (name, part))
+
+
+def normalize_rows(mat):
+    """
+    L2-normalize each row of a matrix, as float32. Rows of all zeros stay
+    that way.
+    """
+    mat = np.asarray(mat, dtype=np.float32)
+    norms = np.sqrt(np.einsum('ij,ij->i', mat, mat))
+    norms[norms == 0] = 1.
+    return mat / norms[:, np.newaxis]
+
+
+def spherical_kmeans(mat, k, iterations=IVF_ITERATIONS, seed=0):
+    """
+    Cluster the rows of a normalized matrix by cosine similarity. Returns
+    the normalized centroids and the cluster each row is assigned to.
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(mat))
+    centroids = mat[rng.choice(len(mat), k, replace=False)]
+    for _ in range(iterations):
+        assignments = np.argmax(mat @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, mat)
+        # A cluster that lost all its rows keeps its old centroid
+        empty = ~sums.any(axis=1)
+        sums[empty] = centroids[empty]
+        centroids = normalize_rows(sums)
+    return centroids, np.argmax(mat @ centroids.T, axis=1)
+
+
+def write_vector_store(name='english', clusters=IVF_CLUSTERS):
+    """
+    Preprocess `data/vectors/<name>.npy` and its labels into the files of a
+    `VectorStore`.
+    """
+    labels = [
+        line.rstrip('\n')
+        for line in open(data_path('vectors/%s.labels.txt' % name), encoding='utf-8')
+    ]
+    mat = np.load(data_path('vectors/%s.npy' % name), mmap_mode='r')
+    labels, vectors, centroids, offsets = build_vector_store(labels, mat, clusters)
+    with open(store_path(name, 'labels.txt'), 'w', encoding='utf-8') as out:
+        for label in labels:
+            print(label, file=out)
+    np.save(store_path(name, 'vectors.npy'), vectors)
+    np.save(store_path(name, 'centroids.npy'), centroids)
+    np.save(store_path(name, 'offsets.npy'), offsets)
+
+
+def build_vector_store(labels, mat, clusters=IVF_CLUSTERS):
+    """
+    Normalize the rows of `mat` and cluster them, returning the labels and
+    normalized vectors grouped by cluster, the centroids, and the offsets
+    where each cluster's rows start and end.
+    """
+    mat = normalize_rows(mat)
+    centroids, assignments = spherical_kmeans(mat, clusters)
+    order = np.argsort(assignments, kind='stable')
+    offsets = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+    return [labels[row] for row in order], mat[order], centroids, offsets.astype(np.int64)
+
+
+def _top_rows(rows, similarity, limit):
+    """
+    Get the `limit` rows with the highest similarity, and their similarities,
+    in descending order of similarity.
+    """
+    if len(rows) > limit:
+        top = np.argpartition(-similarity, limit)[:limit]
+    else:
+        top = np.arange(len(rows))
+    top = top[np.argsort(-similarity[top], kind='stable')]
+    return rows[top], similarity[top]
+
+
+class VectorStore:
+    """
+    Memory-mapped, L2-normalized term vectors, with a dictionary from each
+    label to its row and an inverted-file index of clusters of rows.
+
+    The lists of neighbors that `similar_to_terms` finds are kept in a
+    bounded cache of `cache_size` terms, whose eviction policy is
+    `cache_policy`, 'lru' or 'arc'.
+    """
+    def __init__(self, name='english', cache_policy='lru', cache_size=NEIGHBOR_CACHE_SIZE):
+        labels = [
+            line.rstrip('\n')
+            for line in open(store_path(name, 'labels.txt'), encoding='utf-8')
+        ]
+        self._setup(
+            name,
+            labels,
+            np.asarray(np.load(store_path(name, 'vectors.npy'), mmap_mode='r')),
+            np.load(store_path(name, 'centroids.npy')),
+            np.load(store_path(name, 'offsets.npy')),
+            cache_policy,
+            cache_size,
+        )
+
+    @classmethod
+    def from_arrays(cls, name, labels, vectors, centroids, offsets,
+                    cache_policy='lru', cache_size=NEIGHBOR_CACHE_SIZE):
+        """
+        Make a VectorStore in memory, from what `build_vector_store` returns,
+        instead of from its files.
+        """
+        store = cls.__new__(cls)
+        store._setup(name, labels, vectors, centroids, offsets, cache_policy, cache_size)
+        return store
+
+    def _setup(self, name, labels, vectors, centroids, offsets, cache_policy, cache_size):
+        self.name = name
+        self._neighbor_cache = make_cache(cache_policy, cache_size)
+        self.labels = labels
+        self.rows = {}
+        for row, label in enumerate(self.labels):
+            self.rows.setdefault(label, row)
+        self.vectors = vectors
+        self.centroids = centroids
+        self.offsets = np.asarray(offsets).tolist()
+        self.cluster_rows = [
+            np.arange(start, end) for start, end in zip(self.offsets, self.offsets[1:])
+        ]
+
+    @staticmethod
+    def exists(name='english'):
+        # This is the last file that write_vector_store writes
+        return os.access(store_path(name, 'offsets.npy'), os.F_OK)
+
+    def get_vector(self, label):
+        """
+        Get the normalized vector for the text `label`, or None if there
+        isn't one.
+        """
+        row = self.rows.get(alphanumeric(label))
+        if row is None:
+            return None
+        return self.vectors[row]
+
+    def nearest_rows(self, vec, limit=50, exact=False):
+        """
+        Get the rows whose vectors have the highest cosine similarity to
+        `vec`, and their similarities, as two arrays in descending order of
+        similarity.
+
+        Unless `exact` is true, this only looks in the IVF_PROBES clusters
+        nearest to `vec`, so it can miss some neighbors that a search of
+        every row would find.
+        """
+        return self.nearest_rows_many([vec], limit, exact=exact)[0]
+
+    def nearest_rows_many(self, vecs, limit=50, exact=False):
+        """
+        Do what `nearest_rows` does for each of a list of vectors, with one
+        matrix product for all of them, or with the IVF index, one for each
+        cluster that any of them probes. Each vector is still only compared
+        to the rows of its own nearest clusters, so its results are the same
+        as if it were searched for alone.
+
+        On vectors that fall into clusters, the IVF index finds nearly all
+        of the true nearest neighbors:
+
+        >>> rng = np.random.default_rng(0)
+        >>> centers = rng.normal(size=(40, 16))
+        >>> mat = centers[rng.integers(40, size=2000)] + 0.5 * rng.normal(size=(2000, 16))
+        >>> labels = ['term%d' % row for row in range(2000)]
+        >>> store = VectorStore.from_arrays('test', *build_vector_store(labels, mat, 64))
+        >>> queries = mat[:50]
+        >>> found = store.nearest_rows_many(queries, 10)
+        >>> true = store.nearest_rows_many(queries, 10, exact=True)
+        >>> recall = np.mean([
+        ...     len(set(rows.tolist()) & set(true_rows.tolist())) / 10
+        ...     for (rows, _), (true_rows, _) in zip(found, true)
+        ... ])
+        >>> bool(recall >= 0.9)
+        True
+        >>> rows, similarity = store.nearest_rows(queries[0], 10)
+        >>> [store.labels[row] for row in rows[:1]], bool(similarity[0] > 0.999)
+        (['term0'], True)
+        >>> rows.tolist() == found[0][0].tolist()
+        True
+        """
+        results = [None] * len(vecs)
+        queries = []
+        for i, vec in enumerate(vecs):
+            vec = np.asarray(vec, dtype=np.float32)
+            if vec.any():
+                queries.append((i, vec / np.sqrt(vec.dot(vec))))
+            else:
+                results[i] = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        if not queries:
+            return results
+        query_mat = np.stack([vec for _, vec in queries])
+
+        if exact or IVF_PROBES >= len(self.centroids):
+            similarity = self.vectors @ query_mat.T
+            for j, (i, _) in enumerate(queries):
+                results[i] = _top_rows(np.arange(len(self.vectors)), similarity[:, j], limit)
+            return results
+
+        # Find the clusters that each query probes. Each of those clusters is
+        # multiplied by all the queries that probe it at once.
+        nearest = np.argpartition(-(query_mat @ self.centroids.T), IVF_PROBES, axis=1)
+        probes = {}
+        for j, clusters in enumerate(nearest[:, :IVF_PROBES].tolist()):
+            for cluster in clusters:
+                probes.setdefault(cluster, []).append(j)
+        row_parts = [[] for _ in queries]
+        similarity_parts = [[] for _ in queries]
+        for cluster, probing in probes.items():
+            start, end = self.offsets[cluster], self.offsets[cluster + 1]
+            block = self.vectors[start:end] @ query_mat[probing].T
+            for k, j in enumerate(probing):
+                row_parts[j].append(self.cluster_rows[cluster])
+                similarity_parts[j].append(block[:, k])
+        for j, (i, _) in enumerate(queries):
+            results[i] = _top_rows(
+                np.concatenate(row_parts[j]), np.concatenate(similarity_parts[j]), limit
+            )
+        return results
+
+    def _series(self, rows, values):
+        return pd.Series(
+            data=values, index=[self.labels[row] for row in rows.tolist()], dtype='f'
+        )
+
+    def similar_to_vec(self, vec, limit=50, exact=False):
+        """
+        Get a Series of the `limit` labels most similar to `vec`, and their
+        cosine similarities, in descending order.
+        """
+        return self._series(*self.nearest_rows(vec, limit, exact=exact))
+
+    def similar_to_term(self, term, limit=50, exact=False):
+        """
+        Like the `similar_to_term` function, which works on a DataFrame: get
+        a Series of the labels most similar to `term`, scaled so the most
+        similar one has a similarity of 1, and cubed.
+        """
+        similar = self.similar_to_terms([term], limit, exact=exact)[0]
+        return pd.Series(
+            data=[sim for _, sim in similar],
+            index=[label for label, _ in similar],
+            dtype='f',
+        )
+
+    def similar_to_terms(self, terms, limit=50, exact=False):
+        """
+        Find the neighbors of each of a list of terms at once. For each term,
+        this returns a list of (label, similarity) pairs, with the same
+        values as `similar_to_term`.
+
+        The lists are cached, and shouldn't be modified.
+        """
+        keys = [(alphanumeric(term), limit, exact) for term in terms]
+        results = [self._neighbor_cache.get(key) for key in keys]
+        missing = {}
+        for key, result in zip(keys, results):
+            if result is None and key[0] in self.rows:
+                missing.setdefault(key, self.rows[key[0]])
+        found = {}
+        if missing:
+            nearest = self.nearest_rows_many(
+                [self.vectors[row] for row in missing.values()], limit, exact=exact
+            )
+            for key, (rows, similarity) in zip(missing, nearest):
+                if len(similarity):
+                    similarity = similarity / similarity[0]
+                found[key] = [
+                    (self.labels[row], sim)
+                    for row, sim in zip(rows.tolist(), (similarity ** 3).tolist())
+                ]
+                self._neighbor_cache.put(key, found[key])
+        return [
+            result if result is not None else found.get(key, [])
+            for key, result in zip(keys, results)
+        ]
+
+    def neighbor_cache_info(self):
+        """
+        Get the hit, miss, and eviction counts of the cache of neighbors.
+        """
+        return self._neighbor_cache.info()
+
+
 def get_vector(frame, label):
     """
     Returns the row of a vector-space DataFrame `frame` corresponding
@@ -1,6 +1,9 @@
 from solvertools.normalize import slugify
+from collections import Counter
+import math
 import re
 import random
+import numpy as np
 ASCII_a = 97
 
 
@@ -37,6 +40,103 @@ def to_proportion(vec):
     return [value / vecsum for value in vec]
 
 
+# Count vectors
+# =============
+# For working with many sets of letters at once, we represent each one as a
+# length-26 NumPy array of letter counts, and a batch of them as an (N, 26)
+# array. The functions that end in `_many` take a batch, and do with NumPy
+# what the function without `_many` does to one alphagram.
+
+def letter_counts(slug):
+    """
+    Get a length-26 array of how many times each letter appears in a slug.
+    """
+    letters = np.frombuffer(slug.encode('ascii'), dtype=np.uint8) - ASCII_a
+    return np.bincount(letters, minlength=26).astype(np.uint8)
+
+
+def letter_counts_many(slugs):
+    """
+    Get an (N, 26) array of the letter counts of a list of slugs. They can
+    also be given as bytes in the 'alphabytes' form, because the low five
+    bits of each byte give the letter either way.
+
+        >>> letter_counts_many(['banana', alphabytes('nab')])[:, :3].tolist()
+        [[3, 1, 0], [1, 1, 0]]
+    """
+    data = b''.join(
+        slug if isinstance(slug, bytes) else slug.encode('ascii') for slug in slugs
+    )
+    letters = np.frombuffer(data, dtype=np.uint8) % 32 - 1
+    lengths = np.array([len(slug) for slug in slugs], dtype=np.int64)
+    rows = np.repeat(np.arange(len(slugs)), lengths)
+    counts = np.bincount(rows * 26 + letters, minlength=len(slugs) * 26)
+    return counts.reshape(len(slugs), 26).astype(np.uint8)
+
+
+def counts_to_alphagrams(counts):
+    """
+    Turn an (N, 26) array of letter counts back into a list of alphagrams.
+    """
+    counts = np.asarray(counts)
+    if len(counts) == 0:
+        return []
+    alphabet = np.arange(ASCII_a, ASCII_a + 26, dtype=np.uint8)
+    letters = np.tile(alphabet, len(counts))
+    data = np.repeat(letters, counts.ravel()).tobytes().decode('ascii')
+    ends = np.cumsum(counts.sum(axis=1, dtype=np.int64)).tolist()
+    starts = [0] + ends[:-1]
+    return [data[start:end] for start, end in zip(starts, ends)]
+
+
+def anagram_diff_many(target, counts):
+    """
+    The batch version of `anagram_diff(target, a2)`, for each set of letters
+    `a2` in `counts`. Returns the counts of the letters that remain, and an
+    array of the number of wildcards each one uses.
+
+        >>> remaining, wildcards_used = anagram_diff_many(
+        ...     letter_counts('aehorsuw'), letter_counts_many(['wee', 'hours'])
+        ... )
+        >>> counts_to_alphagrams(remaining), wildcards_used.tolist()
+        (['ahorsu', 'aew'], [1, 0])
+    """
+    diff = np.asarray(target).astype(np.int16) - counts
+    remaining = np.maximum(diff, 0).astype(np.uint8)
+    wildcards_used = np.maximum(-diff, 0).sum(axis=1)
+    return remaining, wildcards_used
+
+
+def is_sub_anagram_many(target, counts, slack=0):
+    """
+    Find which sets of letters in `counts` can be made from the letters of
+    `target`, plus up to `slack` wildcards. Returns a boolean array.
+    """
+    excess = np.asarray(counts).astype(np.int16) - target
+    return np.maximum(excess, 0).sum(axis=1) <= slack
+
+
+def anagram_cost_many(counts):
+    """
+    The batch version of `anagram_cost`, giving exactly the same values.
+
+        >>> costs = anagram_cost_many(letter_counts_many(['', 'etaoin', 'qzjx']))
+        >>> costs.tolist() == [anagram_cost(''), anagram_cost('etaoin'),
+        ...                    anagram_cost('qzjx')]
+        True
+    """
+    counts = np.asarray(counts)
+    n_letters = counts.sum(axis=1, dtype=np.int64)
+    sq_cost = np.zeros(len(counts))
+    nonempty = n_letters > 0
+    proportions = counts[nonempty] / n_letters[nonempty, np.newaxis]
+    # Add up the letters in order, as anagram_cost does, so the rounding is
+    # the same
+    for i in range(26):
+        sq_cost[nonempty] += (proportions[:, i] / letter_freqs[i] - 1) ** 2
+    return np.where(nonempty, np.sqrt(sq_cost) * n_letters, 0.0)
+
+
 def alphagram(slug):
     """
     Given text in 'slug' form, return its alphagram, which is the string of
@@ -92,18 +192,16 @@ def anagram_diff(a1, a2):
     - the alphagram of letters that remain
     - the number of letters in a2 that are not found in a1, which is the number
       of "wildcards" to consume
+
+        >>> anagram_diff('aehorsuw', 'eew')
+        ('ahorsu', 1)
     """
-    adiff = ''
-    wildcards_used = 0
-    for letter in set(a2) - set(a1):
-        diff = a2.count(letter) - a1.count(letter)
-        wildcards_used += diff
-    for letter in sorted(set(a1)):
-        diff = (a1.count(letter) - a2.count(letter))
-        if diff < 0:
-            wildcards_used -= diff
-        else:
-            adiff += letter * diff
+    counts1 = Counter(a1)
+    counts1.subtract(a2)
+    adiff = ''.join(
+        letter * diff for letter, diff in sorted(counts1.items()) if diff > 0
+    )
+    wildcards_used = -sum(diff for diff in counts1.values() if diff < 0)
     return adiff, wildcards_used
 
 
@@ -113,18 +211,18 @@ def diff_both(a1, a2):
 
     - The alphagram of letters in a1 but not in a2
     - The alphagram of letters in a2 but not in a1
+
+        >>> diff_both('aabc', 'abbd')
+        ('ac', 'bd')
     """
-    diff1 = ''
-    diff2 = ''
-    for letter in set(a2) - set(a1):
-        diff = a2.count(letter) - a1.count(letter)
-        diff2 += letter * diff
-    for letter in sorted(set(a1)):
-        diff = (a1.count(letter) - a2.count(letter))
-        if diff < 0:
-            diff2 += letter * diff
-        else:
+    counts1 = Counter(a1)
+    counts1.subtract(a2)
+    diff1 = diff2 = ''
+    for letter, diff in sorted(counts1.items()):
+        if diff > 0:
             diff1 += letter * diff
+        elif diff < 0:
+            diff2 += letter * -diff
     return diff1, diff2
 
 
@@ -173,7 +271,7 @@ def anagram_cost(letters):
     for i in range(26):
         discrepancy = (vec[i] / letter_freqs[i] - 1) ** 2
         sq_cost += discrepancy
-    return sq_cost ** 0.5 * n_letters
+    return math.sqrt(sq_cost) * n_letters
 
 
 VOWELS_RE = re.compile('[aeiouy]')
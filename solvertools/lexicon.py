@@ -0,0 +1,428 @@
+"""
+A compiled, read-only form of a wordlist, for answering the questions that
+the cromulence and search code asks over and over: "is this slug in the
+wordlist, how frequent is it, and how is it spelled?"
+
+A Lexicon is built once from a wordlist's SQLite database, and stored as a
+handful of flat files in `data/wordlists/lexicon/`:
+
+- `<name>.slugs.bin`: every slug, in sorted order, concatenated together
+- `<name>.slug_offsets.npy`: where each slug starts and ends in that blob
+- `<name>.texts.bin` and `<name>.text_offsets.npy`: the same for the
+  display text of each entry, encoded as UTF-8
+- `<name>.freqs.npy`: the frequency of each entry
+- `<name>.hash.npy`: an open-addressed hash table from the CRC-32 of a slug
+  to its position in the sorted table (plus one, so that 0 means empty)
+- `<name>.trie_*`: a prefix trie over the slugs, described below
+
+All of these are memory-mapped when they're loaded, so opening a Lexicon is
+nearly instant, and processes that open the same Lexicon share its pages.
+Looking up a slug takes a hash probe and a comparison or two, and never
+touches SQLite.
+
+The trie lets us find all the words that start at a given position of a
+longer slug, while only following prefixes that actually occur in the
+wordlist. Its nodes are numbers, with 0 as the root. The outgoing edges of
+node `n` are the positions from `trie_edges[n]` to `trie_edges[n + 1]`;
+`trie_labels.bin` holds the letter on each edge, and `trie_targets.npy` the
+node it leads to. `trie_words.npy` gives the id of the word that ends at
+each node, or -1 if no word ends there.
+
+A lexicon can also have KeyIndexes, which map a key computed from each slug,
+such as its alphagram, to the ids of the entries with that key, in
+descending order of frequency. A key index named `kind` is stored as:
+
+- `<name>.<kind>.keys.bin` and `<name>.<kind>.key_offsets.npy`: every
+  distinct key, in sorted order
+- `<name>.<kind>.starts.npy`: where each key's ids start and end in
+  `<name>.<kind>.ids.npy`
+- `<name>.<kind>.hash.npy`: an open-addressed hash table from the CRC-32 of
+  a key to its position (plus one), like the one for slugs
+"""
+from array import array
+import mmap
+import os
+import zlib
+
+import numpy as np
+
+from solvertools.util import wordlist_path
+
+
+# The files that write_lexicon writes, and the files that write_key_index
+# writes for each kind of key
+LEXICON_FILES = [
+    "slugs.bin", "texts.bin", "freqs.npy", "slug_offsets.npy", "text_offsets.npy",
+    "hash.npy", "trie_labels.bin", "trie_edges.npy", "trie_targets.npy",
+    "trie_words.npy",
+]
+KEY_INDEX_FILES = ["keys.bin", "key_offsets.npy", "starts.npy", "ids.npy", "hash.npy"]
+
+
+def lexicon_path(name, part):
+    """
+    Get the path to one of the files that make up a compiled lexicon.
+    """
+    return wordlist_path("lexicon/%s.%s" % (name, part))
+
+
+def load_array(name, part):
+    """
+    Memory-map a NumPy array that was saved as part of a compiled lexicon.
+
+    We return it as a plain ndarray view of the mapped memory, because
+    indexing a `np.memmap` one item at a time is several times slower.
+    """
+    return np.asarray(np.load(lexicon_path(name, part + ".npy"), mmap_mode="r"))
+
+
+def load_blob(name, part):
+    """
+    Memory-map a file of concatenated bytes. An empty file can't be mmapped,
+    so it becomes an empty bytestring.
+    """
+    path = lexicon_path(name, part + ".bin")
+    if os.path.getsize(path) == 0:
+        return b""
+    with open(path, "rb") as openfile:
+        return mmap.mmap(openfile.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def slug_hash(key):
+    """
+    The hash function for slugs, given as bytes. It needs to be the same in
+    every process, which Python's built-in `hash` is not.
+    """
+    return zlib.crc32(key)
+
+
+def build_hash_table(hashes):
+    """
+    Build an open-addressed hash table that maps each of the given hash
+    values to its position in the list, plus one.
+
+    A value goes in the slot given by its low bits, or the next free slot
+    after that if it's taken:
+
+        >>> build_hash_table([5, 1, 5, 13]).tolist()
+        [0, 2, 0, 0, 0, 1, 3, 4]
+    """
+    # Keep the hash table at most half full, so probe sequences stay short
+    table_size = 2
+    while table_size < len(hashes) * 2:
+        table_size *= 2
+    mask = table_size - 1
+    table = [0] * table_size
+    for idx, hashval in enumerate(hashes):
+        pos = hashval & mask
+        while table[pos]:
+            pos = (pos + 1) & mask
+        table[pos] = idx + 1
+    return np.array(table, dtype=np.uint32)
+
+
+class TrieBuilder:
+    """
+    Builds the arrays of a prefix trie from slugs that are added in sorted
+    order. Nodes are created in depth-first order as we go; `path` holds the
+    nodes along the previous slug.
+    """
+
+    def __init__(self):
+        self.node_words = array("i", [-1])
+        self.edge_parents = array("I")
+        self.edge_targets = array("I")
+        self.edge_labels = bytearray()
+        self.path = [0]
+        self.prev_slug = b""
+
+    def add(self, slug_bytes, idx):
+        """
+        Add a slug, as bytes, and the id of its word.
+        """
+        path = self.path
+        common = 0
+        for ch1, ch2 in zip(self.prev_slug, slug_bytes):
+            if ch1 != ch2:
+                break
+            common += 1
+        del path[common + 1 :]
+        for ch in slug_bytes[common:]:
+            node = len(self.node_words)
+            self.node_words.append(-1)
+            self.edge_parents.append(path[-1])
+            self.edge_targets.append(node)
+            self.edge_labels.append(ch)
+            path.append(node)
+        self.node_words[path[-1]] = idx
+        self.prev_slug = slug_bytes
+
+    def arrays(self):
+        """
+        Get the trie as the arrays (edges, labels, targets, words) that
+        `walk_trie` takes, where `labels` is a bytestring.
+        """
+        # Group the edges by their parent node. The sort is stable, so each
+        # node's edges stay in alphabetical order.
+        parents = np.frombuffer(self.edge_parents, dtype=np.uint32)
+        order = np.argsort(parents, kind="stable")
+        edges = np.searchsorted(parents[order], np.arange(len(self.node_words) + 1))
+        labels = np.frombuffer(bytes(self.edge_labels), dtype=np.uint8)[order]
+        targets = np.frombuffer(self.edge_targets, dtype=np.uint32)[order]
+        words = np.frombuffer(self.node_words, dtype=np.int32)
+        return edges.astype(np.int64), labels.tobytes(), targets, words
+
+
+def walk_trie(edges, labels, targets, words, key, start=0):
+    """
+    Walk a trie along `key`, a slug given as bytes, starting at position
+    `start`. Yield (end, id) for each word that is spelled by
+    `key[start:end]`, stopping as soon as no word has that prefix.
+
+        >>> builder = TrieBuilder()
+        >>> for idx, slug in enumerate([b'an', b'and', b'ant', b'at']):
+        ...     builder.add(slug, idx)
+        >>> trie = builder.arrays()
+        >>> list(walk_trie(*trie, b'andante'))
+        [(2, 0), (3, 1)]
+        >>> list(walk_trie(*trie, b'andante', 3))
+        [(5, 0), (6, 2)]
+        >>> list(walk_trie(*trie, b'banana'))
+        []
+    """
+    node = 0
+    for pos in range(start, len(key)):
+        edge = labels.find(key[pos : pos + 1], edges[node], edges[node + 1])
+        if edge < 0:
+            return
+        node = targets[edge]
+        word = words[node]
+        if word >= 0:
+            yield pos + 1, int(word)
+
+
+class Lexicon:
+    """
+    A memory-mapped table of slugs, frequencies, and texts. Entries are
+    identified by their position in sorted order, which we call their 'id'.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.freqs = load_array(name, "freqs")
+        self.slug_offsets = load_array(name, "slug_offsets")
+        self.text_offsets = load_array(name, "text_offsets")
+        self.hash_table = load_array(name, "hash")
+        self.slugs = load_blob(name, "slugs")
+        self.texts = load_blob(name, "texts")
+        self.hash_mask = len(self.hash_table) - 1
+        self.trie_edges = load_array(name, "trie_edges")
+        self.trie_targets = load_array(name, "trie_targets")
+        self.trie_words = load_array(name, "trie_words")
+        self.trie_labels = load_blob(name, "trie_labels")
+
+    @staticmethod
+    def exists(name):
+        """
+        Has a lexicon with this name been built?
+        """
+        # This is the last file that write_lexicon writes
+        return os.access(lexicon_path(name, "trie_words.npy"), os.F_OK)
+
+    def __len__(self):
+        return len(self.freqs)
+
+    def __contains__(self, slug):
+        return self.find(slug) >= 0
+
+    def __repr__(self):
+        return "Lexicon(%r)" % self.name
+
+    def slug_bytes(self, idx):
+        offsets = self.slug_offsets
+        return self.slugs[offsets[idx] : offsets[idx + 1]]
+
+    def slug(self, idx):
+        return self.slug_bytes(idx).decode("ascii")
+
+    def text(self, idx):
+        offsets = self.text_offsets
+        return self.texts[offsets[idx] : offsets[idx + 1]].decode("utf-8")
+
+    def freq(self, idx):
+        return int(self.freqs[idx])
+
+    def find(self, slug):
+        """
+        Get the id of a slug, or -1 if it isn't in the lexicon.
+        """
+        key = slug.encode("utf-8")
+        table = self.hash_table
+        mask = self.hash_mask
+        pos = slug_hash(key) & mask
+        while True:
+            entry = int(table[pos])
+            if entry == 0:
+                return -1
+            idx = entry - 1
+            if self.slug_bytes(idx) == key:
+                return idx
+            pos = (pos + 1) & mask
+
+    def lookup(self, slug):
+        """
+        Find a slug, returning its frequency and its text, or None. This is
+        the same thing that `Wordlist.lookup_slug` returns.
+        """
+        idx = self.find(slug)
+        if idx < 0:
+            return None
+        return self.freq(idx), self.text(idx)
+
+    def iter_prefixes(self, key, start=0):
+        """
+        Walk the trie along `key`, a slug given as bytes, starting at
+        position `start`, as `walk_trie` does.
+        """
+        return walk_trie(
+            self.trie_edges, self.trie_labels, self.trie_targets, self.trie_words,
+            key, start,
+        )
+
+
+class KeyIndex:
+    """
+    A memory-mapped index from keys, such as alphagrams, to the ids of the
+    entries of a Lexicon that have each key.
+    """
+
+    def __init__(self, lexicon, kind):
+        name = lexicon.name
+        self.lexicon = lexicon
+        self.kind = kind
+        self.keys = load_blob(name, kind + ".keys")
+        self.key_offsets = load_array(name, kind + ".key_offsets")
+        self.starts = load_array(name, kind + ".starts")
+        self.ids = load_array(name, kind + ".ids")
+        self.hash_table = load_array(name, kind + ".hash")
+        self.hash_mask = len(self.hash_table) - 1
+
+    @staticmethod
+    def exists(name, kind):
+        """
+        Has a key index of this kind been built for the named lexicon?
+        """
+        # This is the last file that write_key_index writes
+        return os.access(lexicon_path(name, kind + ".hash.npy"), os.F_OK)
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def __repr__(self):
+        return "KeyIndex(%r, %r)" % (self.lexicon, self.kind)
+
+    def find_ids(self, key):
+        """
+        Get the ids of the entries with the given key, most frequent first,
+        as an array.
+        """
+        key = key.encode("utf-8")
+        table = self.hash_table
+        offsets = self.key_offsets
+        mask = self.hash_mask
+        pos = slug_hash(key) & mask
+        while True:
+            entry = int(table[pos])
+            if entry == 0:
+                return self.ids[:0]
+            idx = entry - 1
+            if self.keys[offsets[idx] : offsets[idx + 1]] == key:
+                return self.ids[self.starts[idx] : self.starts[idx + 1]]
+            pos = (pos + 1) & mask
+
+    def find_slugs(self, key):
+        """
+        Get the slugs of the entries with the given key, most frequent first.
+        """
+        slug = self.lexicon.slug
+        return [slug(idx) for idx in self.find_ids(key).tolist()]
+
+
+def write_key_index(name, kind, keys, freqs):
+    """
+    Write a key index for a compiled lexicon. `keys` gives the key of each
+    entry of the lexicon in order of id, and `freqs` their frequencies.
+    Entries whose key is empty aren't indexed.
+    """
+    # The sort is stable, so entries with the same key and frequency stay
+    # in order of id
+    order = sorted(
+        (idx for idx, key in enumerate(keys) if key),
+        key=lambda idx: (keys[idx], -freqs[idx]),
+    )
+    distinct = []
+    key_offsets = [0]
+    starts = []
+    with open(lexicon_path(name, kind + ".keys.bin"), "wb") as key_file:
+        for pos, idx in enumerate(order):
+            key = keys[idx]
+            if not distinct or key != distinct[-1]:
+                key_bytes = key.encode("utf-8")
+                key_file.write(key_bytes)
+                key_offsets.append(key_offsets[-1] + len(key_bytes))
+                distinct.append(key)
+                starts.append(pos)
+    starts.append(len(order))
+    hashes = [slug_hash(key.encode("utf-8")) for key in distinct]
+    np.save(
+        lexicon_path(name, kind + ".key_offsets.npy"),
+        np.array(key_offsets, dtype=np.int64),
+    )
+    np.save(lexicon_path(name, kind + ".starts.npy"), np.array(starts, dtype=np.int64))
+    np.save(lexicon_path(name, kind + ".ids.npy"), np.array(order, dtype=np.int32))
+    np.save(lexicon_path(name, kind + ".hash.npy"), build_hash_table(hashes))
+
+
+def write_lexicon(name, rows):
+    """
+    Compile a lexicon from an iterable of (slug, freq, text) rows, which must
+    be sorted by slug with no duplicates.
+    """
+    os.makedirs(wordlist_path("lexicon"), exist_ok=True)
+    freqs = []
+    slug_offsets = [0]
+    text_offsets = [0]
+    hashes = []
+    trie = TrieBuilder()
+    with open(lexicon_path(name, "slugs.bin"), "wb") as slug_file, open(
+        lexicon_path(name, "texts.bin"), "wb"
+    ) as text_file:
+        for i, (slug, freq, text) in enumerate(rows):
+            slug_bytes = slug.encode("ascii")
+            text_bytes = text.encode("utf-8")
+            slug_file.write(slug_bytes)
+            text_file.write(text_bytes)
+            slug_offsets.append(slug_offsets[-1] + len(slug_bytes))
+            text_offsets.append(text_offsets[-1] + len(text_bytes))
+            freqs.append(freq)
+            hashes.append(slug_hash(slug_bytes))
+            trie.add(slug_bytes, i)
+
+            if i % 100000 == 0:
+                print("\t%s,%s" % (text, freq))
+
+    np.save(lexicon_path(name, "freqs.npy"), np.array(freqs, dtype=np.int64))
+    np.save(
+        lexicon_path(name, "slug_offsets.npy"), np.array(slug_offsets, dtype=np.int64)
+    )
+    np.save(
+        lexicon_path(name, "text_offsets.npy"), np.array(text_offsets, dtype=np.int64)
+    )
+    np.save(lexicon_path(name, "hash.npy"), build_hash_table(hashes))
+
+    edges, labels, targets, words = trie.arrays()
+    with open(lexicon_path(name, "trie_labels.bin"), "wb") as label_file:
+        label_file.write(labels)
+    np.save(lexicon_path(name, "trie_edges.npy"), edges)
+    np.save(lexicon_path(name, "trie_targets.npy"), targets)
+    np.save(lexicon_path(name, "trie_words.npy"), words)
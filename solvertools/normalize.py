@@ -1,4 +1,9 @@
 from unidecode import unidecode
+from collections import deque
+from functools import lru_cache
+from itertools import islice
+import multiprocessing
+import os
 import re
 
 
@@ -9,6 +14,11 @@ PUNCTUATION_RE = re.compile(r"[^A-Za-z0-9' ]")
 PARENTHESIS_RE = re.compile(r'[_ ]\(.*\)')
 SPACES_RE = re.compile(r'  +')
 
+# How many Wikipedia links to send to a worker process at a time, and how
+# many transliterations of titles to remember in each process
+WP_LINK_CHUNK_SIZE = 10000
+UNIDECODE_CACHE_SIZE = 2 ** 18
+
 def slugify(text):
     """
     Return a text as a sequence of letters. No spaces, digits, hyphens,
@@ -66,13 +76,56 @@ def fix_entities(text):
     return text.replace('&amp;', '&').replace('&lt;', '<').replace('&gt;', '>').replace('&quot;', '"')
 
 
+# The same titles show up over and over in the Wikipedia links dump, and
+# unidecode is the slowest step of normalizing them
+cached_unidecode = lru_cache(maxsize=UNIDECODE_CACHE_SIZE)(unidecode)
+
+
 def normalize_wp_link(text):
     text = text.split('#')[0]
     text = PARENTHESIS_RE.sub('', text)
-    text = unidecode(text)
+    text = cached_unidecode(text)
     text = fix_entities(text)
     text = text.replace("\\'", "'").replace('-', ' ').replace('_', ' ').replace('&', ' AND ').replace('/', ' ').replace('List of ', '').replace('History of ', '')
     text = PUNCTUATION_RE.sub('', text)
     words = [transform_simple_numbers(word).upper() for word in text.split()]
     return SPACES_RE.sub(' ', ' '.join(words)).strip()
 
+
+def _normalize_wp_chunk(texts):
+    return [normalize_wp_link(text) for text in texts]
+
+
+def normalize_wp_links(texts, processes=None, chunk_size=WP_LINK_CHUNK_SIZE):
+    """
+    Apply `normalize_wp_link` to each of an iterable of texts, yielding the
+    results in the same order.
+
+    The texts are normalized in chunks by a pool of `processes` worker
+    processes (by default, one per CPU). Only a couple of chunks per process
+    are read ahead of the results, so this can stream through a file of
+    tens of millions of links without holding it in memory.
+
+        >>> list(normalize_wp_links(['Café_(film)', 'List of 7 wonders'], processes=1))
+        ['CAFE', 'SEVEN WONDERS']
+    """
+    texts = iter(texts)
+    chunks = iter(lambda: list(islice(texts, chunk_size)), [])
+    if processes == 1:
+        for chunk in chunks:
+            yield from _normalize_wp_chunk(chunk)
+        return
+
+    max_pending = 2 * (processes or os.cpu_count() or 1)
+    pool = multiprocessing.get_context('spawn').Pool(processes)
+    try:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(_normalize_wp_chunk, (chunk,)))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
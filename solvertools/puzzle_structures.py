@@ -2,7 +2,7 @@ from solvertools.util import data_path
 from solvertools.wordlist import WORDS
 from solvertools.normalize import slugify, alphanumeric
 from solvertools.regextools import regex_index, regex_len
-from itertools import permutations
+from itertools import permutations, islice
 from natsort import natsorted
 import csv
 import re
@@ -133,21 +133,35 @@ def brute_force_diagonalize(answers, wordlist=WORDS, quiet=False):
     results = []
     seen = set()
     answers = [parse_cell(word) for word in answers]
+    diagonals = _iter_diagonals(answers, quiet)
+    while True:
+        # Score the diagonals in batches, which is much faster than one at
+        # a time
+        batch = list(islice(diagonals, 1000))
+        if not batch:
+            break
+        for found in wordlist.search_many(batch, count=1, use_cromulence=True):
+            if found:
+                logprob, text = found[0]
+                slug = slugify(text)
+                if slug not in seen:
+                    results.append((logprob, text, None))
+                    seen.add(slug)
+    return wordlist.show_best_results(results)
+
+
+def _iter_diagonals(answers, quiet=False):
+    """
+    Get the diagonal of each permutation of the answers, skipping the ones
+    where the diagonal runs off the end of a word.
+    """
     for i, permutation in enumerate(permutations(answers)):
         if not quiet and i > 0 and i % 10000 == 0:
             print("Tried %d permutations" % i)
         try:
-            diag = diagonalize(permutation)
+            yield diagonalize(permutation)
         except IndexError:
             continue
-        found = wordlist.search(diag, count=1, use_cromulence=True)
-        if found:
-            logprob, text = found[0]
-            slug = slugify(text)
-            if slug not in seen:
-                results.append((logprob, text, None))
-                seen.add(slug)
-    return wordlist.show_best_results(results)
 
 
 def resolve(item):
@@ -246,10 +260,15 @@ def index_all_the_things(grid, count=20):
     best_logprob = -1000
     results = []
     seen = set()
-    for pattern, info in _try_indexing(data, titles):
-        if DIGITS_RE.search(pattern):
-            continue
-        found = WORDS.search(pattern, count=5, use_cromulence=True)
+    attempts = [
+        (pattern, info)
+        for pattern, info in _try_indexing(data, titles)
+        if not DIGITS_RE.search(pattern)
+    ]
+    found_lists = WORDS.search_many(
+        [pattern for pattern, info in attempts], count=5, use_cromulence=True
+    )
+    for (pattern, info), found in zip(attempts, found_lists):
         for logprob, text in found:
             if text not in seen:
                 seen.add(text)
@@ -1,20 +1,549 @@
 """
 Wacky tools for slicing and dicing regexes.
+
+We parse regexes ourselves, instead of using Python's `sre_parse`, which is
+deprecated and wasn't meant to be used from outside the `re` module. The
+parser handles the subset of regex syntax that comes up in puzzles:
+literals, character classes, `.`, groups, alternation, repeats, and
+anchors. It turns a regex into a tree of nodes, each of which knows the
+minimum and maximum length of what it matches, and how to write itself
+back out as a regex.
+
+    >>> parse('fa(la){2,}')
+    Sequence('fa(la){2,}')
+    >>> parse('fa(la){2,}').items
+    (Literal('f'), Literal('a'), Repeat('(la){2,}'))
+
+Like `sre_parse`, the parser simplifies alternations where it can, by
+factoring out common prefixes and by turning alternations of single
+characters into character classes:
+
+    >>> round_trip('(ab|ac)')
+    '(a[bc])'
+    >>> round_trip('b|a|t')
+    '[bat]'
 """
-from sre_parse import parse, CATEGORIES, SPECIAL_CHARS, SubPattern
-from sre_constants import MAXREPEAT   # this is a quantity, not an enum
-from sre_constants import (
-    MAX_REPEAT, LITERAL, IN, CATEGORY, ANY, SUBPATTERN, BRANCH,
-    AT_BEGINNING, AT_END, NOT_LITERAL, NEGATE
-)
+from functools import lru_cache
 import re
+import string
+
+from solvertools.caches import make_cache
+
+
+class _MaxRepeat(int):
+    """
+    The number we use as the length of things that can be infinitely long.
+    It's the same number that `sre_parse` uses, but with a more helpful repr.
+    """
+
+    def __repr__(self):
+        return 'MAXREPEAT'
+
+
+MAXREPEAT = _MaxRepeat(4294967295)
+
+# How many positions each PositionTable remembers. A regex that can be
+# infinitely long, like '.*', has no end of positions to ask about.
+POSITION_CACHE_SIZE = 256
+
+_MISSING = object()
+
+REGEX_RE = re.compile(r"[\[\]+*?.(){}|^$\\]")
+
+# Characters that need a backslash in front of them to be literal, outside
+# and inside of a character class
+SPECIAL_CHARS = ".\\[{()*+?^$|"
+CLASS_SPECIAL_CHARS = "\\[]^-"
+
+CATEGORY_ESCAPES = 'dDwWsS'
+ANCHOR_ESCAPES = 'bBAZ'
+SIMPLE_ESCAPES = {
+    'a': '\a', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v',
+    '0': '\0'
+}
+REPEAT_RE = re.compile(r"\{(\d*)(?:(,)(\d*))?\}")
+
+
+class Node:
+    """
+    A node in a parsed regex. Every node has the text of the regex it came
+    from (after simplifying), and the minimum and maximum lengths of the
+    strings it matches.
+    """
+    __slots__ = ('text', 'min_len', 'max_len')
+
+    def choices_at(self, index):
+        """
+        Get a list of the single-character nodes that could match at
+        position `index` of a string that this node matches.
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.text)
+
+
+class Literal(Node):
+    "A single character, matched literally."
+    __slots__ = ('char',)
+
+    def __init__(self, char):
+        self.char = char
+        self.text = '\\' + char if char in SPECIAL_CHARS else char
+        self.min_len = self.max_len = 1
 
+    def choices_at(self, index):
+        return [self] if index == 0 else []
+
+
+class Any(Node):
+    "The `.` that matches any character."
+    __slots__ = ()
+
+    def __init__(self):
+        self.text = '.'
+        self.min_len = self.max_len = 1
+
+    def choices_at(self, index):
+        return [self] if index == 0 else []
+
+
+class CharClass(Node):
+    """
+    A set of characters, possibly negated. Its items are tuples of
+    ('char', c), ('range', start, end), or ('category', letter) for escapes
+    such as `\\d`.
+    """
+    __slots__ = ('items', 'negated')
+
+    def __init__(self, items, negated=False):
+        self.items = tuple(items)
+        self.negated = negated
+        if not negated and len(self.items) == 1 and self.items[0][0] == 'category':
+            self.text = '\\' + self.items[0][1]
+        else:
+            self.text = '[%s%s]' % (
+                '^' if negated else '',
+                ''.join(_unparse_class_item(item) for item in self.items)
+            )
+        self.min_len = self.max_len = 1
+
+    def choices_at(self, index):
+        return [self] if index == 0 else []
+
+
+class Anchor(Node):
+    "A zero-width assertion, such as `^` or `$`."
+    __slots__ = ()
+
+    def __init__(self, text):
+        self.text = text
+        self.min_len = self.max_len = 0
+
+    def choices_at(self, index):
+        return []
+
+
+class Sequence(Node):
+    """
+    A sequence of nodes that match one after another. This is what `parse`
+    returns.
+    """
+    __slots__ = ('items',)
+
+    def __init__(self, items):
+        self.items = tuple(items)
+        texts = []
+        for item in self.items:
+            if isinstance(item, Branch) and len(self.items) > 1:
+                texts.append('(%s)' % item.text)
+            else:
+                texts.append(item.text)
+        self.text = ''.join(texts)
+        self.min_len = sum(item.min_len for item in self.items)
+        self.max_len = min(MAXREPEAT, sum(item.max_len for item in self.items))
+
+    def choices_at(self, index):
+        lo_counter = hi_counter = 0
+        choices = []
+        for sub in self.items:
+            next_lo = lo_counter + sub.min_len
+            next_hi = hi_counter + sub.max_len
+            if index < lo_counter:
+                break
+            elif lo_counter <= index < next_hi:
+                # Offsets past the index can't matter, and stopping there
+                # keeps us from counting up to MAXREPEAT after an unbounded
+                # repeat
+                for offset in range(lo_counter, min(hi_counter, index) + 1):
+                    choices.extend(sub.choices_at(index - offset))
+            lo_counter, hi_counter = next_lo, next_hi
+        return choices
+
+
+class Group(Node):
+    "A parenthesized group."
+    __slots__ = ('body', 'capturing')
+
+    def __init__(self, body, capturing=True):
+        self.body = body
+        self.capturing = capturing
+        self.text = '%s%s)' % ('(' if capturing else '(?:', body.text)
+        self.min_len = body.min_len
+        self.max_len = body.max_len
+
+    def choices_at(self, index):
+        return self.body.choices_at(index)
+
+
+class Branch(Node):
+    """
+    An alternation between sequences. This doesn't take into account the
+    fact that some lengths in between the minimum and maximum may be
+    impossible.
+    """
+    __slots__ = ('alternatives',)
+
+    def __init__(self, alternatives):
+        self.alternatives = tuple(alternatives)
+        self.text = '|'.join(alt.text for alt in self.alternatives)
+        self.min_len = min(alt.min_len for alt in self.alternatives)
+        self.max_len = max(alt.max_len for alt in self.alternatives)
+
+    def choices_at(self, index):
+        choices = []
+        for alt in self.alternatives:
+            choices.extend(alt.choices_at(index))
+        return choices
+
+
+class Repeat(Node):
+    "A node repeated between `min_repeat` and `max_repeat` times."
+    __slots__ = ('item', 'min_repeat', 'max_repeat', 'lazy')
+
+    def __init__(self, item, min_repeat, max_repeat, lazy=False):
+        self.item = item
+        self.min_repeat = min_repeat
+        self.max_repeat = max_repeat
+        self.lazy = lazy
+        if min_repeat == 0 and max_repeat == MAXREPEAT:
+            symbol = '*'
+        elif min_repeat == 0 and max_repeat == 1:
+            symbol = '?'
+        elif min_repeat == 1 and max_repeat == MAXREPEAT:
+            symbol = '+'
+        elif max_repeat == MAXREPEAT:
+            symbol = '{%d,}' % min_repeat
+        elif min_repeat == max_repeat:
+            symbol = '{%d}' % min_repeat
+        else:
+            symbol = '{%d,%d}' % (min_repeat, max_repeat)
+        self.text = item.text + symbol + ('?' if lazy else '')
+        self.min_len = min_repeat * item.min_len
+        self.max_len = min(MAXREPEAT, max_repeat * item.max_len)
 
-REVERSE_CATEGORIES = {}
-for key, value in CATEGORIES.items():
-    REVERSE_CATEGORIES[str(value)] = key
+    def choices_at(self, index):
+        # We don't care about things that take up 0 characters
+        lo = max(self.item.min_len, 1)
+        max_relevant_repeat = min(index // lo + 1, self.max_repeat)
+        return Sequence([self.item] * max_relevant_repeat).choices_at(index)
 
-REGEX_RE = re.compile(r"[\[\]+.(){}|]")
+
+def _unparse_class_char(char):
+    if char in CLASS_SPECIAL_CHARS:
+        return '\\' + char
+    return char
+
+
+def _unparse_class_item(item):
+    if item[0] == 'char':
+        return _unparse_class_char(item[1])
+    elif item[0] == 'range':
+        return _unparse_class_char(item[1]) + '-' + _unparse_class_char(item[2])
+    else:
+        return '\\' + item[1]
+
+
+def _uniq(items):
+    return list(dict.fromkeys(items))
+
+
+def _char_class(items, negated=False):
+    """
+    Make a node for a character class, which is a plain Literal if it's
+    just one character.
+    """
+    items = _uniq(items)
+    if not negated and len(items) == 1 and items[0][0] == 'char':
+        return Literal(items[0][1])
+    return CharClass(items, negated)
+
+
+def _class_items(node):
+    """
+    Get the items of a node as a character class, or None if it can't be
+    merged into a character class with other things.
+    """
+    if isinstance(node, Literal):
+        return [('char', node.char)]
+    elif isinstance(node, CharClass) and not node.negated:
+        return list(node.items)
+    return None
+
+
+def _make_branch(alternatives):
+    """
+    Combine alternatives, which are lists of nodes, into a list of nodes that
+    matches any of them. As in `sre_parse`, a prefix that they all share is
+    moved out in front, and alternatives of single characters become a
+    character class.
+    """
+    def uniq_alternatives(alts):
+        seen = {}
+        for alt in alts:
+            seen.setdefault(tuple(node.text for node in alt), alt)
+        return list(seen.values())
+
+    alternatives = uniq_alternatives(alternatives)
+    prefix = []
+    while len(alternatives) > 1 and all(alternatives):
+        first = alternatives[0][0].text
+        if any(alt[0].text != first for alt in alternatives):
+            break
+        prefix.append(alternatives[0][0])
+        alternatives = uniq_alternatives([alt[1:] for alt in alternatives])
+
+    if len(alternatives) == 1:
+        return prefix + list(alternatives[0])
+
+    merged = []
+    for alt in alternatives:
+        items = _class_items(alt[0]) if len(alt) == 1 else None
+        if items is None:
+            break
+        merged.extend(items)
+    else:
+        return prefix + [_char_class(merged)]
+    return prefix + [Branch([Sequence(alt) for alt in alternatives])]
+
+
+class _Parser:
+    """
+    A recursive-descent parser for the regexes we understand. Syntax errors
+    raise `re.error`, just like the `re` module, and valid syntax that we
+    don't handle raises ValueError.
+    """
+
+    def __init__(self, regex):
+        self.regex = regex
+        self.pos = 0
+
+    def error(self, message):
+        raise re.error(message, self.regex, self.pos)
+
+    def peek(self):
+        if self.pos < len(self.regex):
+            return self.regex[self.pos]
+        return None
+
+    def parse(self):
+        items = self.parse_branch()
+        if self.pos < len(self.regex):
+            self.error("unbalanced parenthesis")
+        return Sequence(items)
+
+    def parse_branch(self):
+        alternatives = [self.parse_sequence()]
+        while self.peek() == '|':
+            self.pos += 1
+            alternatives.append(self.parse_sequence())
+        return _make_branch(alternatives)
+
+    def parse_sequence(self):
+        items = []
+        while self.peek() is not None and self.peek() not in '|)':
+            atom = self.parse_atom()
+            node = self.parse_repeat(atom)
+            if node is atom and isinstance(atom, Group) and not atom.capturing:
+                # An unrepeated non-capturing group is just its contents
+                items.extend(atom.body.items)
+            else:
+                items.append(node)
+        return items
+
+    def parse_atom(self):
+        char = self.regex[self.pos]
+        if char == '(':
+            return self.parse_group()
+        elif char == '[':
+            return self.parse_class()
+        elif char == '\\':
+            kind, value = self.parse_escape(in_class=False)
+            if kind == 'char':
+                return Literal(value)
+            elif kind == 'category':
+                return CharClass([(kind, value)])
+            else:
+                return Anchor('\\' + value)
+        elif char in '*+?' or (
+            char == '{' and REPEAT_RE.match(self.regex, self.pos)
+        ):
+            self.error("nothing to repeat")
+        self.pos += 1
+        if char == '.':
+            return Any()
+        elif char in '^$':
+            return Anchor(char)
+        else:
+            return Literal(char)
+
+    def parse_group(self):
+        capturing = True
+        self.pos += 1
+        if self.regex.startswith('?:', self.pos):
+            capturing = False
+            self.pos += 2
+        elif self.peek() == '?':
+            raise ValueError(
+                "I don't know what to do with this regex group: %s"
+                % self.regex[self.pos - 1:]
+            )
+        body = Sequence(self.parse_branch())
+        if self.peek() != ')':
+            self.error("missing ), unterminated subpattern")
+        self.pos += 1
+        return Group(body, capturing)
+
+    def parse_repeat(self, atom):
+        char = self.peek()
+        if char is None:
+            return atom
+        if char == '*':
+            lo, hi = 0, MAXREPEAT
+            self.pos += 1
+        elif char == '+':
+            lo, hi = 1, MAXREPEAT
+            self.pos += 1
+        elif char == '?':
+            lo, hi = 0, 1
+            self.pos += 1
+        elif char == '{' and REPEAT_RE.match(self.regex, self.pos):
+            match = REPEAT_RE.match(self.regex, self.pos)
+            lo_text, comma, hi_text = match.groups()
+            lo = int(lo_text) if lo_text else 0
+            if hi_text:
+                hi = int(hi_text)
+            elif comma:
+                hi = MAXREPEAT
+            else:
+                hi = lo
+            if hi < lo:
+                self.error("min repeat greater than max repeat")
+            self.pos = match.end()
+        else:
+            return atom
+        if isinstance(atom, Anchor):
+            self.error("nothing to repeat")
+        lazy = False
+        if self.peek() == '?':
+            lazy = True
+            self.pos += 1
+        if self.peek() is not None and (
+            self.peek() in '*+?' or REPEAT_RE.match(self.regex, self.pos)
+        ):
+            self.error("multiple repeat")
+        return Repeat(atom, lo, hi, lazy)
+
+    def parse_escape(self, in_class):
+        """
+        Parse a backslash escape, returning ('char', c), ('category', c), or
+        ('anchor', c).
+        """
+        if self.pos + 1 >= len(self.regex):
+            self.error("bad escape (end of pattern)")
+        char = self.regex[self.pos + 1]
+        self.pos += 2
+        if char in CATEGORY_ESCAPES:
+            return 'category', char
+        elif in_class and char == 'b':
+            return 'char', '\b'
+        elif char in SIMPLE_ESCAPES:
+            return 'char', SIMPLE_ESCAPES[char]
+        elif not in_class and char in ANCHOR_ESCAPES:
+            return 'anchor', char
+        elif char == 'x':
+            digits = self.regex[self.pos:self.pos + 2]
+            if len(digits) < 2 or any(
+                digit not in string.hexdigits for digit in digits
+            ):
+                self.error("incomplete escape \\x" + digits)
+            self.pos += 2
+            return 'char', chr(int(digits, 16))
+        elif char in string.digits:
+            raise ValueError("Back-references aren't supported: \\" + char)
+        elif char in string.ascii_letters:
+            self.error("bad escape \\" + char)
+        return 'char', char
+
+    def parse_class(self):
+        self.pos += 1
+        negated = False
+        if self.peek() == '^':
+            negated = True
+            self.pos += 1
+        items = []
+        first = True
+        while True:
+            char = self.peek()
+            if char is None:
+                self.error("unterminated character set")
+            if char == ']' and not first:
+                self.pos += 1
+                break
+            first = False
+            start = self.parse_class_char()
+            if (
+                start[0] == 'char' and self.peek() == '-'
+                and self.regex[self.pos + 1:self.pos + 2] not in ('', ']')
+            ):
+                self.pos += 1
+                end = self.parse_class_char()
+                if end[0] != 'char':
+                    self.error("bad character range")
+                if end[1] < start[1]:
+                    self.error("bad character range")
+                items.append(('range', start[1], end[1]))
+            else:
+                items.append(start)
+        return _char_class(items, negated)
+
+    def parse_class_char(self):
+        if self.peek() == '\\':
+            return self.parse_escape(in_class=True)
+        char = self.regex[self.pos]
+        self.pos += 1
+        return 'char', char
+
+
+@lru_cache(maxsize=10000)
+def parse(regex):
+    """
+    Parse a regex into a Sequence of nodes. Parsed regexes are cached and
+    shared, so they shouldn't be modified.
+    """
+    return _Parser(regex).parse()
+
+
+def unparse(struct):
+    """
+    Turn a parsed regex, or a list of nodes, back into a regex.
+    """
+    if isinstance(struct, (list, tuple)):
+        return Sequence(struct).text
+    elif isinstance(struct, Node):
+        return struct.text
+    else:
+        raise TypeError("%s doesn't belong in a regex structure" % struct)
 
 
 def regex_sequence(strings):
@@ -29,8 +558,7 @@ def regex_sequence(strings):
     """
     pattern = []
     for s in strings:
-        parsed = parse(s)
-        pattern.extend(_wrap_branches(parsed))
+        pattern.extend(parse(s).items)
     return unparse(pattern)
 
 
@@ -49,20 +577,12 @@ def is_exact(string):
         False
         >>> is_exact('ba[rz]')
         False
+        >>> is_exact('colou?r')
+        False
     """
     return not REGEX_RE.search(string)
 
 
-def _wrap_branches(struct):
-    result = []
-    for op, data in struct:
-        if op == BRANCH:
-            result.append( (SUBPATTERN, (1, [(op, data)])) )
-        else:
-            result.append( (op, data) )
-    return result
-
-
 def regex_len(regex):
     """
     Returns a tuple of the minimum and maximum possible length string that a
@@ -83,8 +603,11 @@ def regex_len(regex):
         (3, MAXREPEAT)
         >>> regex_len('s?e?q?u?e?n?c?e?')
         (0, 8)
+        >>> regex_len('^test$')
+        (4, 4)
     """
-    return _regex_len_pattern(parse(regex))
+    parsed = parse(regex)
+    return parsed.min_len, parsed.max_len
 
 
 def regex_pieces(regex):
@@ -94,80 +617,38 @@ def regex_pieces(regex):
         >>> regex_pieces('[abc]de+')
         ['[abc]', 'd', 'e+']
     """
-    result = []
-    for piece in parse(regex):
-        result.append(unparse([piece]))
-    return result
-
-
-def _regex_len_pattern(pattern):
-    "Returns the minimum and maximum length of a parsed regex pattern."
-    assert isinstance(pattern, (list, SubPattern)), type(pattern)
-    lo = hi = 0
-    for op, data in pattern:
-        if op in (LITERAL, IN, CATEGORY, ANY):
-            sub_lo = sub_hi = 1
-        elif op == SUBPATTERN:
-            sub_lo, sub_hi = _regex_len_pattern(data[-1])
-        elif op == BRANCH:
-            sub_lo, sub_hi = _regex_len_branch(data[-1])
-        elif op == MAX_REPEAT:
-            sub_lo, sub_hi = _regex_len_repeat(data)
-        elif op == AT_BEGINNING:
-            sub_lo = sub_hi = 0
-        elif op == AT_END:
-            sub_lo = sub_hi = 0
-        elif op == NOT_LITERAL:
-            sub_lo = sub_hi = 1
-        elif op == NEGATE:
-            sub_lo = sub_hi = 0
-        else:
-            raise ValueError(
-                "I don't know what to do with this regex operation: %s %s, %s"
-                % (op, type(op), data)
-            )
-        lo += sub_lo
-        hi += sub_hi
-    return lo, min(MAXREPEAT, hi)
-
+    return [item.text for item in parse(regex).items]
 
-def _regex_len_branch(branches):
-    """
-    Returns the minimum and maximum length of a regex branch.
 
-    This does not take into account the fact that some lengths in between may
-    be impossible.
+def round_trip(regex):
     """
-    lo = MAXREPEAT
-    hi = 0
-    for branch in branches:
-        sub_lo, sub_hi = _regex_len_pattern(branch)
-        lo = min(lo, sub_lo)
-        hi = max(hi, sub_hi)
-    return lo, hi
-
+    Send a regex through the parser and unparser, possibly simplifying it.
 
-def _regex_len_repeat(data):
-    """
-    Return the minimum and maximum length of a repeating expression.
+        >>> round_trip('x{2,}y{3,3}')
+        'x{2,}y{3}'
     """
-    min_repeat, max_repeat, pattern = data
-    lo, hi = _regex_len_pattern(pattern)
-    return min_repeat * lo, min(MAXREPEAT, max_repeat * hi)
+    return parse(regex).text
 
 
-def round_trip(regex):
+def _combine_choices(choices):
     """
-    Send a regex through the parser and unparser, possibly simplifying it.
+    Combine the single-character nodes that can appear in some position
+    into one regex, or None if there are none.
     """
-    return unparse(parse(regex))
+    if not choices:
+        return None
+    # If any of the choices is 'any', it overrules everything else.
+    for choice in choices:
+        if isinstance(choice, Any):
+            return choice.text
+    return unparse(_make_branch([[choice] for choice in choices]))
 
 
 def regex_index(regex, index):
     """
     Index into a regex, returning a smaller regex of the things that match
     in that position.
-        
+
         >>> regex_index('test', 0)
         't'
         >>> regex_index('t?est', 0)
@@ -179,42 +660,72 @@ def regex_index(regex, index):
         >>> regex_index('.*', 99)
         '.'
     """
-    choices = _regex_index_pattern(parse(regex), index)
-    if len(choices) == 0:
+    if index < 0:
+        raise NotImplementedError
+    entry = position_table(regex)[index]
+    if entry is None:
         raise IndexError
-    elif len(choices) == 1:
-        return unparse(choices[0])
-    else:
-        return round_trip(unparse((BRANCH, (None, choices))))
+    return entry
 
 
-def _regex_index(struct, index):
-    if isinstance(struct, (list, SubPattern)):
-        return _regex_index_pattern(struct, index)
-    else:
-        opcode, data = struct
-        if opcode in (LITERAL, IN, CATEGORY, ANY, NOT_LITERAL):
-            if index == 0:
-                return [[struct]]
-            else:
-                return []
-        elif opcode == SUBPATTERN:
-            return _regex_index_pattern(data[-1], index)
-        elif opcode == BRANCH:
-            return _regex_index_branch(data[-1], index)
-        elif opcode == MAX_REPEAT:
-            return _regex_index_repeat(data, index)
-        elif opcode == NEGATE:
-            print(struct)
-            raise NotImplementedError
+class PositionTable:
+    """
+    The things that a regex can match at each position, worked out once per
+    position and remembered. `table[i]` is what `regex_index` returns for
+    index `i`, or None if nothing can be there.
+
+    Wordlist.search and index_all_the_things ask for the same positions of
+    the same pattern many times over, and this saves walking the regex every
+    time.
+
+        >>> table = position_table('t?est')
+        >>> table.length
+        (3, 4)
+        >>> [table[i] for i in range(5)]
+        ['[te]', '[es]', '[st]', 't', None]
+
+    Only the most recently used POSITION_CACHE_SIZE positions are kept:
+
+        >>> table = position_table('a.*')
+        >>> [table[i] for i in range(1000)][-1]
+        '.'
+        >>> len(table.entries) == POSITION_CACHE_SIZE
+        True
+    """
+
+    def __init__(self, regex):
+        self.regex = regex
+        self.parsed = parse(regex)
+        self.length = (self.parsed.min_len, self.parsed.max_len)
+        self.entries = make_cache('lru', POSITION_CACHE_SIZE)
+
+    def __getitem__(self, index):
+        entry = self.entries.get(index, _MISSING)
+        if entry is not _MISSING:
+            return entry
+        if index >= self.length[1] and self.length[1] != MAXREPEAT:
+            entry = None
         else:
-            raise ValueError("I don't know what to do with this regex: "
-                             + str(struct))
+            entry = _combine_choices(self.parsed.choices_at(index))
+        self.entries.put(index, entry)
+        return entry
+
+    def __repr__(self):
+        return 'PositionTable(%r)' % self.regex
+
+
+@lru_cache(maxsize=10000)
+def position_table(regex):
+    """
+    Get the PositionTable for a regex, which is shared by everything that
+    asks about the same regex.
+    """
+    return PositionTable(regex)
 
 
 def regex_slice(expr, start, end):
     """
-    Get a slice of a regex by calling regex_index on each index.
+    Get a slice of a regex by looking up each index in its PositionTable.
 
     Note that this can return expressions that are overly general: for example,
     it can mix characters from both branches of a regex. Being more specific
@@ -230,159 +741,14 @@ def regex_slice(expr, start, end):
     """
     if start < 0 or end < 0:
         raise NotImplementedError("Can't take negative slices of a regex yet")
+    table = position_table(expr)
     result = ''
     for index in range(start, end):
-        choices = _regex_index_pattern(parse(expr), index)
-        if len(choices) == 0:
+        regex = table[index]
+        if regex is None:
             return None
-        elif len(choices) == 1:
-            regex = unparse(choices[0])
-            result += regex
+        elif '|' in regex:
+            result += '(%s)' % (regex,)
         else:
-            regex = round_trip(unparse((BRANCH, (None, choices))))
-            if '|' in regex:
-                result += '(%s)' % (regex,)
-            else:
-                result += regex
+            result += regex
     return result
-
-
-def _regex_index_branch(branches, index):
-    choices = []
-    for branch in branches:
-        choices.extend(_regex_index_pattern(branch, index))
-    return choices
-
-
-def _regex_index_repeat(data, index):
-    min_repeat, max_repeat, pattern = data
-    lo, hi = _regex_len_pattern(pattern)
-    lo = max(lo, 1)  # we don't care about things that take up 0 characters
-    max_relevant_repeat = min(index // lo + 1, max_repeat)
-    newpattern = list(pattern) * max_relevant_repeat
-    return _regex_index_pattern(newpattern, index)
-
-
-def _regex_index_pattern(pattern, index):
-    if isinstance(index, slice):
-        # we might come up with a clever way to do this
-        raise NotImplementedError
-
-    if index < 0:
-        # This is an easier case that's still not done yet
-        raise NotImplementedError
-
-    lo_counter = hi_counter = 0
-    choices = []
-    for sub in pattern:
-        lo, hi = _regex_len_pattern([sub])
-        next_lo = lo_counter + lo
-        next_hi = hi_counter + hi
-        if index < lo_counter:
-            break
-        elif lo_counter <= index < next_hi:
-            for offset in range(lo_counter, hi_counter+1):
-                sub_index = index - offset
-                if sub_index >= 0:
-                    choices.extend(_regex_index(sub, sub_index))
-        lo_counter, hi_counter = next_lo, next_hi
-    
-    # if any of the choices is 'any', it overrules everything else.
-    for choice in choices:
-        # make sure our choices are single characters
-        assert len(choice) == 1
-        op, data = choice[0]
-        if op == 'any':
-            return [choice]
-    return choices
-
-
-def unparse(struct):
-    if isinstance(struct, list):
-        return ''.join(unparse(x) for x in struct)        
-    if isinstance(struct, SubPattern):
-        return ''.join(unparse(x) for x in struct)
-    elif isinstance(struct, tuple):
-        opcode, data = struct
-        func_name = '_unparse_%s' % str(opcode).lower()
-        if str(struct) in REVERSE_CATEGORIES:
-            return REVERSE_CATEGORIES[str(struct)]
-        elif func_name in globals():
-            unparser = globals()[func_name]
-            return unparser(data)
-        else:
-            raise ValueError("I don't know what to do with this regex: "
-                             + str(struct))
-    else:
-        raise TypeError("%s doesn't belong in a regex structure" % struct)
-
-
-def _unparse_literal(data):
-    char = chr(data)
-    if char in SPECIAL_CHARS:
-        return '\\' + char
-    else:
-        return char
-
-
-def _unparse_any(data):
-    return '.'
-
-
-def _unparse_range(data):
-    start, end = data
-    return chr(start) + '-' + chr(end)
-
-
-def _unparse_in(data):
-    return '[' + unparse(data) + ']'
-
-
-def _unparse_category(data):
-    return REVERSE_CATEGORIES[data]
-
-
-def _unparse_subpattern(data):
-    return '(' + unparse(data[-1]) + ')'
-
-
-def _unparse_branch(data):
-    return '|'.join(unparse(branch) for branch in data[-1])
-
-
-def _unparse_max_repeat(data):
-    lo, hi, value = data
-    if lo == 0 and hi == MAXREPEAT:
-        symbol = '*'
-    elif lo == 0 and hi == 1:
-        symbol = '?'
-    elif lo == 1 and hi == MAXREPEAT:
-        symbol = '+'
-    else:
-        symbol = '{%d,%d}' % (lo, hi)
-    return unparse(value) + symbol
-
-
-def _unparse_at(data):
-    if data == AT_BEGINNING:
-        return '^'
-    elif data == AT_END:
-        return '$'
-    else:
-        raise ValueError
-
-
-def _unparse_at_beginning(data):
-    return '^'
-
-
-def _unparse_at_end(data):
-    return '$'
-
-
-def _unparse_not_literal(data):
-    return '[^{}]'.format(chr(data))
-
-
-def _unparse_negate(data):
-    return '^'
\ No newline at end of file
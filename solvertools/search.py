@@ -1,72 +1,443 @@
 from solvertools.wordlist import WORDS
 from solvertools.normalize import slugify, sanitize
+from solvertools.regextools import regex_len
 from solvertools.util import data_path, db_path
+from solvertools.caches import SQLiteCache, make_cache
 from operator import itemgetter
 from collections import defaultdict
 from unidecode import unidecode
-from .conceptnet_numberbatch import load_numberbatch, get_vector, similar_to_term
+from .conceptnet_numberbatch import (
+    VectorStore, load_numberbatch, get_vector, similar_to_term
+)
+import numpy as np
+import os
 import re
 import sqlite3
+import struct
+import sys
+import time
+import zlib
 
 NUMBERBATCH = None
 DB = None
 
+# The results of full-text searches are cached in each process, as tuples of
+# keywords and arrays of scores, and in a database that all the processes
+# share. Each result can have up to 10,000 keywords, so the caches are kept
+# small. The keywords are interned, so results that share keywords share
+# their strings, which go away when no cached result has them any more.
+SEARCH_CACHE_SIZE = 500
+SEARCH_DISK_CACHE_SIZE = 5000
+SEARCH_CACHE = make_cache('lru', SEARCH_CACHE_SIZE)
+SEARCH_DISK_CACHE = None
+SEARCH_DB_VERSION = None
+
+# How many searches were answered from each place, and how long they took
+SEARCH_STATS = {'memory': [0, 0.], 'disk': [0, 0.], 'fts': [0, 0.]}
+
+FTS_OPERATORS = {'AND', 'OR', 'NOT'}
+
+# The clue index is a side table in search.db, clue_candidates, which
+# scripts/build_clue_index.py adds. For each row of `clues`, it has a bitmask
+# of the lengths of the slugs that `db_rank` gives its score to: its
+# keyword's slug, and the slug of each word of the keyword. Lengths over
+# MAX_LENGTH_BIT share a bit. It also has those slugs themselves, with a
+# space before and after each one, so that a GLOB pattern can pick out the
+# rows that give score to slugs that fit a pattern.
+MAX_LENGTH_BIT = 62
+CLUE_INDEX = None
+
+# How many rows to read from a search when they're limited to the rows that
+# can score slugs of the right length or pattern. These are the best-scoring
+# rows, and every one of them counts, so this can be much less than the
+# 10000 rows of an unlimited search.
+FILTERED_SEARCH_LIMIT = 2000
+
+
 def tokenize(text):
     return re.findall("[A-Za-z']+", text)
 
-def query_expand(word):
+def get_numberbatch():
     global NUMBERBATCH
     if NUMBERBATCH is None:
-        NUMBERBATCH = load_numberbatch()
+        if VectorStore.exists():
+            NUMBERBATCH = VectorStore()
+        else:
+            NUMBERBATCH = load_numberbatch()
+    return NUMBERBATCH
+
 
-    similar = similar_to_term(NUMBERBATCH, word, limit=25)
-    sim_words = [word2.replace('"','') for word2, sim in similar.items() if sim >= 0.2]
+def expansion_query(word, similar):
+    """
+    Make a full-text query for a word or any of the (word, similarity)
+    pairs in `similar` that are similar enough to it.
+    """
+    sim_words = [word2.replace('"','') for word2, sim in similar if sim >= 0.2]
     parts = [word] + [word2 for word2 in sim_words if word2 != word]
     query = ' OR '.join('"%s"' % word2 for word2 in parts)
     return '(%s)' % query
 
 
-def db_search(query, limit=10000):
-    global DB
+def query_expand(word):
+    return query_expand_many([word])[0]
+
+
+def query_expand_many(words):
+    """
+    Get the `query_expand` query for each of a list of words, finding the
+    similar words for all of them at once when the vector store is built.
+    """
+    if not words:
+        return []
+    numberbatch = get_numberbatch()
+    if isinstance(numberbatch, VectorStore):
+        similars = numberbatch.similar_to_terms(words, limit=25)
+    else:
+        similars = [
+            similar_to_term(numberbatch, word, limit=25).items() for word in words
+        ]
+    return [expansion_query(word, similar) for word, similar in zip(words, similars)]
+
+
+def normalize_fts_query(query):
+    """
+    Normalize a full-text query for use as a cache key. Terms match in any
+    case, so they're lowercased, but the operators have to stay uppercase.
+
+    >>> normalize_fts_query('("US"  OR "President")')
+    '("us" OR "president")'
+    >>> normalize_fts_query('this or that')
+    'this or that'
+    """
+    return ' '.join(
+        token if token in FTS_OPERATORS or token.startswith('NEAR(') else token.lower()
+        for token in query.split()
+    )
+
+
+def get_search_db():
+    global DB, SEARCH_DB_VERSION
     if DB is None:
-        DB = sqlite3.connect(db_path("search.db"), check_same_thread=False)
+        path = db_path("search.db")
+        DB = sqlite3.connect(path, check_same_thread=False)
+        # Results cached on disk are only good for this version of the
+        # search database
+        stat = os.stat(path)
+        SEARCH_DB_VERSION = '%d:%d' % (stat.st_size, stat.st_mtime_ns)
+    return DB
+
+
+def get_search_disk_cache():
+    """
+    Open the shared cache of search results, if it can be opened.
+    """
+    global SEARCH_DISK_CACHE
+    if SEARCH_DISK_CACHE is None:
+        try:
+            SEARCH_DISK_CACHE = SQLiteCache(
+                db_path("search-cache.db"), SEARCH_DISK_CACHE_SIZE
+            )
+        except sqlite3.Error:
+            SEARCH_DISK_CACHE = False
+    if SEARCH_DISK_CACHE is False:
+        return None
+    return SEARCH_DISK_CACHE
+
+
+def length_bit(length):
+    return 1 << min(length, MAX_LENGTH_BIT)
+
+
+def candidate_lengths(keyword):
+    """
+    Get the bitmask of the lengths of the slugs that a row with this
+    keyword gives credit to.
+
+    >>> bin(candidate_lengths('JOHN WILKES BOOTH'))
+    '0b1000000001110000'
+    """
+    mask = length_bit(len(slugify(keyword)))
+    for part in tokenize(keyword):
+        mask |= length_bit(len(slugify(part)))
+    return mask
+
+
+def _credited_slugs(keyword):
+    return {slugify(keyword)} | {slugify(part) for part in tokenize(keyword)}
+
+
+def candidate_slugs(keyword):
+    """
+    Get the slugs that a row with this keyword gives credit to, in the form
+    that's stored in the clue index.
+
+    >>> candidate_slugs('JOHN WILKES BOOTH')
+    ' booth john johnwilkesbooth wilkes '
+    """
+    return ' %s ' % ' '.join(sorted(_credited_slugs(keyword)))
+
+
+def slug_pattern_text(pattern):
+    """
+    Get the regex that a pattern given to `search` applies to slugs.
+    """
+    return pattern.lstrip('^').rstrip('$').replace(' ', '').lower()
+
+
+def slug_filter(length=None, pattern=None):
+    """
+    Get a function that says whether a slug has the given length and fits
+    the given pattern, or None if neither is given.
+    """
+    if length is None and pattern is None:
+        return None
+    pattern_re = None
+    if pattern is not None:
+        pattern_re = re.compile('^' + slug_pattern_text(pattern) + '$')
+
+    def fits(slug):
+        if length is not None and len(slug) != length:
+            return False
+        return pattern_re is None or pattern_re.match(slug) is not None
 
-    cur = DB.cursor()
-    results = defaultdict(float)
-    for (keyword, negscore) in cur.execute("SELECT keyword, bm25(clues) AS score FROM clues WHERE text MATCH ? LIMIT ?", (query, limit)):
+    return fits
+
+
+def pattern_glob(pattern):
+    """
+    Convert a simple regex pattern for a slug into a GLOB pattern that
+    matches the stored slugs of the rows that give credit to a slug that
+    fits it. Only letters, '.', and character classes are supported;
+    for anything else, this returns None.
+
+    >>> pattern_glob('.a.f....')
+    '* [a-z]a[a-z]f[a-z][a-z][a-z][a-z] *'
+    >>> pattern_glob('^[jkl][def]ft out$')
+    '* [jkl][def]ftout *'
+    >>> pattern_glob('(ab|cd)e') is None
+    True
+    """
+    glob = []
+    for piece in re.findall(r'\[[^\]]*\]|.', slug_pattern_text(pattern)):
+        if piece == '.':
+            glob.append('[a-z]')
+        elif piece.startswith('[') and '\\' not in piece and piece not in ('[]', '[^]'):
+            glob.append(piece)
+        elif 'a' <= piece <= 'z':
+            glob.append(piece)
+        else:
+            return None
+    return '* %s *' % ''.join(glob)
+
+
+def build_clue_index(batch_size=100000):
+    """
+    Add the clue index to search.db.
+    """
+    db = sqlite3.connect(db_path("search.db"))
+    with db:
+        # Older versions of the index had more tables, for bounding scores
+        for table in ('clue_candidates', 'clue_terms', 'clue_length_rows', 'clue_index_info'):
+            db.execute("DROP TABLE IF EXISTS %s" % table)
+        db.execute("CREATE TABLE clue_candidates (id INTEGER PRIMARY KEY, lengths INTEGER, slugs TEXT)")
+        rows = db.execute("SELECT rowid, keyword FROM clues").fetchmany
+        batch = rows(batch_size)
+        while batch:
+            db.executemany(
+                "INSERT INTO clue_candidates (id, lengths, slugs) VALUES (?, ?, ?)",
+                [
+                    (rowid, candidate_lengths(keyword), candidate_slugs(keyword))
+                    for rowid, keyword in batch
+                ],
+            )
+            batch = rows(batch_size)
+    db.close()
+
+
+def has_clue_index():
+    """
+    Find out whether the clue index has been built.
+    """
+    global CLUE_INDEX
+    if CLUE_INDEX is None:
+        try:
+            # Indexes built before slugs were stored can't be used
+            get_search_db().execute("SELECT slugs FROM clue_candidates LIMIT 1")
+            CLUE_INDEX = True
+        except sqlite3.OperationalError:
+            CLUE_INDEX = False
+    return CLUE_INDEX
+
+
+def _intern_keywords(keywords):
+    return tuple(sys.intern(keyword) for keyword in keywords)
+
+
+def _encode_results(keywords, scores):
+    """
+    Pack search results into bytes for the disk cache.
+
+    >>> found = (('CAT', 'DOG'), np.array([2.5, 1.]))
+    >>> keywords, scores = _decode_results(_encode_results(*found))
+    >>> keywords, scores.tolist()
+    (('CAT', 'DOG'), [2.5, 1.0])
+    """
+    return zlib.compress(
+        struct.pack('<I', len(scores)) + scores.tobytes()
+        + '\n'.join(keywords).encode('utf-8')
+    )
+
+
+def _decode_results(data):
+    data = zlib.decompress(data)
+    (count,) = struct.unpack_from('<I', data)
+    end = 4 + count * 8
+    scores = np.frombuffer(data[4:end], dtype=np.float64)
+    keywords = data[end:].decode('utf-8').split('\n') if count else []
+    return _intern_keywords(keywords), scores
+
+
+def _run_search(query, limit, length=None, glob=None):
+    cur = get_search_db().cursor()
+    if (length is not None or glob is not None) and has_clue_index():
+        conditions = ["text MATCH ?"]
+        params = [query]
+        if length is not None:
+            conditions.append("clue_candidates.lengths & ?")
+            params.append(length_bit(length))
+        if glob is not None:
+            conditions.append("clue_candidates.slugs GLOB ?")
+            params.append(glob)
+        rows = cur.execute(
+            "SELECT keyword, bm25(clues) AS score FROM clues "
+            "JOIN clue_candidates ON clue_candidates.id = clues.rowid "
+            "WHERE %s ORDER BY score LIMIT ?" % ' AND '.join(conditions),
+            params + [limit],
+        )
+    else:
+        rows = cur.execute("SELECT keyword, bm25(clues) AS score FROM clues WHERE text MATCH ? LIMIT ?", (query, limit))
+    results = {}
+    for (keyword, negscore) in rows:
         assert negscore < 0
-        results[keyword] -= negscore
+        results[keyword] = results.get(keyword, 0.) - negscore
+    return _intern_keywords(results), np.array(list(results.values()), dtype=np.float64)
+
+
+def db_search(query, limit=10000, length=None, glob=None):
+    """
+    Get a dictionary of the keywords whose clues match a full-text query,
+    and their total scores, from the first `limit` matching rows. If the
+    clue index has been built, `length` and `glob` limit this to the rows
+    that could give score to a slug of that length, and to the rows whose
+    stored slugs match that GLOB pattern.
+
+    Results are looked up in the in-memory cache, then the disk cache, and
+    then the search database itself.
+    """
+    start = time.perf_counter()
+    key = (normalize_fts_query(query), limit, length, glob)
+    found = SEARCH_CACHE.get(key)
+    source = 'memory'
+    if found is None:
+        get_search_db()
+        disk_cache = get_search_disk_cache()
+        disk_key = '%s\t%d\t%s\t%s\t%s' % (SEARCH_DB_VERSION, limit, length, glob, key[0])
+        data = disk_cache.get(disk_key) if disk_cache is not None else None
+        if data is not None:
+            found = _decode_results(data)
+            source = 'disk'
+        else:
+            found = _run_search(query, limit, length, glob)
+            source = 'fts'
+            if disk_cache is not None:
+                disk_cache.put(disk_key, _encode_results(*found))
+        SEARCH_CACHE.put(key, found)
+    keywords, scores = found
+    results = dict(zip(keywords, scores.tolist()))
+    stats = SEARCH_STATS[source]
+    stats[0] += 1
+    stats[1] += time.perf_counter() - start
     return results
 
 
-def db_rank(clue):
-    scores = defaultdict(float)
-    for match, score in db_search(clue).items():
-        scores[slugify(match)] += score * 1000
+def db_search_cache_info():
+    """
+    Report how well the caches of `db_search` are working: the CacheInfo
+    of the in-memory and disk caches, and how many searches were answered
+    from each place, with their mean latency in milliseconds.
+    """
+    disk_cache = get_search_disk_cache()
+    return {
+        'memory': SEARCH_CACHE.info(),
+        'disk': disk_cache.info() if disk_cache is not None else None,
+        'latency': {
+            source: (count, total / count * 1000 if count else 0.)
+            for source, (count, total) in SEARCH_STATS.items()
+        },
+    }
+
+
+def _add_scores(scores, results, boost, factor, fits=None):
+    """
+    Give each keyword found by a search, and each word of it, its share of
+    the keyword's score times `boost` and `factor`. If `fits` is given,
+    only the slugs it accepts are kept.
+    """
+    for match, score in results.items():
+        weighted = boost * score * factor
+        slug = slugify(match)
+        if fits is None or fits(slug):
+            scores[slug] += weighted
         parts = tokenize(match)
         for part in parts:
-            scores[slugify(part)] += score * 1000 / len(parts)
+            slug = slugify(part)
+            if fits is None or fits(slug):
+                scores[slug] += weighted / len(parts)
 
-    for word in tokenize(clue):
+
+def clue_subqueries(clue):
+    """
+    Get the full-text searches that `db_rank` does for a clue, as tuples of
+    (query, boost, factor). The scores a search finds are multiplied by its
+    boost and factor.
+    """
+    subqueries = [(clue, 1., 1000.)]
+    words = tokenize(clue)
+    for word, query in zip(words, query_expand_many(words)):
         logprob_result = WORDS.segment_logprob(slugify(word))
         if logprob_result is not None:
             logprob, _ = logprob_result
         else:
             logprob = -1000.
         rare_boost = min(25., -logprob)
-        for match, score in db_search(word).items():
-            scores[slugify(match)] += rare_boost * score * 10
-            parts = tokenize(match)
-            for part in parts:
-                scores[slugify(part)] += rare_boost * score * 10 / len(parts)
-
-        query = query_expand(word)
-        for match, score in db_search(query).items():
-            scores[slugify(match)] += rare_boost * score
-            parts = tokenize(match)
-            for part in parts:
-                scores[slugify(part)] += rare_boost * score / len(parts)
+        subqueries.append((word, rare_boost, 10.))
+        subqueries.append((query, rare_boost, 1.))
+    return subqueries
+
+
+def db_rank(clue, length=None, pattern=None):
+    """
+    Score the slugs that a clue might be cluing, by how well it matches the
+    clues in the search database, as a dictionary from slugs to scores. If
+    `length` or `pattern` is given, only slugs with that length that fit
+    that pattern are scored, and when the clue index allows it, only the
+    rows that give score to such slugs are read.
+    """
+    glob = None
+    if pattern is not None:
+        if length is None:
+            minlen, maxlen = regex_len(slug_pattern_text(pattern))
+            if minlen == maxlen:
+                length = minlen
+        glob = pattern_glob(pattern)
+    fits = slug_filter(length, pattern)
+    limit = 10000
+    if (length is not None or glob is not None) and has_clue_index():
+        limit = FILTERED_SEARCH_LIMIT
 
+    scores = defaultdict(float)
+    for query, boost, factor in clue_subqueries(clue):
+        _add_scores(scores, db_search(query, limit, length, glob), boost, factor, fits)
     return scores
 
 
@@ -117,20 +488,28 @@ def search(pattern=None, clue=None, length=None, count=20):
             else:
                 return found[:count]
 
-    if pattern is not None:
-        pattern_re_text = pattern.lstrip('^').rstrip('$').replace(' ', '').lower()
-        pattern_re = re.compile('^' + pattern_re_text + '$')
-    else:
-        pattern_re = None
+    texts = {}
+
+    def accept(slug):
+        """
+        Get the text of a slug, or None if its spacing doesn't fit the
+        pattern. `db_rank` only scores slugs that fit the length and
+        pattern, so these are the only slugs we look up.
+        """
+        if slug not in texts:
+            crom, text = WORDS.cromulence(slug)
+            if pattern is not None and not required_spaces_match(pattern, text):
+                text = None
+            texts[slug] = text
+        return texts[slug]
 
-    raw_matches = sorted(db_rank(clue).items(), key=itemgetter(1), reverse=True)
+    ranked = db_rank(clue, length=length, pattern=pattern)
+    raw_matches = sorted(ranked.items(), key=itemgetter(1), reverse=True)
     matches = {}
     for slug, score in raw_matches:
-        if length is None or length == len(slug):
-            if pattern is None or pattern_re.match(slug):
-                crom, text = WORDS.cromulence(slug)
-                if pattern is None or required_spaces_match(pattern, text):
-                    matches[text] = score
+        text = accept(slug)
+        if text is not None:
+            matches[text] = score
         if len(matches) >= count:
             break
     return sorted([(score, text) for (text, score) in matches.items()], reverse=True)
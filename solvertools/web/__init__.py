@@ -1,9 +1,20 @@
 from flask import Flask, render_template, request, redirect, Response
 from solvertools.search import search
-from solvertools.anagram import anagrams
+from solvertools.anagram import anagrams, stream_anagrams
+import json
 import re
+import time
 application = app = Flask(__name__)
 
+# The anagram page always streams when the browser can, so a streaming
+# search gets the same budget as the /anagram page. There are only a few
+# web workers, and each search holds one for this long.
+STREAM_TIME_LIMIT = 2.0
+
+# When a streaming search hasn't found anything new for this many seconds,
+# send a comment, so that we find out soon if the client has gone away
+KEEPALIVE_INTERVAL = 0.5
+
 
 @app.route('/')
 def main_page():
@@ -135,6 +146,71 @@ def anagram_page():
         )
 
 
+def _server_sent_event(data, event=None):
+    lines = []
+    if event is not None:
+        lines.append('event: %s' % event)
+    lines.append('data: %s' % json.dumps(data))
+    return '\n'.join(lines) + '\n\n'
+
+
+@app.route('/api/anagram/stream')
+@app.route('/api/anagram/stream/')
+def anagram_stream_api():
+    """
+    Stream anagram results as server-sent events, while the search runs.
+
+    Each 'message' event is a list of new [score, text] results that are in
+    the top 100 so far; they can be merged into the results shown so far by
+    sorting. A 'done' event says the search has finished, and an 'error'
+    event carries an error message. Either way, the client should close its
+    EventSource, because otherwise it would reconnect and start over.
+
+    Closing the connection stops the search, including any tasks it has
+    handed to worker processes.
+    """
+    letters = request.args.get('letters') or ''
+    wildcards = request.args.get('wildcards') or 0
+    try:
+        wildcards = int(wildcards)
+    except ValueError:
+        wildcards = 0
+
+    def events():
+        results = stream_anagrams(
+            letters, wildcards, count=100, time_limit=STREAM_TIME_LIMIT
+        )
+        last_sent = time.monotonic()
+        try:
+            for improved in results:
+                now = time.monotonic()
+                if improved:
+                    yield _server_sent_event(
+                        [[round(score, 2), text] for score, text in improved]
+                    )
+                    last_sent = now
+                elif now - last_sent > KEEPALIVE_INTERVAL:
+                    yield ': keepalive\n\n'
+                    last_sent = now
+        except GeneratorExit:
+            # The server closes this generator when the client goes away.
+            # Closing the search stops it and its worker tasks right away,
+            # instead of when its time limit runs out.
+            results.close()
+            raise
+        except Exception as e:
+            yield _server_sent_event(str(e), event='error')
+        else:
+            yield _server_sent_event(None, event='done')
+        finally:
+            results.close()
+
+    return Response(
+        events(), mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.route('/static/anagrampage')
 @app.route('/static/anagrampage/')
 def anagram_interactive_page():
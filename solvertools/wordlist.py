@@ -1,6 +1,25 @@
 from solvertools.util import db_path, data_path, wordlist_path, corpus_path
 from solvertools.normalize import slugify, unspaced_lower
 from solvertools.regextools import is_exact, regex_len, regex_slice
+from solvertools.lexicon import (
+    KEY_INDEX_FILES,
+    LEXICON_FILES,
+    KeyIndex,
+    Lexicon,
+    lexicon_path,
+    write_key_index,
+    write_lexicon,
+)
+from solvertools.alphagrams import AlphagramIndex, write_alphagram_index
+from solvertools.caches import LookupCache, make_cache
+from solvertools.columns import (
+    LetterColumns,
+    TopTable,
+    compile_pattern,
+    write_letter_columns,
+    write_postings,
+    write_top_table,
+)
 from solvertools.letters import (
     alphagram,
     anahash,
@@ -8,14 +27,26 @@ from solvertools.letters import (
     alphabytes,
     random_letters,
 )
+import numpy as np
 import sqlite3
 import re
 import os
 import mmap
-from collections import defaultdict, Counter
+import glob
+import hashlib
+import json
+import multiprocessing
+import pickle
+import tempfile
+import time
+from collections import defaultdict, deque, Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pprint import pprint
 from math import log, exp
-from itertools import islice
+from itertools import groupby, islice
+from contextlib import contextmanager
+from operator import itemgetter
+import heapq
 import logging
 
 logger = logging.getLogger(__name__)
@@ -63,6 +94,9 @@ SCRABBLE_SCORE = {
 NULL_HYPOTHESIS_ENTROPY = -3.5
 DECIBEL_SCALE = 20 / log(10)
 
+# Distinguishes "not in the cache" from a cached None
+MISSING = object()
+
 
 class Wordlist:
     schema = [
@@ -73,27 +107,59 @@ class Wordlist:
             text TEXT
         )
         """,
+    ]
+    indexes = [
         "CREATE UNIQUE INDEX words_slug ON words (slug)",
         "CREATE INDEX words_freq ON words (freq)",
     ]
     wordplay_schema = [
         "CREATE TABLE wordplay (slug TEXT, alphagram TEXT, anahash TEXT, consonantcy TEXT)",
-        "CREATE UNIQUE INDEX wordplay_slug on words (slug)",
+    ]
+    wordplay_indexes = [
+        "CREATE UNIQUE INDEX wordplay_slug on wordplay (slug)",
         "CREATE INDEX wordplay_alphagram on wordplay (alphagram)",
         "CREATE INDEX wordplay_anahash on wordplay (anahash)",
         "CREATE INDEX wordplay_consonantcy on wordplay (consonantcy)",
     ]
     max_indexed_length = 25
 
-    def __init__(self, name):
+    def __init__(
+        self,
+        name,
+        use_lexicon=True,
+        cache_policy="lru",
+        positive_cache_size=100000,
+        negative_cache_size=50000,
+        grep_cache_size=5000,
+    ):
         """
         Load a wordlist, given its name.
+
+        If a compiled Lexicon has been built for this wordlist (see
+        lexicon.py), words will be looked up in it instead of in SQLite,
+        unless `use_lexicon` is False.
+
+        Looked-up words are kept in a bounded cache (see caches.py), whose
+        eviction policy is `cache_policy`, 'lru' or 'arc'. Words that were
+        found and words that weren't have separate budgets. The top results
+        of the pattern slices that `search` greps for are cached too, up to
+        `grep_cache_size` of them.
         """
         self.name = name
         self.db = wordlist_db_connection(name + ".wl.db")
-        self._word_cache = {}
+        self.use_lexicon = use_lexicon
+        self._lexicon = None
+        self._word_cache = LookupCache(
+            cache_policy, positive_cache_size, negative_cache_size
+        )
+        self._grep_cache = make_cache(cache_policy, grep_cache_size)
+        self._top_by_length = {}
         self._grep_maps = {}
+        self._grep_columns = {}
+        self._top_tables = {}
         self._alpha_maps = {}
+        self._alpha_index = None
+        self._key_indexes = {}
         self.logtotal = None
 
     def __contains__(self, word):
@@ -118,27 +184,69 @@ class Wordlist:
         database. If there is such a row, return its unscaled frequency and
         its text (including spaces). If not, return None.
         """
-        if slug in self._word_cache:
-            return self._word_cache[slug]
-        c = self.db.cursor()
-        c.execute("SELECT freq, text FROM words WHERE slug=?", (slug,))
-        result = c.fetchone()
-        self._word_cache[slug] = result
+        result = self._word_cache.get(slug, MISSING)
+        if result is not MISSING:
+            return result
+        lexicon = self.get_lexicon()
+        if lexicon is not None:
+            result = lexicon.lookup(slug)
+        else:
+            c = self.db.cursor()
+            c.execute("SELECT freq, text FROM words WHERE slug=?", (slug,))
+            result = c.fetchone()
+        self._word_cache.put(slug, result)
         return result
 
-    def segment_logprob(self, slug):
+    def cache_info(self):
         """
-        If this slug appears directly in the word list, return its log
-        probability and its text. Otherwise, return None.
+        Get the hit, miss, and eviction counts of the word cache, separately
+        for its 'positive' and 'negative' entries.
+        """
+        return self._word_cache.info()
+
+    def grep_cache_info(self):
+        """
+        Get the hit, miss, and eviction counts of the cache of grep results
+        used by `search`.
+        """
+        return self._grep_cache.info()
+
+    def get_lexicon(self):
+        """
+        Get the compiled Lexicon for this wordlist, loading it the first time
+        it's needed. Returns None if we're not using a Lexicon, or if it
+        hasn't been built.
+        """
+        if self._lexicon is None and self.use_lexicon:
+            if Lexicon.exists(self.name):
+                self._lexicon = Lexicon(self.name)
+            else:
+                logger.info("No lexicon for %r; using SQLite", self.name)
+                self.use_lexicon = False
+        return self._lexicon
+
+    def get_logtotal(self):
+        """
+        Get the log of the total frequency of all the words, which is what
+        we subtract from the log of a word's frequency to get its log
+        probability.
         """
         if self.logtotal is None:
             totalfreq, _ = self.lookup_slug("")
             self.logtotal = log(totalfreq)
+        return self.logtotal
+
+    def segment_logprob(self, slug):
+        """
+        If this slug appears directly in the word list, return its log
+        probability and its text. Otherwise, return None.
+        """
+        logtotal = self.get_logtotal()
         found = self.lookup_slug(slug)
         if found is None:
             return None
         freq, text = found
-        logprob = log(freq) - self.logtotal
+        logprob = log(freq) - logtotal
         return logprob, text
 
     def freq(self, word):
@@ -146,14 +254,12 @@ class Wordlist:
         Get the frequency of a single item in the wordlist.
         Always returns just a number, which is 0 if it's not found.
         """
-        if self.logtotal is None:
-            totalfreq, _ = self.lookup_slug("")
-            self.logtotal = log(totalfreq)
+        logtotal = self.get_logtotal()
         found = self.lookup_slug(slugify(word))
         if found is None:
             return 0.0
         else:
-            return log(found[0]) - self.logtotal
+            return log(found[0]) - logtotal
 
     def logprob(self, word):
         """
@@ -171,6 +277,17 @@ class Wordlist:
         spacing, gluing it together with multiple "segments" if necessary.
         """
         slug = slugify(text)
+        lexicon = self.get_lexicon()
+        if lexicon is not None:
+            return self._text_logprob_trie(slug, lexicon)
+        else:
+            return self._text_logprob_probe(slug)
+
+    def _text_logprob_probe(self, slug):
+        """
+        Find the best segmentation of a slug by looking up every substring
+        of it. This is the way to do it without a Lexicon.
+        """
         n = len(slug)
         best_partial_results = [""]
         best_logprobs = [0.0]
@@ -195,6 +312,50 @@ class Wordlist:
                         best_partial_results[right_edge] = ltext + " " + rtext
         return best_logprobs[-1], best_partial_results[-1]
 
+    def _text_logprob_trie(self, slug, lexicon):
+        """
+        Find the best segmentation of a slug by walking the Lexicon's trie
+        from each position, so we only look at substrings that are words,
+        and stop as soon as we reach a prefix that no word has.
+
+        This gets the same results as `_text_logprob_probe`, including how
+        ties are broken: a segmentation only replaces a previous one if it's
+        strictly better, and we consider left edges in increasing order.
+        """
+        logtotal = self.get_logtotal()
+        n = len(slug)
+        key = slug.encode("ascii")
+        best_logprobs = [0.0] + [-1000.0] * n
+        # For each right edge, the left edge and word id of its last segment
+        backpointers = [None] * (n + 1)
+        for left_edge in range(n):
+            if left_edge > 0:
+                if backpointers[left_edge] is None:
+                    # Nothing can be built on an unknown prefix
+                    continue
+                lprob = best_logprobs[left_edge]
+            for right_edge, word in lexicon.iter_prefixes(key, left_edge):
+                rprob = log(lexicon.freq(word)) - logtotal
+                if left_edge == 0:
+                    best_logprobs[right_edge] = rprob
+                    backpointers[right_edge] = (0, word)
+                else:
+                    totalprob = lprob + rprob - log(10)
+                    if totalprob > best_logprobs[right_edge]:
+                        best_logprobs[right_edge] = totalprob
+                        backpointers[right_edge] = (left_edge, word)
+
+        pieces = []
+        right_edge = n
+        while right_edge > 0:
+            if backpointers[right_edge] is None:
+                pieces.append(slug[:right_edge])
+                break
+            left_edge, word = backpointers[right_edge]
+            pieces.append(lexicon.text(word))
+            right_edge = left_edge
+        return best_logprobs[-1], " ".join(reversed(pieces))
+
     def cromulence(self, text):
         """
         Estimate how likely this text is to be an answer. The "cromulence"
@@ -208,6 +369,122 @@ class Wordlist:
         cromulence = round((entropy - NULL_HYPOTHESIS_ENTROPY) * DECIBEL_SCALE, 1)
         return cromulence, found_text
 
+    def text_logprob_many(self, texts):
+        """
+        Get the results of `text_logprob` for many texts at once, returning
+        a list in the same order.
+
+        Repeated texts are only scored once. The words that could appear in
+        the texts are looked up together -- in one walk of the Lexicon's trie
+        per distinct suffix, or in a few large SQLite queries -- and then the
+        segmentation is done for all texts of the same length at once, as
+        operations on NumPy arrays. The results are identical to calling
+        `text_logprob` on each text.
+        """
+        slugs = [slugify(text) for text in texts]
+        unique_slugs = list(dict.fromkeys(slugs))
+        words_at = self._lookup_segments(unique_slugs)
+        by_length = defaultdict(list)
+        for slug in unique_slugs:
+            by_length[len(slug)].append(slug)
+
+        results = {}
+        for length, group in by_length.items():
+            # Keep the arrays for each batch to a few million entries
+            batch_size = max(1, 4000000 // (length + 1) ** 2)
+            for start in range(0, len(group), batch_size):
+                batch = group[start : start + batch_size]
+                results.update(zip(batch, _segment_batch(batch, length, words_at)))
+        return [results[slug] for slug in slugs]
+
+    def cromulence_many(self, texts):
+        """
+        Get the results of `cromulence` for many texts at once, returning a
+        list in the same order. See `text_logprob_many`.
+        """
+        slugs = [slugify(text) for text in texts]
+        results = []
+        for slug, (logprob, found_text) in zip(slugs, self.text_logprob_many(slugs)):
+            if len(slug) == 0:
+                results.append((0, ""))
+            else:
+                results.append(
+                    (self.logprob_to_cromulence(logprob, len(slug)), found_text)
+                )
+        return results
+
+    def _lookup_segments(self, slugs):
+        """
+        Find all the words that start each suffix of the given slugs.
+        Returns a dictionary from each suffix to a list of (length, logprob,
+        text) for the words that it starts with.
+        """
+        logtotal = self.get_logtotal()
+        suffixes = {slug[left_edge:] for slug in slugs for left_edge in range(len(slug))}
+        words_at = {}
+        lexicon = self.get_lexicon()
+        if lexicon is not None:
+            word_cache = {}
+            for suffix in suffixes:
+                found = []
+                for length, word in lexicon.iter_prefixes(suffix.encode("ascii")):
+                    if word not in word_cache:
+                        word_cache[word] = (
+                            log(lexicon.freq(word)) - logtotal,
+                            lexicon.text(word),
+                        )
+                    found.append((length,) + word_cache[word])
+                words_at[suffix] = found
+        else:
+            prefixes = {
+                suffix[:length]
+                for suffix in suffixes
+                for length in range(1, len(suffix) + 1)
+            }
+            rows = self.lookup_slugs(prefixes)
+            for suffix in suffixes:
+                found = []
+                for length in range(1, len(suffix) + 1):
+                    row = rows[suffix[:length]]
+                    if row is not None:
+                        freq, text = row
+                        found.append((length, log(freq) - logtotal, text))
+                words_at[suffix] = found
+        return words_at
+
+    def lookup_slugs(self, slugs):
+        """
+        Look up many slugs at once, returning a dictionary from each slug to
+        what `lookup_slug` would return for it.
+        """
+        results = {}
+        missing = []
+        for slug in slugs:
+            found = self._word_cache.get(slug, MISSING)
+            if found is MISSING:
+                missing.append(slug)
+            else:
+                results[slug] = found
+        lexicon = self.get_lexicon()
+        if lexicon is not None:
+            for slug in missing:
+                results[slug] = lexicon.lookup(slug)
+        else:
+            # SQLite limits how many parameters one query can have
+            chunk_size = 900
+            for start in range(0, len(missing), chunk_size):
+                chunk = missing[start : start + chunk_size]
+                for slug in chunk:
+                    results[slug] = None
+                query = "SELECT slug, freq, text FROM words WHERE slug IN (%s)" % (
+                    ", ".join("?" * len(chunk))
+                )
+                for slug, freq, text in self._iter_query(query, chunk):
+                    results[slug] = (freq, text)
+        for slug in missing:
+            self._word_cache.put(slug, results[slug])
+        return results
+
     def logprob_to_cromulence(self, logprob, length):
         """
         Convert a log probability to the 'cromulence' scale, which only
@@ -240,29 +517,123 @@ class Wordlist:
 
         num_found = 0
         for cur_length in range(minlen, maxlen + 1):
-            if cur_length not in self._grep_maps:
-                mm = self._open_mmap(
-                    wordlist_path_from_name("greppable/%s.%d" % (self.name, cur_length))
-                )
-                self._grep_maps[cur_length] = mm
+            columns = self._get_columns(cur_length)
+            plan = None
+            if columns is not None:
+                plan = compile_pattern(pattern, cur_length)
+            if plan is not None:
+                results = self._grep_columns_logprob(columns, plan)
             else:
-                mm = self._grep_maps[cur_length]
-            pbytes = pattern.encode("ascii").replace(b"[^", b"[^,")
-            pattern1 = b"^" + pbytes + b","
-            pattern2 = b"\n" + pbytes + b","
-            match = re.match(pattern1, mm)
-            if match:
-                found = mm[match.start() : match.end() - 1].decode("ascii")
-                num_found += 1
-                yield self.segment_logprob(found)
-            for match in re.finditer(pattern2, mm):
-                found = mm[match.start() + 1 : match.end() - 1].decode("ascii")
-
+                results = map(
+                    self.segment_logprob, self._grep_mmap(pattern, cur_length)
+                )
+            for found in results:
                 num_found += 1
-                yield self.segment_logprob(found)
+                yield found
                 if num_found >= count:
                     return
 
+    def _grep_columns_logprob(self, columns, plan):
+        """
+        Find the words of one length that match a plan, in order, yielding
+        (logprob, text) for each. If the plan's pattern is in the TopTable
+        for this length, its first results come straight from the table,
+        and we only scan the columns if more are wanted.
+        """
+        rows = None
+        table = self._get_top_table(plan.length)
+        found = None if table is None else table.lookup(plan)
+        if found is not None:
+            ids, complete = found
+            lexicon = self.get_lexicon()
+            logtotal = self.get_logtotal()
+            for idx in ids.tolist():
+                yield log(lexicon.freq(idx)) - logtotal, lexicon.text(idx)
+            if complete:
+                return
+            rows = columns.matching_rows(plan)[len(ids) :]
+        for slug in columns.iter_matches(plan, rows):
+            yield self.segment_logprob(slug)
+
+    def _get_top_table(self, length):
+        """
+        Get the TopTable for words of a given length, or None if it hasn't
+        been built. Its results are lexicon ids, so it's only used with a
+        lexicon.
+        """
+        if length not in self._top_tables:
+            if self.get_lexicon() is not None and TopTable.exists(self.name, length):
+                self._top_tables[length] = TopTable(self.name, length)
+            else:
+                self._top_tables[length] = None
+        return self._top_tables[length]
+
+    def _get_columns(self, length):
+        """
+        Get the LetterColumns for words of a given length, or None if they
+        haven't been built.
+        """
+        if length not in self._grep_columns:
+            if LetterColumns.exists(self.name, length):
+                self._grep_columns[length] = LetterColumns(self.name, length)
+            else:
+                self._grep_columns[length] = None
+        return self._grep_columns[length]
+
+    def _grep_mmap(self, pattern, length):
+        """
+        Find the slugs of a given length that match a pattern, by scanning
+        the greppable list with a regex. Yields them in order.
+        """
+        if length not in self._grep_maps:
+            mm = self._open_mmap(
+                wordlist_path_from_name("greppable/%s.%d" % (self.name, length))
+            )
+            self._grep_maps[length] = mm
+        else:
+            mm = self._grep_maps[length]
+        pbytes = pattern.encode("ascii").replace(b"[^", b"[^,")
+        pattern1 = b"^" + pbytes + b","
+        pattern2 = b"\n" + pbytes + b","
+        match = re.match(pattern1, mm)
+        if match:
+            yield mm[match.start() : match.end() - 1].decode("ascii")
+        for match in re.finditer(pattern2, mm):
+            yield mm[match.start() + 1 : match.end() - 1].decode("ascii")
+
+    def grep_top(self, segment, count):
+        """
+        Get a list of the first `count` results of grepping for a pattern.
+        The dynamic program in `search` asks for the same slices of patterns
+        over and over, so these lists are cached, and shouldn't be modified.
+
+        A slice that's all wildcards is served from a table of the top words
+        of each length.
+        """
+        key = (segment, count)
+        found = self._grep_cache.get(key)
+        if found is None:
+            if segment and segment.count(".") == len(segment):
+                found = self.top_by_length(len(segment), count)
+            else:
+                found = list(islice(self.grep(segment), count))
+            self._grep_cache.put(key, found)
+        return found
+
+    def top_by_length(self, length, count):
+        """
+        Get the `count` most cromulent words of a given length, as (logprob,
+        text) pairs.
+        """
+        # The table for each length is as long as the largest count we've
+        # been asked for, unless there aren't that many words
+        table, complete = self._top_by_length.get(length, ([], False))
+        if len(table) < count and not complete:
+            table = list(islice(self.grep("." * length, count=count), count))
+            complete = len(table) < count
+            self._top_by_length[length] = (table, complete)
+        return table[:count]
+
     def grep_one(self, pattern, length=None):
         """
         Like .grep(), but returns only one result, or None if there are no
@@ -290,9 +661,7 @@ class Wordlist:
             # If there are variable-length matches, the dynamic programming
             # strategy won't work, so fall back on grepping for complete
             # matches in the wordlist.
-            items = list(self.grep(pattern, length=length))
-            items.sort(reverse=True)
-            found = items[:count]
+            found = heapq.nlargest(count, self.grep(pattern, length=length))
         else:
             if length is not None and not (minlen <= length <= maxlen):
                 # This length is impossible, so there are no results.
@@ -301,19 +670,16 @@ class Wordlist:
             best_partial_results = [[]]
             for right_edge in range(1, maxlen + 1):
                 segment = regex_slice(pattern, 0, right_edge)
-                results_this_step = list(islice(self.grep(segment), count))
+                whole = self.grep_top(segment, count)
 
+                pairs = []
                 for left_edge in range(1, right_edge):
                     if best_partial_results[left_edge]:
                         segment = regex_slice(pattern, left_edge, right_edge)
-                        found = list(islice(self.grep(segment), count))
-                        for lprob, ltext in best_partial_results[left_edge]:
-                            for rprob, rtext in found:
-                                results_this_step.append(
-                                    (lprob + rprob - log(10), ltext + " " + rtext)
-                                )
-                results_this_step.sort(reverse=True)
-                best_partial_results.append(results_this_step[:count])
+                        found = self.grep_top(segment, count)
+                        if found:
+                            pairs.append((best_partial_results[left_edge], found))
+                best_partial_results.append(_top_k_merge(whole, pairs, count))
             found = best_partial_results[-1]
 
         if not use_cromulence:
@@ -326,6 +692,28 @@ class Wordlist:
             results.sort(reverse=True)
             return results
 
+    def search_many(self, patterns, count=10, use_cromulence=False):
+        """
+        Get the results of `search` for many patterns, returning a list of
+        result lists in the same order. The patterns that are plain strings
+        are scored all at once with `text_logprob_many`.
+        """
+        patterns = [unspaced_lower(pattern) for pattern in patterns]
+        exact = [pattern for pattern in patterns if is_exact(pattern)]
+        if use_cromulence:
+            scored = dict(zip(exact, self.cromulence_many(exact)))
+        else:
+            scored = dict(zip(exact, self.text_logprob_many(exact)))
+        results = []
+        for pattern in patterns:
+            if pattern in scored:
+                results.append([scored[pattern]])
+            else:
+                results.append(
+                    self.search(pattern, count=count, use_cromulence=use_cromulence)
+                )
+        return results
+
     def _iter_query(self, query, params=()):
         c = self.db.cursor()
         c.execute(query, params)
@@ -362,13 +750,37 @@ class Wordlist:
             "SELECT slug, freq, text FROM words ORDER BY freq/(length(slug) + 1) DESC"
         )
 
+    def get_alphagram_index(self):
+        """
+        Get the AlphagramIndex of this wordlist, or None if it hasn't been
+        built.
+        """
+        if self._alpha_index is None:
+            if AlphagramIndex.exists(self.name):
+                self._alpha_index = AlphagramIndex(self.name)
+            else:
+                self._alpha_index = False
+        return self._alpha_index or None
+
     def find_sub_alphagrams(self, alpha, wildcard=False):
+        """
+        Find the alphagrams of words that can be made from the letters of
+        `alpha`, plus one wildcard letter if `wildcard` is true. They're
+        yielded in their 'alphabytes' form, in descending order of frequency.
+        """
         if len(alpha) + wildcard < 2:
             return
-        abytes = alphabytes(alpha)
         max_length = min(len(alpha) + wildcard - 2, self.max_indexed_length)
         if max_length < 2:
             max_length = 2
+        index = self.get_alphagram_index()
+        if index is not None:
+            yield from index.iter_sub_alphagrams(
+                alpha, max_length, int(wildcard), min_length=2, as_bytes=True
+            )
+            return
+
+        abytes = alphabytes(alpha)
         if max_length not in self._alpha_maps:
             mm = self._open_mmap(
                 wordlist_path_from_name("alphabytes/%s.%d" % (self.name, max_length))
@@ -376,15 +788,41 @@ class Wordlist:
             self._alpha_maps[max_length] = mm
         else:
             mm = self._alpha_maps[max_length]
+        # The newlines are matched with lookarounds, so that they aren't
+        # consumed and a match can immediately follow another one
         if wildcard:
-            pattern = b"\n[" + abytes + b"]*.[" + abytes + b"]*\n"
+            pattern = b"(?<=\n)[" + abytes + b"]*.[" + abytes + b"]*(?=\n)"
         else:
-            pattern = b"\n[" + abytes + b"]+\n"
+            pattern = b"(?<=\n)[" + abytes + b"]+(?=\n)"
         for match in re.finditer(pattern, mm):
-            found = mm[match.start() + 1 : match.end() - 1]
-            yield found
+            yield match.group()
+
+    def get_key_index(self, kind):
+        """
+        Get the KeyIndex of the lexicon that maps slugs' alphagrams or
+        anahashes (depending on `kind`) to the words that have them. Returns
+        None if we're not using a lexicon, or if the index hasn't been
+        built, in which case we look in the wordplay table instead.
+        """
+        if kind not in self._key_indexes:
+            lexicon = self.get_lexicon()
+            if lexicon is None:
+                return None
+            if KeyIndex.exists(self.name, kind):
+                self._key_indexes[kind] = KeyIndex(lexicon, kind)
+            else:
+                logger.info("No %s index for %r; using SQLite", kind, self.name)
+                self._key_indexes[kind] = None
+        return self._key_indexes[kind]
 
     def find_by_alphagram(self, alphagram):
+        index = self.get_key_index("alphagram")
+        if index is not None:
+            lexicon = index.lexicon
+            return iter([
+                (lexicon.slug(idx), lexicon.freq(idx), lexicon.text(idx))
+                for idx in index.find_ids(alphagram).tolist()
+            ])
         return self._iter_query(
             "SELECT w.* from wordplay wp, words w "
             "WHERE wp.slug=w.slug and wp.alphagram=? "
@@ -393,6 +831,9 @@ class Wordlist:
         )
 
     def find_by_alphagram_raw(self, alphagram):
+        index = self.get_key_index("alphagram")
+        if index is not None:
+            return iter(index.find_slugs(alphagram))
         return self._iter_singletons(
             "SELECT w.slug from wordplay wp, words w "
             "WHERE wp.slug=w.slug and wp.alphagram=? "
@@ -401,6 +842,9 @@ class Wordlist:
         )
 
     def find_by_anahash_raw(self, anahash):
+        index = self.get_key_index("anahash")
+        if index is not None:
+            return iter(index.find_slugs(anahash))
         return self._iter_singletons(
             "SELECT w.slug from wordplay wp, words w "
             "WHERE wp.slug=w.slug and wp.anahash=? "
@@ -428,48 +872,131 @@ class Wordlist:
         return mm
 
     # Below this are building steps that should only need to be run once.
-    def build_db(self):
+    def build_db(self, processes=None):
         """
-        Build a SQLite database from a flat wordlist file.
+        Build a SQLite database from a flat wordlist file, with the table of
+        words and the table of their 'wordplay' properties. The file is read
+        once, and the wordplay properties are computed in a pool of
+        `processes` worker processes (by default, one per CPU).
         """
-        self.db.execute("DROP TABLE IF EXISTS words")
-        for statement in self.schema:
-            self.db.execute(statement)
-
         total = 0
-        with self.db:
+
+        def rows():
+            nonlocal total
             for i, slug, freq, text in read_wordlist(self.name):
-                self.db.execute(
-                    "INSERT INTO words (slug, freq, text) " "VALUES (?, ?, ?)",
-                    (slug, freq, text),
-                )
                 total += freq
                 if i % 100000 == 0:
                     print("\t%s,%s" % (text, freq))
+                yield slug, freq, text
 
+        self._prepare_bulk_load()
+        self.db.execute("DROP TABLE IF EXISTS words")
+        for statement in self.schema:
+            self.db.execute(statement)
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO words (slug, freq, text) VALUES (?, ?, ?)", rows()
+            )
             # Use the empty string to record the total
             print("Total: %d" % total)
             self.db.execute(
                 "INSERT INTO words (slug, freq, text) VALUES ('', ?, '')", (total,)
             )
+            # Indexing the table once it's full is faster than keeping the
+            # indexes up to date along the way
+            for statement in self.indexes:
+                self.db.execute(statement)
+        self._write_wordplay(self._iter_slugs(), processes)
+
+    def _prepare_bulk_load(self):
+        """
+        Set up this database connection to load a lot of rows quickly. The
+        database is being rebuilt from scratch, so it doesn't need to
+        survive a crash along the way.
+        """
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.execute("PRAGMA temp_store = MEMORY")
+        # A negative cache size is in kibibytes
+        self.db.execute("PRAGMA cache_size = -262144")
+
+    def write_lexicon(self):
+        """
+        Compile the words table into a memory-mappable Lexicon.
+        """
+        write_lexicon(
+            self.name, self._iter_query("SELECT slug, freq, text FROM words ORDER BY slug")
+        )
+
+    def write_key_indexes(self):
+        """
+        Write the indexes from alphagrams and anahashes to the entries of
+        the compiled lexicon, which must already have been written.
+        """
+        slugs = []
+        freqs = []
+        # This is the same order as the ids in the lexicon
+        for slug, freq in self._iter_query("SELECT slug, freq FROM words ORDER BY slug"):
+            slugs.append(slug)
+            freqs.append(freq)
+        for kind, func in [("alphagram", alphagram), ("anahash", anahash)]:
+            print("\tIndexing by %s" % kind)
+            write_key_index(self.name, kind, [func(slug) for slug in slugs], freqs)
+
+    def build_wordplay(self, processes=None):
+        """
+        Rebuild just the wordplay table, from the words table. (`build_db`
+        builds it along with the words table.)
+        """
+        self._prepare_bulk_load()
+        self._write_wordplay(self._iter_slugs(), processes)
 
-    def build_wordplay(self):
+    def _iter_slugs(self):
+        """
+        Iterate the slugs of the words table, leaving out the empty slug
+        that records the total.
+        """
+        for slug in self._iter_singletons("SELECT slug FROM words"):
+            if slug:
+                yield slug
+
+    def _write_wordplay(self, slugs, processes=None):
+        """
+        Fill the wordplay table with the alphagram, anahash, and consonantcy
+        of each of an iterable of slugs.
+
+        The slugs are read a chunk at a time, and only a couple of chunks
+        per worker process are read ahead of the rows being written, so they
+        can come straight from the words table.
+        """
         self.db.execute("DROP TABLE IF EXISTS wordplay")
         for statement in self.wordplay_schema:
             self.db.execute(statement)
-
+        slugs = iter(slugs)
+        chunks = iter(lambda: list(islice(slugs, WORDPLAY_CHUNK_SIZE)), [])
         with self.db:
-            for i, slug, freq, text in read_wordlist(self.name):
-                alpha = alphagram(slug)
-                ana = anahash(slug)
-                cons = consonantcy(slug)
-                self.db.execute(
-                    "INSERT INTO wordplay (slug, alphagram, anahash, consonantcy) "
-                    "VALUES (?, ?, ?, ?)",
-                    (slug, alpha, ana, cons),
+            if processes == 1:
+                results = map(_wordplay_rows, chunks)
+                pool = None
+            else:
+                pool = multiprocessing.get_context("spawn").Pool(processes)
+                results = _imap_read_ahead(
+                    pool, _wordplay_rows, chunks, 2 * (processes or os.cpu_count() or 1)
                 )
-                if i % 100000 == 0:
-                    print("\t%s" % (text))
+            try:
+                for i, rows in enumerate(results):
+                    self.db.executemany(
+                        "INSERT INTO wordplay (slug, alphagram, anahash, consonantcy) "
+                        "VALUES (?, ?, ?, ?)",
+                        rows,
+                    )
+                    print("\t%s" % rows[0][0])
+            finally:
+                if pool is not None:
+                    pool.terminate()
+                    pool.join()
+            for statement in self.wordplay_indexes:
+                self.db.execute(statement)
 
     def write_greppable_lists(self):
         """
@@ -496,6 +1023,34 @@ class Wordlist:
         for file in length_files.values():
             file.close()
 
+    def write_letter_columns(self):
+        """
+        Write the columnar form of each greppable list, and its positional
+        index (see columns.py).
+        """
+        for length in range(1, self.max_indexed_length + 1):
+            slugs = []
+            with open(
+                wordlist_path_from_name("greppable/%s.%d" % (self.name, length)),
+                encoding="ascii",
+            ) as file:
+                for line in file:
+                    slugs.append(line.split(",", 1)[0])
+            write_letter_columns(self.name, length, slugs)
+            write_postings(self.name, length)
+
+    def write_top_tables(self):
+        """
+        Write the TopTable of each length (see columns.py), from the letter
+        columns and the compiled lexicon.
+        """
+        lexicon = Lexicon(self.name)
+        for length in range(1, self.max_indexed_length + 1):
+            columns = LetterColumns(self.name, length)
+            slugs = columns.slugs(np.arange(len(columns)))
+            word_ids = [lexicon.find(slug) for slug in slugs]
+            write_top_table(self.name, length, word_ids)
+
     def write_alphabytes(self):
         os.makedirs(wordlist_path("alphabytes"), exist_ok=True)
         length_files = {
@@ -520,6 +1075,19 @@ class Wordlist:
             file.write(b"\n")
             file.close()
 
+    def write_alphagram_index(self):
+        """
+        Write the NumPy index of distinct alphagrams that
+        `find_sub_alphagrams` uses (see alphagrams.py).
+        """
+        alphagrams = {}
+        for slug, freq, text in self.iter_all_by_freq():
+            if 1 <= len(slug) <= self.max_indexed_length:
+                alphagrams.setdefault(alphagram(slug), freq)
+        write_alphagram_index(
+            self.name, list(alphagrams.keys()), list(alphagrams.values())
+        )
+
     def test_cromulence(self):
         """
         This test runs a corpus of past Mystery Hunt answers through the cromulence
@@ -593,6 +1161,135 @@ class Wordlist:
         return results[:count]
 
 
+def _segment_batch(slugs, length, words_at):
+    """
+    Segment a batch of slugs that all have the same length, given the words
+    that start each of their suffixes (see `Wordlist._lookup_segments`).
+
+    This is the same dynamic program as `Wordlist._text_logprob_probe`, with
+    each step done for all the slugs at once. A segmentation replaces the
+    previous best one only if it's strictly better, and `argmax` picks the
+    first of several equal ones, so ties come out the same way.
+    """
+    n = length
+    if n == 0:
+        return [(0.0, "") for slug in slugs]
+    nslugs = len(slugs)
+    # seg_logprobs[b, left, right] is the log probability of the substring
+    # slugs[b][left:right], or -inf if it's not a word
+    seg_logprobs = np.full((nslugs, n, n + 1), -np.inf)
+    seg_texts = {}
+    for b, slug in enumerate(slugs):
+        for left_edge in range(n):
+            for seg_length, logprob, text in words_at[slug[left_edge:]]:
+                right_edge = left_edge + seg_length
+                seg_logprobs[b, left_edge, right_edge] = logprob
+                seg_texts[slug[left_edge:right_edge]] = text
+
+    best_logprobs = np.full((nslugs, n + 1), -1000.0)
+    best_logprobs[:, 0] = 0.0
+    # The left edge of the last segment, or -1 when the whole prefix is
+    # unknown and is kept as it is
+    backpointers = np.full((nslugs, n + 1), -1, dtype=np.int64)
+    whole = seg_logprobs[:, 0, :] > -np.inf
+    best_logprobs[whole] = seg_logprobs[:, 0, :][whole]
+    backpointers[whole] = 0
+    rows = np.arange(nslugs)
+    log10 = log(10)
+    for right_edge in range(2, n + 1):
+        totalprobs = (
+            best_logprobs[:, 1:right_edge] + seg_logprobs[:, 1:right_edge, right_edge]
+        ) - log10
+        choice = np.argmax(totalprobs, axis=1)
+        chosen = totalprobs[rows, choice]
+        improved = chosen > best_logprobs[:, right_edge]
+        best_logprobs[improved, right_edge] = chosen[improved]
+        backpointers[improved, right_edge] = choice[improved] + 1
+
+    results = []
+    for b, slug in enumerate(slugs):
+        pieces = []
+        right_edge = n
+        while right_edge > 0:
+            left_edge = int(backpointers[b, right_edge])
+            if left_edge < 0:
+                pieces.append(slug[:right_edge])
+                break
+            pieces.append(seg_texts[slug[left_edge:right_edge]])
+            right_edge = left_edge
+        results.append((float(best_logprobs[b, n]), " ".join(reversed(pieces))))
+    return results
+
+
+def _top_k_merge(whole, pairs, count):
+    """
+    Do one step of the dynamic program in `Wordlist.search`: get the best
+    `count` results, sorted in descending order, out of the single words in
+    `whole` and every combination of a partial result with a word in each of
+    the (partials, words) lists in `pairs`.
+
+    This gets the same results as listing every combination, sorting them,
+    and keeping the first `count`, but the combinations are visited lazily
+    from a heap, best first, and only the texts of the ones we keep are
+    built. The lists are sorted by log probability first, which doesn't
+    change them in the usual case that they already are.
+    """
+    if count <= 0:
+        return []
+    log10 = log(10)
+    by_logprob = itemgetter(0)
+    sources = [
+        (
+            sorted(partials, key=by_logprob, reverse=True),
+            sorted(words, key=by_logprob, reverse=True),
+        )
+        for partials, words in pairs
+    ]
+    # Heap entries are (-logprob, source, i, j). The single words are source
+    # -1, and use only `j`. For each pair, (i, j) points into the partials
+    # and the words; we push (i + 1, j) only from column 0, so each
+    # combination is pushed once.
+    whole = sorted(whole, key=by_logprob, reverse=True)
+    heap = []
+    if whole:
+        heap.append((-whole[0][0], -1, 0, 0))
+    for src, (partials, words) in enumerate(sources):
+        heap.append((-(partials[0][0] + words[0][0] - log10), src, 0, 0))
+    heapq.heapify(heap)
+
+    chosen = []
+    cutoff = None
+    while heap:
+        neg_logprob, src, i, j = heap[0]
+        # Once we have `count` results, keep going only to pick up ties with
+        # the last one, which the final sort will decide between
+        if cutoff is not None and -neg_logprob < cutoff:
+            break
+        heapq.heappop(heap)
+        if src < 0:
+            chosen.append(whole[j])
+            if j + 1 < len(whole):
+                heapq.heappush(heap, (-whole[j + 1][0], -1, 0, j + 1))
+        else:
+            partials, words = sources[src]
+            lprob, ltext = partials[i]
+            rprob, rtext = words[j]
+            chosen.append((-neg_logprob, ltext + " " + rtext))
+            if j == 0 and i + 1 < len(partials):
+                heapq.heappush(
+                    heap, (-(partials[i + 1][0] + rprob - log10), src, i + 1, j)
+                )
+            if j + 1 < len(words):
+                heapq.heappush(
+                    heap, (-(lprob + words[j + 1][0] - log10), src, i, j + 1)
+                )
+        if cutoff is None and len(chosen) == count:
+            cutoff = -neg_logprob
+
+    chosen.sort(reverse=True)
+    return chosen[:count]
+
+
 def wordlist_path_from_name(name):
     """
     Get the path to the plain-text form of a wordlist.
@@ -633,53 +1330,405 @@ def combine_wordlists(weighted_lists, out_name):
     It reads several wordlists from their plain-text form, and adds together
     the frequencies of the words they contain, applying a multiplicative
     weight to each.
+
+    The wordlists are merged as streams in order of slug, so the memory this
+    takes doesn't grow with their size (see `_entries_by_slug`). The entries
+    for each slug come in the order of the lists, and then of their lines,
+    which is the order that the frequencies are added up in.
     """
-    freqs = defaultdict(float)
-    texts = {}
     print("Combining %s" % weighted_lists)
-    for name, weight in weighted_lists:
-        for i, slug, freq, text in read_wordlist(name):
-            # Turns out that things that just barely make our cutoff from
-            # Google Books are worse than you'd think
-            if name == "google-books-1grams":
-                freq -= 1000
-                if freq <= 0:
-                    continue
-
-            # Replace an existing text if this spelling of it has a solid
-            # majority of the frequency so far. Avoids weirdness such as
-            # spelling "THE" as "T'HE".
-            if slug not in texts or (freq * weight) > freqs[slug]:
-                texts[slug] = text
-            freqs[slug] += freq * weight
-            if i % 100000 == 0:
-                print("\t%s,%s" % (text, freq * weight))
-
-    alphabetized = sorted(list(texts))
+    streams = [
+        _entries_by_slug(name, weight, list_index)
+        for list_index, (name, weight) in enumerate(weighted_lists)
+    ]
     out_filename = wordlist_path_from_name(out_name)
     with open(out_filename, "w", encoding="utf-8") as out:
         print("Writing %r" % out)
-        for i, slug in enumerate(alphabetized):
-            freq = int(freqs[slug])
+        for i, (text, freq) in enumerate(merge_entries(streams)):
             if freq > 0:
-                line = "%s,%s" % (texts[slug], freq)
+                line = "%s,%s" % (text, freq)
                 print(line, file=out)
             if i % 100000 == 0:
-                print("\t%s,%s" % (texts[slug], freq))
+                print("\t%s,%s" % (text, freq))
 
 
-def build_extras(name):
+def merge_entries(streams):
+    """
+    Merge streams of (slug, list_index, line_number, text, weighted_freq)
+    entries, each in order, into one (text, freq) pair per slug, in order of
+    slug. The frequency is the total of the weighted frequencies, rounded
+    down; it's up to the caller to leave out the ones that come to 0.
+
+    A spelling of a slug replaces the one before it if it has a majority of
+    the frequency so far, which avoids weirdness such as spelling "THE" as
+    "T'HE".
+
+    >>> first = [('cant', 0, 1, "CAN'T", 20.0), ('the', 0, 2, 'THE', 100.0)]
+    >>> second = [('cant', 1, 1, 'CANT', 30.0), ('the', 1, 2, "T'HE", 60.0),
+    ...           ('theory', 1, 3, 'THEORY', 0.5)]
+    >>> list(merge_entries([iter(first), iter(second)]))
+    [('CANT', 50), ('THE', 160), ('THEORY', 0)]
+    """
+    merged = groupby(heapq.merge(*streams), key=itemgetter(0))
+    for slug, entries in merged:
+        text = None
+        total = 0.0
+        for _slug, _list_index, _line, entry_text, freq in entries:
+            if text is None or freq > total:
+                text = entry_text
+            total += freq
+        yield text, int(total)
+
+
+# How many entries of a wordlist to sort in memory at a time, when it isn't
+# in order of slug already, how many to pickle together when writing them to
+# a temporary file, and how many of those files to merge at once
+SORT_CHUNK_SIZE = 200000
+SORT_BATCH_SIZE = 1000
+SORT_MERGE_FAN_IN = 64
+
+
+def _weighted_entries(name, weight, list_index):
+    """
+    Read the entries of a wordlist that we're combining, in the order of its
+    file, as (slug, list_index, line_number, text, weighted_freq) tuples.
+    """
+    for i, slug, freq, text in read_wordlist(name):
+        # Turns out that things that just barely make our cutoff from
+        # Google Books are worse than you'd think
+        if name == "google-books-1grams":
+            freq -= 1000
+            if freq <= 0:
+                continue
+        yield (slug, list_index, i, text, freq * weight)
+
+
+def _is_sorted_by_slug(name):
+    prev_slug = ""
+    for i, slug, freq, text in read_wordlist(name):
+        if slug < prev_slug:
+            return False
+        prev_slug = slug
+    return True
+
+
+def _entries_by_slug(name, weight, list_index):
+    """
+    Iterate the weighted entries of a wordlist in order of slug, and then of
+    line number.
+
+    The wordlist files are sorted by their text, which usually isn't the
+    same order as their slugs, because slugs leave out spaces and
+    punctuation. If a file happens to be in order of slug, we can stream
+    it. Otherwise, we sort it externally, with `external_sort`.
+    """
+    if _is_sorted_by_slug(name):
+        yield from _weighted_entries(name, weight, list_index)
+    else:
+        yield from external_sort(_weighted_entries(name, weight, list_index))
+
+
+def external_sort(entries, chunk_size=SORT_CHUNK_SIZE, fan_in=SORT_MERGE_FAN_IN):
+    """
+    Sort an iterable of entries without holding them all in memory: sort
+    chunks of `chunk_size` entries in memory, write them to temporary files
+    as sorted runs, and merge those. Even a single chunk goes to a file, so
+    that it isn't held in memory while other streams are being merged with
+    this one.
+
+    Runs are merged at most `fan_in` at a time, in passes that write longer
+    runs, until there are few enough to merge into the result. Runs are read
+    back SORT_BATCH_SIZE entries at a time, so however many entries there
+    are, this holds at most `chunk_size` of them in memory while sorting,
+    and `fan_in * SORT_BATCH_SIZE` while merging, with `fan_in` files open.
+
+    >>> entries = [('b', 1), ('d', 2), ('a', 3), ('c', 4), ('a', 0)]
+    >>> list(external_sort(iter(entries), chunk_size=2))
+    [('a', 0), ('a', 3), ('b', 1), ('c', 4), ('d', 2)]
+    >>> entries = [(n * 7 % 10, n) for n in range(10)]
+    >>> [n for _, n in external_sort(iter(entries), chunk_size=1, fan_in=3)]
+    [0, 3, 6, 9, 2, 5, 8, 1, 4, 7]
+    """
+    entries = iter(entries)
+    with tempfile.TemporaryDirectory() as tempdir:
+        written = 0
+        paths = []
+        chunk = sorted(islice(entries, chunk_size))
+        while chunk:
+            paths.append(_write_sorted_run(tempdir, written, iter(chunk)))
+            written += 1
+            chunk = sorted(islice(entries, chunk_size))
+        while len(paths) > fan_in:
+            merged = []
+            for start in range(0, len(paths), fan_in):
+                group = paths[start : start + fan_in]
+                with _open_sorted_runs(group) as runs:
+                    merged.append(_write_sorted_run(tempdir, written, heapq.merge(*runs)))
+                written += 1
+                for old_path in group:
+                    os.remove(old_path)
+            paths = merged
+        with _open_sorted_runs(paths) as runs:
+            yield from heapq.merge(*runs)
+
+
+def _write_sorted_run(tempdir, number, entries):
+    """
+    Write an iterator of sorted entries to a numbered file in `tempdir`,
+    SORT_BATCH_SIZE at a time, and return its path.
+    """
+    path = os.path.join(tempdir, "%d.pickle" % number)
+    with open(path, "wb") as file:
+        batch = list(islice(entries, SORT_BATCH_SIZE))
+        while batch:
+            pickle.dump(batch, file, protocol=pickle.HIGHEST_PROTOCOL)
+            batch = list(islice(entries, SORT_BATCH_SIZE))
+    return path
+
+
+@contextmanager
+def _open_sorted_runs(paths):
+    """
+    Open the temporary files that `_write_sorted_run` wrote, and iterate the
+    entries of each one.
+    """
+    files = [open(path, "rb") for path in paths]
+    try:
+        yield [_read_sorted_run(file) for file in files]
+    finally:
+        for file in files:
+            file.close()
+
+
+def _read_sorted_run(file):
+    """
+    Read back the entries that `_write_sorted_run` wrote to a temporary file.
+    """
+    while True:
+        try:
+            batch = pickle.load(file)
+        except EOFError:
+            return
+        yield from batch
+
+
+# How many slugs each worker process computes the wordplay properties of at
+# a time
+WORDPLAY_CHUNK_SIZE = 100000
+
+
+def _wordplay_rows(slugs):
+    """
+    Get the rows of the wordplay table for a list of slugs. This runs in the
+    worker processes of `_write_wordplay`.
+    """
+    return [(slug, alphagram(slug), anahash(slug), consonantcy(slug)) for slug in slugs]
+
+
+def _imap_read_ahead(pool, func, items, read_ahead):
+    """
+    Like `pool.imap`, but only `read_ahead` items are taken from `items`
+    ahead of the results being used, and they're taken in this thread. That
+    lets `items` read from a database that this thread is writing to.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= read_ahead:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+# The stages of `build_extras` after `build_db`: the name of each one, the
+# Wordlist method that does it, and the stages whose output it reads.
+BUILD_STAGES = [
+    ("lexicon", "write_lexicon", ["db"]),
+    ("key_indexes", "write_key_indexes", ["lexicon"]),
+    ("greppable", "write_greppable_lists", ["db"]),
+    ("letter_columns", "write_letter_columns", ["greppable"]),
+    ("top_tables", "write_top_tables", ["lexicon", "letter_columns"]),
+    ("alphabytes", "write_alphabytes", ["db"]),
+    ("alphagram_index", "write_alphagram_index", ["db"]),
+]
+
+
+# Where the stages of `build_extras` that write one file per length write
+# them, as globs in the wordlists directory
+BUILD_OUTPUT_GLOBS = {
+    "greppable": ["greppable/%s.*"],
+    "letter_columns": ["columns/%s.*.npy", "postings/%s.*.npy"],
+    "top_tables": ["top/%s.*.npy"],
+    "alphabytes": ["alphabytes/%s.*"],
+    "alphagram_index": ["alphagrams/%s.*.npy"],
+}
+
+
+def build_manifest_path(name):
+    return wordlist_path("manifests/%s.json" % name)
+
+
+def build_stage_outputs(name, stage_name):
+    """
+    Get the paths of the files that a stage of `build_extras` writes for
+    the wordlist with the given name.
+    """
+    if stage_name == "db":
+        return [db_path(name + ".wl.db")]
+    elif stage_name == "lexicon":
+        return [lexicon_path(name, part) for part in LEXICON_FILES]
+    elif stage_name == "key_indexes":
+        return [
+            lexicon_path(name, "%s.%s" % (kind, part))
+            for kind in ("alphagram", "anahash")
+            for part in KEY_INDEX_FILES
+        ]
+    paths = []
+    for pattern in BUILD_OUTPUT_GLOBS[stage_name]:
+        paths.extend(glob.glob(wordlist_path(pattern % name)))
+    return sorted(paths)
+
+
+def _stage_record(name, stage_name, digest):
+    """
+    Make the manifest entry for a stage that has just been built from the
+    wordlist file with the given digest: the digest, and the size and
+    modification time of each file it wrote.
+    """
+    outputs = {}
+    for path in build_stage_outputs(name, stage_name):
+        stat = os.stat(path)
+        outputs[os.path.relpath(path, data_path(""))] = [stat.st_size, stat.st_mtime_ns]
+    return {"source": digest, "outputs": outputs}
+
+
+def _stage_is_current(entry, digest):
+    """
+    Check a stage's manifest entry: was it built from the wordlist file with
+    the given digest, and are the files it wrote still there, unchanged?
+    """
+    if not isinstance(entry, dict) or entry.get("source") != digest:
+        return False
+    if not entry.get("outputs"):
+        return False
+    for path, (size, mtime_ns) in entry["outputs"].items():
+        try:
+            stat = os.stat(data_path(path))
+        except OSError:
+            return False
+        if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+            return False
+    return True
+
+
+def file_digest(path):
+    """
+    Get the SHA-256 hash of a file's contents, as a hex string.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _run_build_stage(name, method):
+    """
+    Run one stage of `build_extras`, returning how many seconds it took.
+    This runs in a worker process, with its own database connection.
+    """
+    start = time.perf_counter()
+    getattr(Wordlist(name, use_lexicon=False), method)()
+    return time.perf_counter() - start
+
+
+def build_extras(name, processes=None, force=False):
     """
     Load a wordlist with a particular name, and create additional files that
-    enable more operations on the wordlist -- a file that can be mmapped and
-    grepped quickly, a file of 'alphabytes' that can be mmapped and grepped to
-    find anagrams, and a database of 'wordplay' properties of words.
-    """
-    dbw = Wordlist(name)
-    dbw.build_db()
-    dbw.write_greppable_lists()
-    dbw.write_alphabytes()
-    dbw.build_wordplay()
+    enable more operations on the wordlist -- a compiled lexicon for fast
+    lookups, with indexes of its words by alphagram and anahash, files that
+    can be mmapped and grepped quickly, a file of 'alphabytes' and an index
+    of alphagrams that find anagrams, and a database of 'wordplay'
+    properties of words.
+
+    After the database is built, the stages that don't depend on each other
+    run at the same time, in up to `processes` worker processes (by
+    default, one per CPU).
+
+    The build can be resumed: the hash of the flat wordlist file that each
+    stage was built from is recorded in `data/wordlists/manifests/`, along
+    with the size and modification time of each file the stage wrote. A
+    stage is skipped if it was built from the same file, its files are all
+    still there and unchanged, and nothing it reads has been rebuilt since.
+    Use `force=True` to rebuild everything.
+    """
+    build_start = time.perf_counter()
+    digest = file_digest(wordlist_path_from_name(name))
+    manifest_path = build_manifest_path(name)
+    manifest = {}
+    if not force and os.access(manifest_path, os.F_OK):
+        with open(manifest_path, encoding="utf-8") as file:
+            manifest = json.load(file)
+
+    def save_manifest():
+        os.makedirs(wordlist_path("manifests"), exist_ok=True)
+        with open(manifest_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=2, sort_keys=True)
+
+    timings = {}
+    rebuilt = set()
+    if _stage_is_current(manifest.get("db"), digest):
+        print("db: unchanged, skipping")
+    else:
+        print("db: building")
+        start = time.perf_counter()
+        Wordlist(name, use_lexicon=False).build_db(processes)
+        timings["db"] = time.perf_counter() - start
+        rebuilt.add("db")
+        manifest["db"] = _stage_record(name, "db", digest)
+        save_manifest()
+        print("db: done in %.1f s" % timings["db"])
+
+    done = {"db"}
+    pending = list(BUILD_STAGES)
+    running = {}
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        while pending or running:
+            for stage in list(pending):
+                stage_name, method, deps = stage
+                if not all(dep in done for dep in deps):
+                    continue
+                pending.remove(stage)
+                if (
+                    _stage_is_current(manifest.get(stage_name), digest)
+                    and not rebuilt & set(deps)
+                ):
+                    print("%s: unchanged, skipping" % stage_name)
+                    done.add(stage_name)
+                else:
+                    print("%s: building" % stage_name)
+                    future = executor.submit(_run_build_stage, name, method)
+                    running[future] = stage_name
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage_name = running.pop(future)
+                timings[stage_name] = future.result()
+                done.add(stage_name)
+                rebuilt.add(stage_name)
+                manifest[stage_name] = _stage_record(name, stage_name, digest)
+                save_manifest()
+                print("%s: done in %.1f s" % (stage_name, timings[stage_name]))
+
+    print("Build of %r:" % name)
+    for stage_name in ["db"] + [stage[0] for stage in BUILD_STAGES]:
+        if stage_name in timings:
+            print("  %-16s %8.1f s" % (stage_name, timings[stage_name]))
+        else:
+            print("  %-16s  skipped" % stage_name)
+    print("  %-16s %8.1f s" % ("total", time.perf_counter() - build_start))
 
 
 WORDS = Wordlist("combined")